@@ -0,0 +1,193 @@
+"""Compare the Flask webhook with the asyncio one on many slow /leli lookups.
+
+Wikipedia and Telegram are replaced by a local stub which answers after
+``--latency`` seconds. The Flask app handles the updates inline on
+``--workers`` threads, like as many sync gunicorn workers; the asyncio app
+handles all of them in one thread.
+
+Run with ``python -m benchmarks.bench_aio``; needs requirements-aio.txt.
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+from tululbot import app, bot, webhook_url_path
+from tululbot.aio import AsyncHTTPClient, create_app
+from tululbot.utils import http
+
+
+UPSTREAM_URLS = ('https://api.telegram.org', 'https://en.wikipedia.org')
+WIKIPEDIA_PAGE = ('<html><body><div id="mw-content-text"><div class="mw-parser-output">'
+                  '<p><b>Tulul</b> is a word used by people who are tulul.</p>'
+                  '</div></div></body></html>')
+
+
+class StubUpstream:
+    """Serve Wikipedia and Telegram from a thread, answering after `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.sent = 0
+        self.base_url = None
+        self._started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='StubUpstream')
+        thread.daemon = True
+        thread.start()
+        self._started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        stub_app = web.Application()
+        stub_app.router.add_get('/w/index.php', self.search)
+        stub_app.router.add_post('/{bot}/{method_name}', self.telegram)
+        runner = web.AppRunner(stub_app, access_log=None)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        self._loop.run_until_complete(site.start())
+        host, port = runner.addresses[0][:2]
+        self.base_url = 'http://{}:{}'.format(host, port)
+        self._started.set()
+        self._loop.run_forever()
+
+    async def search(self, request):
+        await asyncio.sleep(self.latency)
+        return web.Response(text=WIKIPEDIA_PAGE, content_type='text/html')
+
+    async def telegram(self, request):
+        await asyncio.sleep(self.latency)
+        if request.match_info['method_name'] == 'getMe':
+            result = {'id': 1, 'first_name': 'TululBot'}
+        else:
+            self.sent += 1
+            result = {'message_id': 1, 'date': 1445207090,
+                      'chat': {'id': 123, 'type': 'group'}}
+        return web.json_response({'ok': True, 'result': result})
+
+    def rewrite(self, url):
+        for upstream_url in UPSTREAM_URLS:
+            if url.startswith(upstream_url):
+                return self.base_url + url[len(upstream_url):]
+        return url
+
+    def wait_sent(self, count):
+        while self.sent < count:
+            time.sleep(0.005)
+
+
+class StubbedHTTPClient(http.HTTPClient):
+
+    def __init__(self, stub, **kwargs):
+        super(StubbedHTTPClient, self).__init__(**kwargs)
+        self.stub = stub
+
+    def request(self, method, url, **kwargs):
+        return super(StubbedHTTPClient, self).request(method, self.stub.rewrite(url), **kwargs)
+
+
+class StubbedAsyncHTTPClient(AsyncHTTPClient):
+
+    def __init__(self, stub, **kwargs):
+        super(StubbedAsyncHTTPClient, self).__init__(**kwargs)
+        self.stub = stub
+
+    async def request(self, method, url, **kwargs):
+        return await super(StubbedAsyncHTTPClient, self).request(
+            method, self.stub.rewrite(url), **kwargs)
+
+
+def make_update(update_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 1445207090,
+            'chat': {'id': 123, 'type': 'group'},
+            'text': '/leli tulul {}'.format(update_id)
+        }
+    }
+
+
+def bench_flask(stub, updates, workers):
+    http.client = StubbedHTTPClient(stub, pool_maxsize=workers)
+    bot.threaded = False
+    app.config['DISPATCH_MODE'] = 'inline'
+    test_client = app.test_client()
+
+    def post(update):
+        return test_client.post(webhook_url_path, data=json.dumps(update),
+                                content_type='application/json').status_code
+
+    sent = stub.sent
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        statuses = list(executor.map(post, updates))
+    stub.wait_sent(sent + len(updates))
+    assert statuses == [200] * len(updates), statuses
+    return time.perf_counter() - start
+
+
+def bench_aio(stub, updates):
+    async def run():
+        web_app = create_app(client=StubbedAsyncHTTPClient(stub), max_tasks=len(updates))
+        runner = web.AppRunner(web_app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        url = 'http://{}:{}{}'.format(host, port, webhook_url_path)
+
+        loop = asyncio.get_event_loop()
+        sent = stub.sent
+        start = time.perf_counter()
+        async with aiohttp.ClientSession() as session:
+            responses = await asyncio.gather(*[session.post(url, json=update)
+                                               for update in updates])
+        assert [response.status for response in responses] == [200] * len(updates)
+        await loop.run_in_executor(None, stub.wait_sent, sent + len(updates))
+        elapsed = time.perf_counter() - start
+        await runner.cleanup()
+        return elapsed
+
+    return asyncio.new_event_loop().run_until_complete(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--updates', type=int, default=200, help='Number of /leli updates')
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='Seconds the stub upstream takes to answer')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of threads of the Flask app')
+    args = parser.parse_args()
+
+    app.logger.setLevel('INFO')
+    stub = StubUpstream(args.latency)
+    stub.start()
+    bot.user = None
+
+    # Different update ids for each app, the ones seen by the first would be skipped
+    flask_updates = [make_update(i) for i in range(args.updates)]
+    aio_updates = [make_update(i) for i in range(args.updates, 2 * args.updates)]
+    results = [
+        ('flask ({} workers)'.format(args.workers),
+         bench_flask(stub, flask_updates, args.workers)),
+        ('aio', bench_aio(stub, aio_updates)),
+    ]
+
+    print('{} updates, {}s per upstream request'.format(args.updates, args.latency))
+    print('{:>20} {:>10} {:>12}'.format('app', 'wall (s)', 'updates/s'))
+    for name, elapsed in results:
+        print('{:>20} {:>10.2f} {:>12.1f}'.format(name, elapsed, args.updates / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Measure lookups in a SortedIndex of generated Wikipedia-like abstracts.
+
+Run with ``python -m benchmarks.bench_index``.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from tululbot.utils.index import SortedIndex, write_index
+
+
+def make_items(size):
+    for i in range(size):
+        yield ('title {}'.format(i),
+               'Title {} is the subject of an article of about a paragraph, '
+               'which is what /leli answers with.'.format(i) * 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1000000, help='Number of titles')
+    parser.add_argument('--lookups', type=int, default=100000, help='Number of lookups')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'leli.idx')
+    start = time.perf_counter()
+    write_index(path, make_items(args.size))
+    print('Built index of {} titles in {:.1f}s, {:.0f} MB'.format(
+        args.size, time.perf_counter() - start, os.path.getsize(path) / 1e6))
+
+    start = time.perf_counter()
+    index = SortedIndex(path)
+    opened = time.perf_counter() - start
+
+    rng = random.Random(0)
+    keys = ['title {}'.format(rng.randrange(args.size * 2)) for _ in range(args.lookups)]
+    start = time.perf_counter()
+    hits = sum(1 for key in keys if index.get(key) is not None)
+    elapsed = time.perf_counter() - start
+    print('Opened in {:.3f} ms; {:.2f} us per lookup ({:.0%} hits)'.format(
+        opened * 1000, elapsed / args.lookups * 1e6, hits / args.lookups))
+
+    index.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Compare parsing kamusslang pages with BeautifulSoup and with KamusslangParser.
+
+The BeautifulSoup way is how `parse_kamusslang` used to parse a page: into a
+whole tree, then two scans over it. BeautifulSoup with lxml is measured too
+when lxml is installed. Pages are read from the ``.html`` files in
+``--pages``, e.g. saved with ``curl``; without it, a page with a definition and
+a page suggesting words alike, shaped like kamusslang's, are generated.
+
+Run with ``python -m benchmarks.bench_kamusslang``.
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from tululbot.utils.slang import parse_kamusslang
+
+try:
+    import lxml  # noqa: F401
+except ImportError:
+    SOUP_FEATURES = ['html.parser']
+else:
+    SOUP_FEATURES = ['html.parser', 'lxml']
+
+
+def make_page(suggestion=False, comments=200):
+    head = ''.join('<script>var ads{0} = {{"slot": {0}}};</script>'
+                   '<link rel="stylesheet" href="/css/app{0}.css">'.format(i)
+                   for i in range(100))
+    nav = ''.join('<li><a href="/huruf/{0}">{0}</a></li>'.format(chr(c))
+                  for c in range(ord('A'), ord('Z') + 1))
+    if suggestion:
+        term = ('<p class="close-word-suggestion-text">Mungkin maksud kamu:</p><ul>{}</ul>'
+                .format(''.join('<li><a href="/arti/gabut{0}">gabut{0}</a></li>'.format(i)
+                                for i in range(10))))
+    else:
+        term = ('<h1 class="term-title">gabut</h1><div class="term-def">'
+                '<p>Gaji buta, kerja tapi tidak <b>ngapa-ngapain</b>.</p>'
+                '<p>Sekarang juga dipakai buat bilang lagi <i>bosan</i>.</p></div>')
+    related = ''.join('<li><a href="/arti/kata{0}">kata{0}</a></li>'.format(i)
+                      for i in range(100))
+    comments = ''.join('<div class="comment"><span class="author">user{0}</span>'
+                       '<p>Komentar {0} tentang gabut, wkwk.</p></div>'.format(i)
+                       for i in range(comments))
+    return ('<!DOCTYPE html><html><head>{}</head><body><div class="header"><ul>{}</ul></div>'
+            '<div class="content"><div class="term">{}</div><ul class="related">{}</ul>'
+            '<div class="comments">{}</div></div><div class="footer">Kamus Slang</div>'
+            '</body></html>').format(head, nav, term, related, comments)
+
+
+def soup_parse_kamusslang(page, features):
+    """Parse like `tululbot.utils.slang.parse_kamusslang` did with BeautifulSoup."""
+    doc = BeautifulSoup(page, features)
+    paragraph = doc.find(class_='term-def')
+    if doc.find(class_='close-word-suggestion-text') is not None:
+        return None
+    return ''.join(paragraph.strings) if paragraph is not None else None
+
+
+def measure(parse, page, number):
+    start = time.process_time()
+    for _ in range(number):
+        result = parse(page)
+    cpu_time = (time.process_time() - start) / number
+
+    tracemalloc.start()
+    parse(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, cpu_time, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', help='Directory of saved kamusslang pages')
+    parser.add_argument('--number', type=int, default=20, help='Number of parses per page')
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages.append((os.path.basename(path), f.read()))
+    else:
+        pages = [('definition', make_page()), ('suggestion', make_page(suggestion=True))]
+
+    print('{:>20} {:>9} {:>22} {:>12} {:>12}'.format(
+        'page', 'size (KB)', 'parser', 'CPU (ms)', 'peak (KB)'))
+    for name, page in pages:
+        parsers = [('soup ({})'.format(features),
+                    lambda page, features=features: soup_parse_kamusslang(page, features))
+                   for features in SOUP_FEATURES]
+        parsers.append(('KamusslangParser', parse_kamusslang))
+        expected = None
+        for parser_name, parse in parsers:
+            result, cpu_time, peak = measure(parse, page, args.number)
+            if parser_name == 'soup (html.parser)':
+                expected = result
+            assert result == expected, (parser_name, result, expected)
+            print('{:>20} {:>9.0f} {:>22} {:>12.2f} {:>12.0f}'.format(
+                name[:20], len(page) / 1024, parser_name, cpu_time * 1000, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Compare parsing Wikipedia pages with BeautifulSoup and with ContentParser.
+
+The BeautifulSoup way is how `search_on_wikipedia` used to parse a page:
+once to check for a result, once for the first paragraph and, for
+disambiguations, once more for the first link. Pages are read from the
+``.html`` files in ``--pages``, e.g. saved with ``curl``; without it, a long
+article and a disambiguation page shaped like Wikipedia's are generated.
+
+Run with ``python -m benchmarks.bench_leli``.
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from tululbot.utils.leli import parse_search_page
+
+
+def make_article(paragraphs=300, references=500):
+    head = ''.join('<script>var config{0} = {{"wgPageName": "Tulul", "n": {0}}};</script>'
+                   '<link rel="stylesheet" href="/w/load.php?modules=site.styles{0}">'
+                   .format(i) for i in range(200))
+    infobox = ''.join('<tr><th>Field {0}</th><td><a href="/wiki/Value_{0}">Value {0}</a></td>'
+                      '</tr>'.format(i) for i in range(60))
+    body = ''.join('<h2><span id="Section_{0}">Section {0}</span></h2>'
+                   '<p>Paragraph {0} about <a href="/wiki/Tulul">tulul</a> and '
+                   '<a href="/wiki/Cool">coolness</a>, with a citation.<sup class="reference">'
+                   '<a href="#cite_note-{0}">[{0}]</a></sup></p>'.format(i)
+                   for i in range(paragraphs))
+    cites = ''.join('<li id="cite_note-{0}"><cite>Author {0}. "Title {0}". '
+                    '<i>Journal</i>.</cite></li>'.format(i) for i in range(references))
+    navbox = ''.join('<td><a href="/wiki/Related_{0}">Related {0}</a></td>'.format(i)
+                     for i in range(300))
+    return ('<!DOCTYPE html><html><head>{}</head><body>'
+            '<div id="mw-navigation"><a href="/wiki/Main_Page">Main page</a></div>'
+            '<div id="content"><div id="bodyContent">'
+            '<div id="mw-content-text"><div class="mw-parser-output">'
+            '<div class="hatnote">For other uses, see '
+            '<a href="/wiki/Tulul_(disambiguation)">Tulul (disambiguation)</a>.</div>'
+            '<table class="infobox">{}</table>'
+            '<p><b>Tulul</b> is the synonym of <a href="/wiki/Cool">cool</a>.</p>'
+            '{}<ol class="references">{}</ol><table class="navbox"><tr>{}</tr></table>'
+            '</div></div></div></div>'
+            '<div id="footer">Text is available under CC BY-SA.</div>'
+            '</body></html>').format(head, infobox, body, cites, navbox)
+
+
+def make_disambiguation(meanings=200):
+    items = ''.join('<li><a href="/wiki/Tulul_{0}">Tulul {0}</a>, meaning {0}</li>'.format(i)
+                    for i in range(meanings))
+    return ('<!DOCTYPE html><html><head><title>Tulul</title></head><body>'
+            '<div id="mw-content-text"><div class="mw-parser-output">'
+            '<p><b>Tulul</b> may refer to:</p><ul>{}</ul>'
+            '</div></div></body></html>').format(items)
+
+
+def soup_content_text(page):
+    return BeautifulSoup(page, 'html.parser').find('div', id='mw-content-text')
+
+
+def soup_parse_search_page(page):
+    """Parse like `tululbot.utils.leli.parse_search_page` did with BeautifulSoup."""
+    if 'Search results' in page or soup_content_text(page).find('p') is None:
+        return None, None
+
+    first_paragraph = soup_content_text(page).find('p').get_text()
+    if 'may refer to:' not in first_paragraph:
+        return first_paragraph, None
+
+    def valid_link(tag):
+        return tag.name == 'a' and tag.get('href', '').startswith('/wiki')
+
+    path = soup_content_text(page).find(valid_link)['href']
+    return None, 'https://en.wikipedia.org{}'.format(path)
+
+
+def measure(parse, page, number):
+    start = time.process_time()
+    for _ in range(number):
+        result = parse(page)
+    cpu_time = (time.process_time() - start) / number
+
+    tracemalloc.start()
+    parse(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, cpu_time, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', help='Directory of saved Wikipedia pages')
+    parser.add_argument('--number', type=int, default=5, help='Number of parses per page')
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages.append((os.path.basename(path), f.read()))
+    else:
+        pages = [('article', make_article()), ('disambiguation', make_disambiguation())]
+
+    print('{:>20} {:>9} {:>16} {:>12} {:>16} {:>14}'.format(
+        'page', 'size (KB)', 'soup CPU (ms)', 'CPU (ms)', 'soup peak (KB)', 'peak (KB)'))
+    for name, page in pages:
+        soup_result, soup_time, soup_peak = measure(soup_parse_search_page, page, args.number)
+        result, cpu_time, peak = measure(parse_search_page, page, args.number)
+        assert result == soup_result, (result, soup_result)
+        print('{:>20} {:>9.0f} {:>16.2f} {:>12.2f} {:>16.0f} {:>14.0f}'.format(
+            name[:20], len(page) / 1024, soup_time * 1000, cpu_time * 1000,
+            soup_peak / 1024, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Measure exact lookups and suggestions in a lexicon of generated slang-like words.
+
+Words are made of Indonesian-like syllables, and suggestions are looked up
+for words with one typo, like /slang does for the words it cannot find.
+
+Run with ``python -m benchmarks.bench_lexicon``.
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from tululbot.utils.index import SortedIndex, write_index
+
+
+SYLLABLES = [consonant + vowel for consonant in 'bcdghjklmnprstwy' for vowel in 'aeiou']
+
+
+def make_words(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def make_typo(word, rng):
+    i = rng.randrange(len(word))
+    kind = rng.randrange(3)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+    return word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=50000, help='Number of words')
+    parser.add_argument('--lookups', type=int, default=1000, help='Number of lookups')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = make_words(args.size, rng)
+    path = os.path.join(tempfile.mkdtemp(), 'slang.idx')
+    write_index(path, ((word, 'Definisi {}'.format(word)) for word in words))
+    lexicon = SortedIndex(path)
+
+    sample = [rng.choice(words) for _ in range(args.lookups)]
+    start = time.perf_counter()
+    for word in sample:
+        lexicon.get(word)
+    elapsed = time.perf_counter() - start
+    print('{} words, {:.0f} KB; {:.2f} us per exact lookup'.format(
+        len(lexicon), os.path.getsize(path) / 1024, elapsed / args.lookups * 1e6))
+
+    typos = [make_typo(word, rng) for word in sample]
+    for distance in (1, 2):
+        start = time.perf_counter()
+        found = sum(len(lexicon.similar(typo, distance)) for typo in typos)
+        elapsed = time.perf_counter() - start
+        print('{:.2f} ms per suggestion lookup within {} edits ({:.1f} words found)'.format(
+            elapsed / args.lookups * 1000, distance, found / args.lookups))
+
+    lexicon.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Compare decoding every update with skipping the ones no handler can match.
+
+The corpus is read from ``--corpus``, a file with one update as JSON per
+line, e.g. recorded from the webhook of a group. Without it, a corpus that
+looks like a busy group chat is generated: mostly chatter, some photos and
+replies between members, and a few commands and replies to the prompts of
+the bot.
+
+Run with ``python -m benchmarks.bench_prefilter``.
+"""
+import argparse
+import json
+import random
+import timeit
+import tracemalloc
+
+from telebot import types
+
+from tululbot import bot
+
+
+BOT_USER = {'id': 1, 'first_name': 'TululBot', 'username': 'TululBot'}
+CHAT = {'id': -1001234567890, 'type': 'supergroup', 'title': 'Tulul'}
+WORDS = ['wkwk', 'anjir', 'kapan', 'kopdar', 'lagi', 'tulul', 'bro', 'makan', 'dimana',
+         'gue', 'lu', 'besok', 'jam', 'berapa', 'mantap', 'gan', 'skripsi', 'deadline']
+
+
+def make_corpus(size, seed=0):
+    rng = random.Random(seed)
+    users = [{'id': 1000 + i, 'first_name': 'User{}'.format(i),
+              'username': 'user{}'.format(i)} for i in range(50)]
+
+    def message(message_id, **fields):
+        result = {'message_id': message_id, 'date': 1445207090 + message_id,
+                  'chat': CHAT, 'from': rng.choice(users)}
+        result.update(fields)
+        return result
+
+    def chatter():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 15)))
+
+    corpus = []
+    for update_id in range(size):
+        kind = rng.random()
+        if kind < 0.75:
+            fields = {'text': chatter()}
+        elif kind < 0.85:
+            replied_message = message(update_id - 1, text=chatter())
+            fields = {'text': chatter(), 'reply_to_message': replied_message}
+        elif kind < 0.92:
+            fields = {'photo': [{'file_id': 'photo{}'.format(update_id), 'width': 90,
+                                 'height': 90, 'file_size': 1234}], 'caption': chatter()}
+        elif kind < 0.97:
+            fields = {'text': rng.choice(['/leli tulul', '/quote', '/kbbi makan',
+                                          '/slang anjir', '/start@OtherBot', '/who@TululBot'])}
+        else:
+            reply = message(update_id - 1, text=rng.choice(['Apa yang mau dileli?',
+                                                            'Cari apa lu?']))
+            reply['from'] = BOT_USER
+            fields = {'text': chatter(), 'reply_to_message': reply}
+        corpus.append({'update_id': update_id, 'message': message(update_id, **fields)})
+    return corpus
+
+
+def decode_all(corpus):
+    return [types.Update.de_json(update) for update in corpus]
+
+
+def decode_accepted(corpus):
+    updates = []
+    for update in corpus:
+        message_json = update.get('message')
+        if message_json is not None and bot.accepts_message_json(message_json):
+            updates.append(types.Update.de_json(update))
+    return updates
+
+
+def measure_allocations(function, corpus):
+    """Return the bytes allocated for the decoded updates of the whole corpus."""
+    tracemalloc.start()
+    updates = function(corpus)  # noqa: F841
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', help='File with one update as JSON per line')
+    parser.add_argument('--size', type=int, default=10000,
+                        help='Number of updates of the generated corpus')
+    parser.add_argument('--number', type=int, default=5, help='Number of passes')
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus) as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+    else:
+        corpus = make_corpus(args.size)
+    bot.user_id = BOT_USER['id']
+
+    accepted = sum(1 for update in corpus if 'message' in update and
+                   bot.accepts_message_json(update['message']))
+    print('{} updates, {} ({:.1%}) may match a handler'.format(
+        len(corpus), accepted, accepted / len(corpus)))
+    print('{:>16} {:>12} {:>16}'.format('path', 'us/update', 'alloc (KiB)'))
+    for name, function in (('de_json all', decode_all), ('prefilter', decode_accepted)):
+        elapsed = min(timeit.repeat(lambda: function(corpus), number=args.number, repeat=3))
+        allocated = measure_allocations(function, corpus)
+        print('{:>16} {:>12.2f} {:>16.1f}'.format(
+            name, elapsed / args.number / len(corpus) * 1e6, allocated / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Compare the ways /quote can load and pick quotes.
+
+Loading is measured by parsing the YAML of tulul-quotes with the pure Python
+and the C (libyaml) safe loaders, and by reading a snapshot saved by
+`QuoteEngine.save_snapshot`. Picking is measured the way `retrieve_random`
+used to, `random.choice` then formatting, and with a `ShuffleBag` of
+formatted quotes. Searching is measured with `QuoteIndex` and with a scan of
+every quote. The YAML is read from ``--quotes``, e.g. saved with
+``curl``; without it, quotes shaped like tulul-quotes' are generated.
+
+Run with ``python -m benchmarks.bench_quote``.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import yaml
+
+from tululbot.utils.quote import SEARCHED_FIELDS, QuoteEngine, ShuffleBag, tokenize
+
+
+def make_quotes(count=1000):
+    return 'quotes:\n' + ''.join(
+        '  - quote: Kutipan ke-{0} yang tulul, tapi ada benarnya juga kalau dipikir-pikir\n'
+        '    author: Orang {1}\n'
+        '    author_bio: Anak tulul angkatan {2}\n'.format(i, i % 100, 2000 + i % 20)
+        for i in range(count))
+
+
+def scan_search(quotes, format_quote, query):
+    """Search like `QuoteIndex.search` without an index."""
+    fields = SEARCHED_FIELDS
+    if query.startswith('@'):
+        fields = ('author',)
+        query = query[1:]
+    words = set(tokenize(query))
+    return [format_quote(q) for q in quotes
+            if words and words <= set(tokenize(' '.join(str(q[f]) for f in fields)))]
+
+
+def measure(function, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return (time.perf_counter() - start) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--quotes', help='YAML file of tulul-quotes')
+    parser.add_argument('--number', type=int, default=20, help='Number of loads')
+    parser.add_argument('--picks', type=int, default=100000, help='Number of picks')
+    args = parser.parse_args()
+
+    if args.quotes:
+        with open(args.quotes, encoding='utf-8') as f:
+            body = f.read()
+    else:
+        body = make_quotes()
+
+    with tempfile.TemporaryDirectory() as directory:
+        quote_engine = QuoteEngine(snapshot_path=os.path.join(directory, 'quotes.json'))
+        quote_engine.load(body)
+        quote_engine.save_snapshot()
+        quotes = yaml.load(body, Loader=yaml.CSafeLoader)['quotes']
+        print('{} quotes, {:.0f} KB of YAML'.format(len(quotes), len(body) / 1024))
+
+        print('{:>24} {:>12}'.format('load', 'time (ms)'))
+        for name, load in (('SafeLoader', lambda: yaml.load(body, Loader=yaml.SafeLoader)),
+                           ('CSafeLoader', lambda: yaml.load(body, Loader=yaml.CSafeLoader)),
+                           ('snapshot', quote_engine.load_snapshot)):
+            print('{:>24} {:>12.2f}'.format(name, measure(load, args.number) * 1000))
+
+        bag = ShuffleBag(quote_engine.cache)
+        print('{:>24} {:>12}'.format('pick', 'time (us)'))
+        for name, pick in (('choice then format',
+                            lambda: quote_engine.format_quote(random.choice(quotes))),
+                           ('ShuffleBag', bag.pick)):
+            print('{:>24} {:>12.2f}'.format(name, measure(pick, args.picks) * 1e6))
+
+        print('{:>24} {:>12} {:>12}'.format('search', 'index (us)', 'scan (us)'))
+        for query in ('ke-42', 'tulul angkatan 2005', '@orang 7', 'kerja'):
+            expected = scan_search(quotes, quote_engine.format_quote, query)
+            assert quote_engine.index.search(query) == expected, query
+            index_time = measure(lambda: quote_engine.index.search(query), args.number)
+            scan_time = measure(
+                lambda: scan_search(quotes, quote_engine.format_quote, query), args.number)
+            print('{:>24} {:>12.1f} {:>12.1f}'.format(
+                query, index_time * 1e6, scan_time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
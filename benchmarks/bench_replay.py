@@ -0,0 +1,470 @@
+"""Replay updates through the Flask webhook with stub upstreams, and report latencies.
+
+Every upstream, and Telegram, is replaced by a local fixture server answering
+after ``--latency`` seconds, or the latency given to it by
+``--upstream-latency NAME=SECONDS``. Updates are read from ``--corpus``, a
+file of one update JSON per line, e.g. recorded from the webhook; without it,
+a mix of commands and chatter with a skewed choice of terms, so that some of
+them hit the caches, is generated. Update ids are renumbered, so a corpus can
+be replayed any number of times.
+
+Updates are posted to `tululbot.main` from ``--concurrency`` threads and
+handled inline, so the latency of an update includes its upstream lookups and
+reply. The requests per second and the p50, p95 and p99 latencies of each
+command are printed and saved to ``--output``, a JSON file named after the
+current commit by default, to be compared with another one with ``--compare``.
+
+Run with ``manage.py bench``, which forwards its arguments here.
+"""
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import random
+from socketserver import ThreadingMixIn
+import subprocess
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+from requests.adapters import HTTPAdapter
+
+from tululbot import app, bot, commands, recent_update_ids, webhook_url_path
+from tululbot.utils import http, kbbi, leli, slang
+from tululbot.utils.router import extract_command_name
+
+
+RESULTS_DIR = 'bench-results'
+PERCENTILES = (50, 95, 99)
+TERMS = ('tulul', 'gabut', 'baper', 'kepo', 'mager', 'gercep', 'santuy', 'julid',
+         'bucin', 'receh', 'makan', 'makanan', 'dimakan', 'menulis', 'berjalan')
+NAMES = ('budi', 'ani', 'iqbal', 'sari', 'tono')
+CHATTER = ('wkwk', 'gabut banget gue', 'ada yang mau makan siang?', 'mantap jiwa',
+           'tulul lu')
+# Text of the generated updates, as formats of a term, and their share of the corpus
+COMMAND_MIX = (
+    ('/leli {}', 0.25),
+    ('/slang {}', 0.2),
+    ('/kbbi {}', 0.2),
+    ('/quote', 0.1),
+    ('/quote {}', 0.05),
+    ('/who', 0.05),
+    ('/hbd @{name}', 0.05),
+    ('{chatter}', 0.1),
+)
+QUOTES_YAML = 'quotes:\n' + ''.join(
+    '  - quote: Kutipan {0} yang {1}\n'
+    '    author: {2}\n'
+    '    author_bio: Anak tulul angkatan {3}\n'.format(i, TERMS[i % len(TERMS)],
+                                                       NAMES[i % len(NAMES)].title(),
+                                                       2000 + i % 20)
+    for i in range(500))
+
+
+def wikipedia(request, query):
+    term = query.get('search', [''])[0]
+    return 200, 'text/html', (
+        '<html><body><div id="mw-content-text"><div class="mw-parser-output">'
+        '<p><b>{0}</b> is a word used by people who are {0}.</p>'
+        '</div></div></body></html>'.format(term))
+
+
+def kamusslang(request, query):
+    term = request.path.rsplit('/', 1)[-1]
+    return 200, 'text/html', (
+        '<html><body><div class="term"><h1 class="term-title">{0}</h1>'
+        '<div class="term-def"><p>Arti {0} dalam bahasa gaul.</p></div></div>'
+        '</body></html>'.format(term))
+
+
+def urbandictionary(request, query):
+    term = query.get('term', [''])[0]
+    return 200, 'application/json', json.dumps({'list': [
+        {'word': term, 'definition': 'Definition {} of [{}].'.format(i, term),
+         'thumbs_up': 10 - i} for i in range(10)]})
+
+
+def kateglo(request, query):
+    phrase = query.get('phrase', [''])[0]
+    # Like kateglo.com, terms without definitions are not answered with JSON
+    if phrase not in TERMS or phrase.startswith(('di', 'me', 'ber')) or phrase.endswith('an'):
+        return 200, 'text/html', ''
+    return 200, 'application/json', json.dumps({'kateglo': {'definition': [
+        {'lex_class_ref': 'v', 'def_text': 'arti {} ke-{}'.format(phrase, i), 'sample': None}
+        for i in range(1, 4)]}})
+
+
+def quotes(request, query):
+    return 200, 'text/plain', QUOTES_YAML
+
+
+def telegram(request, query):
+    method_name = request.path.rsplit('/', 1)[-1]
+    if method_name == 'getMe':
+        result = {'id': 1, 'first_name': 'TululBot', 'username': 'TululBot'}
+    else:
+        result = {'message_id': 1, 'date': 1445207090, 'chat': {'id': 123, 'type': 'group'}}
+    return 200, 'application/json', json.dumps({'ok': True, 'result': result})
+
+
+# Fixture of each upstream by host, named like in `tululbot.utils.http.UPSTREAM_NAMES`
+FIXTURES = {
+    'en.wikipedia.org': wikipedia,
+    'kamusslang.com': kamusslang,
+    'api.urbandictionary.com': urbandictionary,
+    'kateglo.com': kateglo,
+    'raw.githubusercontent.com': quotes,
+    'api.telegram.org': telegram,
+}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FixtureServer:
+    """Serve `fixture` from a thread, answering after `latency` seconds."""
+
+    def __init__(self, fixture, latency):
+        self.fixture = fixture
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        host, port = self._server.server_address[:2]
+        self.netloc = '{}:{}'.format(host, port)
+
+    def start(self):
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  name='FixtureServer', daemon=True)
+        thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written apart, do not wait for an ACK in between
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self.respond()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self.respond()
+
+            def respond(self):
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                status, content_type, body = server.fixture(
+                    self, parse_qs(urlsplit(self.path).query))
+                body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class FixtureAdapter(HTTPAdapter):
+    """Send the requests to an upstream host to its fixture server instead."""
+
+    def __init__(self, servers, **kwargs):
+        super(FixtureAdapter, self).__init__(**kwargs)
+        self.servers = servers
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        server = self.servers.get(parts.netloc)
+        if server is None:
+            raise ValueError('No fixture server for {}'.format(request.url))
+        request.url = urlunsplit(('http', server.netloc) + tuple(parts[2:]))
+        return super(FixtureAdapter, self).send(request, **kwargs)
+
+
+class FixtureHTTPClient(http.HTTPClient):
+    """HTTP client of the app sending every request to the fixture servers.
+
+    URLs are rewritten by the transport adapter, so upstreams keep their names
+    in the metrics of the app.
+    """
+
+    def __init__(self, servers, **kwargs):
+        super(FixtureHTTPClient, self).__init__(**kwargs)
+        self.servers = servers
+
+    def _create_session(self):
+        session = super(FixtureHTTPClient, self)._create_session()
+        adapter = FixtureAdapter(self.servers, pool_connections=self.pool_connections,
+                                 pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+
+def start_servers(latency, upstream_latencies):
+    """Start a fixture server for each upstream host, and return them by host."""
+    names = http.UPSTREAM_NAMES
+    unknown = set(upstream_latencies) - set(names.values())
+    if unknown:
+        raise ValueError('Unknown upstreams: {}'.format(', '.join(sorted(unknown))))
+
+    servers = {}
+    for host, fixture in FIXTURES.items():
+        server = FixtureServer(fixture, upstream_latencies.get(names[host], latency))
+        server.start()
+        servers[host] = server
+    return servers
+
+
+def make_corpus(count, seed=0):
+    """Return `count` updates of commands and chatter, mixed like in COMMAND_MIX."""
+    rng = random.Random(seed)
+    formats = [text_format for text_format, _ in COMMAND_MIX]
+    weights = [share for _, share in COMMAND_MIX]
+    updates = []
+    for i in range(count):
+        text_format, = choices(rng, formats, weights)
+        # Some terms are looked up much more often than others
+        term = TERMS[min(int(rng.expovariate(0.3)), len(TERMS) - 1)]
+        text = text_format.format(term, name=rng.choice(NAMES), chatter=rng.choice(CHATTER))
+        updates.append({
+            'update_id': i,
+            'message': {
+                'message_id': i,
+                'date': 1445207090 + i,
+                'chat': {'id': 123, 'type': 'group'},
+                'from': {'id': 1000 + i % 50, 'first_name': 'User'},
+                'text': text,
+            },
+        })
+    return updates
+
+
+def choices(rng, population, weights):
+    """Like `random.choices` with k=1, which needs a newer Python."""
+    point = rng.random() * sum(weights)
+    for item, weight in zip(population, weights):
+        point -= weight
+        if point < 0:
+            return [item]
+    return [population[-1]]
+
+
+def read_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def command_of(update):
+    """Return the name of the command of `update`, or 'other' for the rest."""
+    text = (update.get('message') or {}).get('text') or ''
+    if not text.startswith('/'):
+        return 'other'
+    return extract_command_name(text) or 'other'
+
+
+def prepare_app(servers, concurrency):
+    http.client = FixtureHTTPClient(servers, pool_maxsize=concurrency)
+    app.config['DISPATCH_MODE'] = 'inline'
+    bot.threaded = False
+    # Measure the replies too, instead of queueing them
+    bot.outbox = None
+    bot.user = None
+    # Neither read the quotes of a previous run nor save the fixture ones
+    commands.quote_engine.snapshot_path = None
+    commands.quote_engine.refresh_interval = None
+    commands.quote_engine.cache = []
+    for cache in (leli.cache, slang.cache, kbbi.cache):
+        cache.clear()
+    recent_update_ids.clear()
+
+
+def replay(updates, concurrency, first_update_id=0):
+    """Post `updates` to the webhook and return the wall time and (command, status,
+    latency) of each."""
+    test_client = app.test_client()
+
+    def post(numbered_update):
+        update_id, update = numbered_update
+        data = json.dumps(dict(update, update_id=update_id))
+        start = time.perf_counter()
+        status = test_client.post(webhook_url_path, data=data,
+                                  content_type='application/json').status_code
+        return command_of(update), status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        samples = list(executor.map(post, enumerate(updates, start=first_update_id)))
+    return time.perf_counter() - start, samples
+
+
+def percentile(sorted_values, p):
+    """Return the `p`th percentile of `sorted_values` by the nearest-rank method.
+
+    >>> percentile([1, 2, 3, 4], 50)
+    2
+    >>> percentile([1, 2, 3, 4], 99)
+    4
+    """
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, wall_time):
+    latencies = sorted(latencies)
+    summary = {
+        'count': len(latencies),
+        'requests_per_second': len(latencies) / wall_time,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+    }
+    for p in PERCENTILES:
+        summary['p{}_ms'.format(p)] = percentile(latencies, p) * 1000
+    return summary
+
+
+def summarize_samples(wall_time, samples):
+    by_command = defaultdict(list)
+    errors = defaultdict(int)
+    for command, status, latency in samples:
+        by_command[command].append(latency)
+        errors[command] += status != 200
+    commands_summary = {}
+    for command, latencies in by_command.items():
+        commands_summary[command] = summarize(latencies, wall_time)
+        commands_summary[command]['errors'] = errors[command]
+    total = summarize([latency for _, _, latency in samples], wall_time)
+    total['errors'] = sum(errors.values())
+    return total, commands_summary
+
+
+def current_commit():
+    """Return the current commit, with a '-dirty' suffix if the tree has changes."""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short=10', 'HEAD'],
+                                         universal_newlines=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD']) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def print_results(results, baseline=None):
+    print('{} at {}: {} updates from {} threads, {:.1f} requests/s'.format(
+        results['commit'], results['date'], results['total']['count'],
+        results['options']['concurrency'], results['total']['requests_per_second']))
+    if baseline is not None:
+        print('Compared with {} at {} ({:.1f} requests/s)'.format(
+            baseline['commit'], baseline['date'], baseline['total']['requests_per_second']))
+
+    print('{:>10} {:>7} {:>7} {:>10} {:>10} {:>10} {:>10}'.format(
+        'command', 'count', 'errors', 'mean (ms)', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+    rows = sorted(results['commands'].items()) + [('total', results['total'])]
+    for command, summary in rows:
+        print('{:>10} {:>7} {:>7} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+            command, summary['count'], summary['errors'], summary['mean_ms'],
+            summary['p50_ms'], summary['p95_ms'], summary['p99_ms']))
+        if baseline is None:
+            continue
+        before = (baseline['total'] if command == 'total'
+                  else baseline['commands'].get(command))
+        if before is not None:
+            print('{:>10} {:>7} {:>7} {:>+9.0%} {:>+9.0%} {:>+9.0%} {:>+9.0%}'.format(
+                '', '', '', *[change(before[key], summary[key])
+                              for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')]))
+
+
+def change(before, after):
+    return (after - before) / before if before else 0.0
+
+
+def parse_upstream_latency(value):
+    name, equals, seconds = value.partition('=')
+    if not equals:
+        raise argparse.ArgumentTypeError('expected NAME=SECONDS, got {!r}'.format(value))
+    return name, float(seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='manage.py bench', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='File of updates, one JSON object per line')
+    parser.add_argument('--updates', type=int, default=1000,
+                        help='Number of updates to generate without --corpus')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Number of times the updates are replayed')
+    parser.add_argument('--warmup', type=int, default=50,
+                        help='Number of updates replayed first and not measured')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Number of threads posting updates')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Seconds the fixture servers take to answer')
+    parser.add_argument('--upstream-latency', type=parse_upstream_latency, action='append',
+                        default=[], metavar='NAME=SECONDS',
+                        help='Latency of one upstream, e.g. wikipedia=0.2 or telegram=0.05')
+    parser.add_argument('--output', help='File to save the results to, by default '
+                                         '{}/<commit>.json'.format(RESULTS_DIR))
+    parser.add_argument('--compare', help='Results of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    updates = read_corpus(args.corpus) if args.corpus else make_corpus(args.updates)
+    if not updates:
+        parser.error('No update to replay')
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    servers = start_servers(args.latency, dict(args.upstream_latency))
+    try:
+        app.logger.setLevel('WARNING')
+        prepare_app(servers, args.concurrency)
+        replay(updates[:args.warmup], args.concurrency, first_update_id=-args.warmup)
+        wall_time, samples = replay(updates * args.repeat, args.concurrency)
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    total, commands_summary = summarize_samples(wall_time, samples)
+    results = {
+        'commit': current_commit(),
+        'date': datetime.now().replace(microsecond=0).isoformat(),
+        'options': {
+            'corpus': args.corpus,
+            'updates': len(updates),
+            'repeat': args.repeat,
+            'concurrency': args.concurrency,
+            'latency': args.latency,
+            'upstream_latency': dict(args.upstream_latency),
+        },
+        'wall_time': wall_time,
+        'upstream_requests': {host: server.requests for host, server in servers.items()},
+        'total': total,
+        'commands': commands_summary,
+    }
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, '{}.json'.format(results['commit']))
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Saved to {}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Compare CommandRouter with TeleBot's linear scan over message handlers.
+
+Run with ``python -m benchmarks.bench_router``.
+"""
+import argparse
+import timeit
+
+from telebot import types
+
+from tululbot.utils import TululBot
+
+
+BOT_USERNAME = 'TululBot'
+BOT_USER = types.User.de_json({'id': 1, 'first_name': 'TululBot'})
+HUMAN_USER = types.User.de_json({'id': 2, 'first_name': 'John'})
+
+COMMANDS = [
+    ('leli', r'( .+)*', 'Apa yang mau dileli?'),
+    ('quote', '', None),
+    ('who', '', None),
+    ('slang', r'( .+)*', 'Apa yang mau dicari jir?'),
+    ('hotline', '', None),
+    ('hbd', r'( @?\w+)*', 'Siapa yang ultah?'),
+    ('kbbi', r'( \w+)*', 'Cari apa lu?'),
+    ('eid', '', None),
+    ('xmas', '', None),
+    ('kawin', r'( .+)*', 'Siapa yang mau kawin jir?'),
+    ('tampol', '', None),
+]
+
+
+def handler(message):
+    pass
+
+
+def make_commands(extra):
+    commands = list(COMMANDS)
+    for i in range(extra):
+        commands.append(('extra{}'.format(i), r'( .+)*', 'Extra prompt {}?'.format(i)))
+    return commands
+
+
+def make_bots(commands):
+    """Return a bot using the router and a bot using the handler chain."""
+    routed_bot = TululBot('TOKEN', threaded=False)
+    chained_bot = TululBot('TOKEN', threaded=False)
+    for bot in (routed_bot, chained_bot):
+        bot.user = BOT_USER
+
+    for name, args, prompt in commands:
+        regexp = r'^/{}(@{})?{}$'.format(name, BOT_USERNAME, args)
+        routed_bot.command_handler(name, regexp=regexp)(handler)
+        chained_bot.message_handler(regexp=regexp)(handler)
+        if prompt is not None:
+            routed_bot.reply_handler(prompt)(handler)
+            is_reply = chained_bot.create_is_reply_to_filter(prompt)
+            chained_bot.message_handler(func=is_reply)(handler)
+
+    return routed_bot, chained_bot
+
+
+def make_message(text, replied_text=None, replied_from=BOT_USER):
+    message = types.Message.de_json({
+        'message_id': 1,
+        'date': 1445207090,
+        'chat': {'id': 123, 'type': 'group'},
+        'text': text
+    })
+    if replied_text is not None:
+        replied_message = types.Message.de_json({
+            'message_id': 0,
+            'date': 1445207090,
+            'chat': {'id': 123, 'type': 'group'},
+            'text': replied_text
+        })
+        replied_message.from_user = replied_from
+        message.reply_to_message = replied_message
+    return message
+
+
+def make_corpus(commands):
+    """Return a mix of command, reply and plain group messages."""
+    last_name, last_args, last_prompt = commands[-1]
+    return [
+        make_message('/leli tulul'),
+        make_message('/quote@{}'.format(BOT_USERNAME)),
+        make_message('/tampol'),
+        make_message('/{} foo bar'.format(last_name)),
+        make_message('/unknown command'),
+        make_message('tulul', replied_text='Apa yang mau dileli?'),
+        make_message('tulul', replied_text=last_prompt),
+        make_message('tulul', replied_text='Apa yang mau dileli?', replied_from=HUMAN_USER),
+        make_message('wkwkwk'),
+        make_message('kapan kopdar lagi?'),
+    ]
+
+
+def route_with_chain(bot, message):
+    for message_handler in bot.message_handlers:
+        if bot._test_message_handler(message_handler, message):
+            return message_handler['function']
+    return None
+
+
+def route_with_router(bot, message):
+    return bot.router.route(message, bot.is_reply_to_bot_user)
+
+
+def bench(extra, number):
+    commands = make_commands(extra)
+    routed_bot, chained_bot = make_bots(commands)
+    corpus = make_corpus(commands)
+
+    for message in corpus:
+        chained = route_with_chain(chained_bot, message)
+        routed = route_with_router(routed_bot, message)
+        assert (chained is None) == (routed is None), message.text
+
+    def run_chain():
+        for message in corpus:
+            route_with_chain(chained_bot, message)
+
+    def run_router():
+        for message in corpus:
+            route_with_router(routed_bot, message)
+
+    per_message = number * len(corpus)
+    chain_time = min(timeit.repeat(run_chain, number=number, repeat=3)) / per_message
+    router_time = min(timeit.repeat(run_router, number=number, repeat=3)) / per_message
+    print('{:>9} {:>15.2f} {:>15.2f} {:>9.1f}x'.format(
+        len(commands), chain_time * 1e6, router_time * 1e6, chain_time / router_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000,
+                        help='Number of passes over the message corpus')
+    args = parser.parse_args()
+
+    print('{:>9} {:>15} {:>15} {:>10}'.format(
+        'commands', 'chain (us/msg)', 'router (us/msg)', 'speedup'))
+    for extra in (0, 50, 200):
+        bench(extra, args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Measure how often /kbbi finds a term before and after trying its lemmas.
+
+Terms are looked up in an offline dictionary, so every lookup is local and
+the hit rate is the one /kbbi would have with ``KBBI_INDEX_PATH``. Without
+it, only ``kbbi.max_lemma_lookups`` lemmas are tried on kateglo.com, which
+is reported too. Terms are read from ``--corpus``, a file with one term a
+line, and headwords from ``--dictionary``, an index built by ``manage.py
+import-kbbi``; without them, a corpus of inflected forms of common words and
+a dictionary of those words are used.
+
+Run with ``python -m benchmarks.bench_stemmer``.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from tululbot.utils import kbbi
+from tululbot.utils.index import SortedIndex, write_index
+from tululbot.utils.kbbi import lemma_candidates, pack_defs
+
+
+HEADWORDS = ['makan', 'minum', 'tulis', 'baca', 'sapu', 'kirim', 'ambil', 'pukul', 'rambut',
+             'baik', 'hasil', 'ajar', 'lari', 'main', 'jalan', 'tanam', 'nikah', 'buku',
+             'rumah', 'kerja', 'beli', 'jual', 'pikir', 'tidur', 'masak', 'bawa', 'datang',
+             'pergi', 'lihat', 'dengar', 'bicara', 'tanya', 'jawab', 'cari', 'pakai',
+             'makanan', 'minuman', 'pekerjaan', 'pelajaran', 'kebaikan', 'tulul']
+CORPUS = ['makan', 'memakan', 'dimakan', 'makanan', 'makanannya', 'termakan', 'minum',
+          'meminum', 'diminum', 'minumannya', 'menulis', 'ditulis', 'tulisan', 'penulis',
+          'membaca', 'dibaca', 'bacaan', 'bacalah', 'pembaca', 'menyapu', 'disapu', 'mengirim',
+          'dikirim', 'kiriman', 'pengirim', 'mengambil', 'diambil', 'memukul', 'dipukul',
+          'pukulan', 'berambut', 'memperbaiki', 'perbaikan', 'kebaikan', 'kebaikannya',
+          'keberhasilan', 'berhasil', 'mengajar', 'pelajaran', 'belajar', 'pengajar',
+          'berlari', 'pelari', 'bermain', 'permainan', 'mainan', 'berjalan', 'perjalanan',
+          'menanam', 'tanaman', 'menikah', 'pernikahan', 'bukumu', 'bukunya', 'rumahku',
+          'perumahan', 'bekerja', 'pekerjaan', 'pekerja', 'membeli', 'pembeli', 'menjual',
+          'penjualan', 'berpikir', 'pikiran', 'tertidur', 'memasak', 'masakan', 'membawa',
+          'dibawa', 'kedatangan', 'mendatangi', 'bepergian', 'melihat', 'terlihat',
+          'mendengar', 'pendengaran', 'berbicara', 'pembicaraan', 'bertanya', 'pertanyaan',
+          'menjawab', 'jawaban', 'mencari', 'pencarian', 'memakai', 'pakaian', 'tulul',
+          'gabut', 'mager']
+
+
+def lookup(term, with_lemmas):
+    key = term.casefold()
+    defs = kbbi.lookup_dictionary(key)
+    if not defs and with_lemmas:
+        for lemma in kbbi.lemma_lookups(key):
+            defs = kbbi.lookup_dictionary(lemma)
+            if defs:
+                break
+    return defs
+
+
+def kateglo_hits(corpus):
+    """Return the number of terms found trying at most `kbbi.max_lemma_lookups` lemmas."""
+    return sum(1 for term in corpus
+               if kbbi.dictionary.get(term) is not None or
+               any(kbbi.dictionary.get(lemma) is not None
+                   for lemma in lemma_candidates(term)[:kbbi.max_lemma_lookups]))
+
+
+def measure(corpus, with_lemmas, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        hits = sum(1 for term in corpus if lookup(term, with_lemmas))
+    return hits, (time.perf_counter() - start) / number / len(corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', help='File with one term a line')
+    parser.add_argument('--dictionary', help='Index built by `manage.py import-kbbi`')
+    parser.add_argument('--number', type=int, default=20, help='Number of passes')
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            corpus = [line.strip().casefold() for line in f if line.strip()]
+    else:
+        corpus = CORPUS
+
+    if args.dictionary:
+        path = args.dictionary
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'kbbi.idx')
+        defs = [{'class': 'verba', 'def_text': 'definisi', 'sample': ''}]
+        write_index(path, ((word, pack_defs(defs)) for word in HEADWORDS))
+    kbbi.dictionary = SortedIndex(path)
+
+    print('{} terms'.format(len(corpus)))
+    print('{:>24} {:>10} {:>14}'.format('lookup', 'hit rate', 'us/term'))
+    lemma_candidates.cache_clear()
+    for name, with_lemmas in (('surface form only', False), ('with lemmas, cold', True),
+                              ('with lemmas, memoized', True)):
+        hits, latency = measure(corpus, with_lemmas, 1 if 'cold' in name else args.number)
+        print('{:>24} {:>10.1%} {:>14.2f}'.format(name, hits / len(corpus), latency * 1e6))
+    print('{:>24} {:>10.1%}'.format('kateglo.com, {} lemmas'.format(kbbi.max_lemma_lookups),
+                                    kateglo_hits(corpus) / len(corpus)))
+    print('Memoized lemmas: {}'.format(kbbi.stemmer_stats()))
+
+
+if __name__ == '__main__':
+    main()
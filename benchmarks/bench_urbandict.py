@@ -0,0 +1,117 @@
+"""Compare looking up Urban Dictionary with the urbandict package and with the JSON API.
+
+The urbandict way is how `lookup_urbandictionary` used to parse a result:
+the whole define page into a list of every definition, of which only the
+first one was used. Responses are read from ``--fixtures``, a directory of
+``<word>.html`` pages and ``<word>.json`` responses of the define endpoint,
+e.g. saved with ``curl``; without it, a page and a response shaped like Urban
+Dictionary's are generated. Decoding the whole JSON response is measured too.
+
+Run with ``python -m benchmarks.bench_urbandict``; it needs the urbandict package.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import tracemalloc
+
+import urbandict
+
+from tululbot.utils.slang import (first_urbandictionary_definition,
+                                  format_urbandictionary_definition)
+
+
+def make_page(definitions=7):
+    head = ''.join('<script>window.config{0} = {{"ads": true, "n": {0}}};</script>'
+                   '<link rel="stylesheet" href="/assets/app{0}.css">'.format(i)
+                   for i in range(100))
+    nav = ''.join('<li><a href="/browse.php?character={0}">{0}</a></li>'.format(chr(c))
+                  for c in range(ord('A'), ord('Z') + 1))
+    panels = ''.join('<div class="def-panel"><div class="ribbon">Top definition</div>'
+                     '<div class="def-header"><a class="word" href="/define.php?term=gabut">'
+                     'gabut</a></div><div class="meaning">Definition {0} of '
+                     '<a href="/define.php?term=gabut">gabut</a>, when you have nothing to '
+                     'do and feel bored about it.</div><div class="example">Example {0}: '
+                     'gue gabut banget hari ini.</div><div class="tags">'
+                     '<a href="/tags.php?tag=bored">#bored</a></div><div class="contributor">'
+                     'by <a href="/author.php?author=user{0}">user{0}</a> May 5, 2016</div>'
+                     '</div>'.format(i) for i in range(definitions))
+    return ('<!DOCTYPE html><html><head>{}</head><body><div class="header"><ul>{}</ul></div>'
+            '<div id="content">{}</div><div class="footer">Urban Dictionary</div>'
+            '</body></html>').format(head, nav, panels)
+
+
+def make_response(definitions=10):
+    return json.dumps({'list': [{
+        'definition': 'Definition {} of [gabut], when you have nothing to do and feel '
+                      '[bored] about it.'.format(i),
+        'permalink': 'http://gabut.urbanup.com/{}'.format(1000 + i),
+        'thumbs_up': 100 - i,
+        'sound_urls': [],
+        'author': 'user{}'.format(i),
+        'word': 'gabut',
+        'defid': 1000 + i,
+        'current_vote': '',
+        'written_on': '2016-05-05T00:00:00.000Z',
+        'example': 'Example {}: gue [gabut] banget hari ini.'.format(i),
+        'thumbs_down': i,
+    } for i in range(definitions)]})
+
+
+def urbandict_first_definition(page):
+    """Parse like `lookup_urbandictionary` did with the urbandict package."""
+    parser = urbandict.UrbanDictParser()
+    parser.feed(page)
+    definition = parser.translations[0]['def']
+    return None if "There aren't any definition" in definition else definition
+
+
+def json_first_definition(response_text):
+    entries = json.loads(response_text)['list']
+    return format_urbandictionary_definition(entries[0]['definition']) if entries else None
+
+
+def measure(parse, text, number):
+    start = time.process_time()
+    for _ in range(number):
+        parse(text)
+    cpu_time = (time.process_time() - start) / number
+
+    tracemalloc.start()
+    parse(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu_time, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fixtures', help='Directory of saved pages and JSON responses')
+    parser.add_argument('--number', type=int, default=200, help='Number of parses per word')
+    args = parser.parse_args()
+
+    if args.fixtures:
+        fixtures = []
+        for path in sorted(glob.glob(os.path.join(args.fixtures, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                page = f.read()
+            with open('{}.json'.format(path[:-len('.html')]), encoding='utf-8') as f:
+                fixtures.append((os.path.basename(path)[:-len('.html')], page, f.read()))
+    else:
+        fixtures = [('generated', make_page(), make_response())]
+
+    print('{:>16} {:>22} {:>14} {:>14} {:>14}'.format(
+        'word', 'path', 'size (KB)', 'CPU (us)', 'peak (KB)'))
+    for name, page, response_text in fixtures:
+        for path, parse, text in (('urbandict (HTML)', urbandict_first_definition, page),
+                                  ('json.loads', json_first_definition, response_text),
+                                  ('first entry only', first_urbandictionary_definition,
+                                   response_text)):
+            cpu_time, peak = measure(parse, text, args.number)
+            print('{:>16} {:>22} {:>14.1f} {:>14.1f} {:>14.1f}'.format(
+                name[:16], path, len(text) / 1024, cpu_time * 1e6, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import sys
+
+# The asyncio webhook needs Python 3.5 and the packages of requirements-aio.txt
+AIO_MODULES = ['tululbot/aio.py', 'tests/test_aio.py', 'benchmarks/bench_aio.py']
+
+try:
+    import aiohttp  # noqa: F401
+except (ImportError, SyntaxError):
+    aiohttp = None
+
+collect_ignore = AIO_MODULES if sys.version_info < (3, 5) or aiohttp is None else []
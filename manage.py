@@ -3,6 +3,7 @@
 import code
 from os import environ
 from os.path import dirname, join
+import signal
 import subprocess
 import sys
 
@@ -11,6 +12,17 @@ from dotenv import load_dotenv
 import pytest
 
 
+# Default excludes of flake8, and the modules of the asyncio webhook, see conftest.py
+FLAKE8_AIO_EXCLUDE = '.svn,CVS,.bzr,.hg,.git,__pycache__,.tox,aio.py,test_aio.py,bench_aio.py'
+
+
+def flake8():
+    """Run flake8, skipping the asyncio webhook unless Python can parse it."""
+    if sys.version_info < (3, 5):
+        return subprocess.call(['flake8', '--exclude', FLAKE8_AIO_EXCLUDE])
+    return subprocess.call(['flake8'])
+
+
 def load_app():
     # Environment variable MUST be set before importing the app
     dotenv_path = join(dirname(__file__), '.env')
@@ -46,6 +58,165 @@ def runserver():
     load_app().run()
 
 
+@manage.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on.')
+@click.option('--port', type=int, default=8080, help='Port to listen on.')
+def runaio(host, port):
+    """Run the webhook on asyncio, see `tululbot.aio`."""
+    load_app()
+    from aiohttp import web
+    from tululbot.aio import create_app
+
+    web.run_app(create_app(), host=host, port=port)
+
+
+@manage.command()
+@click.option('--batch-size', type=int, help='Maximum number of updates per request.')
+@click.option('--timeout', type=int, help='Long polling timeout in seconds.')
+@click.option('--workers', type=int, help='Number of updates processed concurrently.')
+@click.option('--offset-file', help='File to store the offset of the next update.')
+def poll(batch_size, timeout, workers, offset_file):
+    """Run the bot with long polling instead of a webhook."""
+    # Telegram refuses getUpdates while a webhook is set, do not set it in the background
+    environ['WEBHOOK_SETUP'] = 'manual'
+    app = load_app()
+    from tululbot import bot, notify_devel_chat, process_update
+    from tululbot.utils.polling import OffsetFile, UpdatePoller
+
+    # Handlers must finish before the offset is saved, so run them on the poller threads
+    bot.threaded = False
+    bot.remove_webhook()
+
+    poller = UpdatePoller(bot, process_update,
+                          OffsetFile(offset_file or app.config['POLL_OFFSET_PATH']),
+                          batch_size=batch_size or app.config['POLL_BATCH_SIZE'],
+                          timeout=timeout or app.config['POLL_TIMEOUT'],
+                          num_workers=workers or app.config['POLL_WORKERS'],
+                          on_error=notify_devel_chat)
+    signal.signal(signal.SIGTERM, lambda signum, frame: poller.stop())
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        pass
+
+
+@manage.command('build-leli-index')
+@click.argument('dump', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', help='Index file to write, LELI_INDEX_PATH by default.')
+@click.option('--redirects', type=click.Path(exists=True, dir_okay=False),
+              help='File of "title<TAB>target title" lines to resolve redirects.')
+def build_leli_index(dump, output, redirects):
+    """Build the offline index of /leli from a Wikipedia abstracts dump."""
+    app = load_app()
+    from tululbot.utils.abstracts import build_index
+
+    output = output or app.config['LELI_INDEX_PATH']
+    if not output:
+        raise click.UsageError('Set LELI_INDEX_PATH or pass --output')
+    count = build_index(dump, output, redirects_path=redirects)
+    click.echo('Indexed {} titles in {}'.format(count, output))
+
+
+@manage.command('build-slang-lexicon')
+@click.argument('files', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', help='Lexicon file to write, SLANG_LEXICON_PATH by default.')
+@click.option('--from-cache', is_flag=True,
+              help='Add the definitions cached by /slang, needs CACHE_BACKEND=sqlite.')
+def build_slang_lexicon(files, output, from_cache):
+    """Build the offline lexicon of /slang from "word<TAB>definition" files."""
+    app = load_app()
+    from tululbot.utils import slang
+    from tululbot.utils.cache import SQLiteTTLCache
+    from tululbot.utils.lexicon import build_lexicon
+
+    output = output or app.config['SLANG_LEXICON_PATH']
+    if not output:
+        raise click.UsageError('Set SLANG_LEXICON_PATH or pass --output')
+    if from_cache and not isinstance(slang.cache, SQLiteTTLCache):
+        raise click.UsageError('--from-cache needs CACHE_BACKEND=sqlite')
+    count = build_lexicon(output, files, cache=slang.cache if from_cache else None)
+    click.echo('Indexed {} words in {}'.format(count, output))
+
+
+@manage.command('import-kbbi')
+@click.argument('dump', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', help='Index file to write, KBBI_INDEX_PATH by default.')
+def import_kbbi(dump, output):
+    """Build the offline dictionary of /kbbi from a CSV dump of definitions."""
+    app = load_app()
+    from tululbot.utils.dictionary import build_dictionary
+
+    output = output or app.config['KBBI_INDEX_PATH']
+    if not output:
+        raise click.UsageError('Set KBBI_INDEX_PATH or pass --output')
+    count = build_dictionary(dump, output)
+    click.echo('Indexed {} terms in {}'.format(count, output))
+
+
+@manage.command(context_settings=dict(ignore_unknown_options=True, help_option_names=[]))
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def bench(args):
+    """Replay updates through the webhook with stub upstreams, see benchmarks/bench_replay.py.
+
+    Arguments are forwarded, pass --help for them."""
+    # Neither talk to Telegram nor to GitHub outside of the fixture servers
+    environ['WEBHOOK_SETUP'] = 'manual'
+    environ['QUOTE_REFRESH_INTERVAL'] = '0'
+    environ['QUOTE_SNAPSHOT_PATH'] = ''
+    load_app()
+    from benchmarks import bench_replay
+
+    bench_replay.main(list(args))
+
+
+@manage.command('set-webhook')
+def set_webhook():
+    """Set the webhook of the bot unless it is already set."""
+    environ['WEBHOOK_SETUP'] = 'manual'
+    load_app()
+    from tululbot import register_webhook
+    register_webhook()
+
+
+@manage.command('startup-profile')
+@click.option('--limit', default=20, help='Number of modules to show.')
+@click.option('--module', default='tululbot', help='Module to import.')
+def startup_profile(limit, module):
+    """Report the time taken to import each module of the app.
+
+    Times are cumulative, i.e. include the modules imported by a module. Needs
+    Python 3.7 or newer."""
+    dotenv_path = join(dirname(__file__), '.env')
+    load_dotenv(dotenv_path)
+    env = dict(environ, WEBHOOK_SETUP='manual')
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                                'import {}'.format(module)],
+                               stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        click.echo(stderr, err=True)
+        sys.exit(process.returncode)
+
+    times = parse_importtime(stderr)
+    total = next((cumulative for name, cumulative in times if name == module), 0)
+    click.echo('Importing {} took {:.1f} ms'.format(module, total / 1000))
+    click.echo('{:>12}  {}'.format('cumul. (ms)', 'module'))
+    for name, cumulative in sorted(times, key=lambda time: time[1], reverse=True)[:limit]:
+        click.echo('{:>12.1f}  {}'.format(cumulative / 1000, name))
+
+
+def parse_importtime(output):
+    """Return (module, cumulative microseconds) pairs from `-X importtime` output."""
+    times = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times.append((name.strip(), int(cumulative)))
+    return times
+
+
 @manage.command()
 def test():
     """Run the tests."""
@@ -59,7 +230,7 @@ def test():
 @manage.command()
 def lint():
     """Run the linters."""
-    sys.exit(subprocess.call(['flake8']))
+    sys.exit(flake8())
 
 
 @manage.command()
@@ -71,7 +242,7 @@ def check():
     dotenv_path = join(dirname(__file__), 'tests', '.env')
     load_dotenv(dotenv_path)
 
-    sys.exit(subprocess.call(['flake8']) or pytest.main([]))
+    sys.exit(flake8() or pytest.main([]))
 
 
 @manage.command()
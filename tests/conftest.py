@@ -8,8 +8,9 @@ def client():
 
     Testing configuration should be placed in `tests/.env` file.
     """
-    from tululbot import app
+    from tululbot import app, recent_update_ids
     app.config['TESTING'] = True
+    recent_update_ids.clear()
     return app.test_client()
 
 
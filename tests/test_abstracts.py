@@ -0,0 +1,52 @@
+import io
+
+from tululbot.utils.abstracts import build_index, iter_abstracts
+from tululbot.utils.index import SortedIndex
+
+
+DUMP = '''<feed>
+<doc>
+<title>Wikipedia: Tulul</title>
+<url>https://en.wikipedia.org/wiki/Tulul</url>
+<abstract>Tulul is the synonym of cool.</abstract>
+<links><sublink linktype="nav"><anchor>History</anchor></sublink></links>
+</doc>
+<doc>
+<title>Wikipedia: Snowden</title>
+<url>https://en.wikipedia.org/wiki/Snowden</url>
+<abstract>Snowden may refer to:</abstract>
+</doc>
+<doc>
+<title>Wikipedia: Empty</title>
+<url>https://en.wikipedia.org/wiki/Empty</url>
+<abstract></abstract>
+</doc>
+<doc>
+<title>Wikipedia: Edward Snowden</title>
+<url>https://en.wikipedia.org/wiki/Edward_Snowden</url>
+<abstract>Edward Snowden is former CIA employee.</abstract>
+</doc>
+</feed>
+'''
+
+
+def test_iter_abstracts():
+    rv = list(iter_abstracts(io.BytesIO(DUMP.encode('utf-8'))))
+
+    assert rv == [('Tulul', 'Tulul is the synonym of cool.'),
+                  ('Edward Snowden', 'Edward Snowden is former CIA employee.')]
+
+
+def test_build_index(tmpdir):
+    dump_path = tmpdir.join('abstract.xml')
+    dump_path.write(DUMP)
+    redirects_path = tmpdir.join('redirects.tsv')
+    redirects_path.write('Snowden\tEdward Snowden\nEdward_Snowden\tEdward Snowden\n')
+    index_path = str(tmpdir.join('leli.idx'))
+
+    count = build_index(str(dump_path), index_path, redirects_path=str(redirects_path))
+
+    index = SortedIndex(index_path)
+    assert count == 3
+    assert index.get('tulul') == 'Tulul is the synonym of cool.'
+    assert index.get('snowden') == 'Edward Snowden is former CIA employee.'
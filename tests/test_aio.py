@@ -0,0 +1,221 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+from telebot.types import User  # noqa: E402
+
+from tululbot import app, bot, recent_update_ids  # noqa: E402
+from tululbot.aio import AsyncTululBot, call_store, create_app  # noqa: E402
+from tululbot.utils import kbbi, leli, slang  # noqa: E402
+from tululbot.utils.cache import SQLiteTTLCache, TTLCache  # noqa: E402
+
+
+class FakeClient:
+    """Answer GET with `pages` by URL and Telegram calls with a dummy message."""
+
+    def __init__(self, pages=None, error=None):
+        self.pages = pages or {}
+        self.error = error
+        self.telegram_calls = []
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def request(self, method, url, data=None, params=None):
+        method_name = url.rsplit('/', 1)[-1]
+        self.telegram_calls.append((method_name, data))
+        result = {'id': 1, 'first_name': 'TululBot'} if method_name == 'getMe' else {}
+        return 200, json.dumps({'ok': True, 'result': result})
+
+    async def get_text(self, url, params=None):
+        if self.error is not None:
+            raise self.error
+        return self.pages[url]
+
+    def sent_texts(self):
+        return [data['text'] for method_name, data in self.telegram_calls
+                if method_name == 'sendMessage']
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def post_updates(fake_client, updates, max_tasks=None):
+    """Post `updates` to the webhook and return the status codes after all tasks are done."""
+    async def post():
+        web_app = create_app(client=fake_client, max_tasks=max_tasks)
+        async with TestClient(TestServer(web_app)) as client:
+            statuses = []
+            for update in updates:
+                response = await client.post('/{}'.format(app.config['TELEGRAM_BOT_TOKEN']),
+                                             json=update)
+                statuses.append(response.status)
+        return statuses
+
+    return run(post())
+
+
+@pytest.fixture(autouse=True)
+def bot_user(request):
+    recent_update_ids.clear()
+    leli.cache.clear()
+    slang.cache.clear()
+    kbbi.cache.clear()
+    user_id = bot.user_id
+    bot.user = User.de_json({'id': 1, 'first_name': 'TululBot'})
+
+    def reset():
+        bot.user = None
+        bot.user_id = user_id
+    request.addfinalizer(reset)
+
+
+def test_who(fake_update_dict):
+    fake_update_dict['message']['text'] = '/who'
+    fake_client = FakeClient()
+
+    assert post_updates(fake_client, [fake_update_dict]) == [200]
+
+    method_name, data = fake_client.telegram_calls[0]
+    assert method_name == 'sendMessage'
+    assert data['chat_id'] == '123'
+    assert data['reply_to_message_id'] == '12345'
+    assert data['text'].startswith('TululBot')
+
+
+def test_duplicate_update(fake_update_dict):
+    fake_update_dict['message']['text'] = '/who'
+    fake_client = FakeClient()
+
+    assert post_updates(fake_client, [fake_update_dict, fake_update_dict]) == [200, 200]
+
+    assert len(fake_client.sent_texts()) == 1
+
+
+def test_leli(fake_update_dict):
+    fake_update_dict['message']['text'] = '/leli tulul'
+    page = ('<div id="mw-content-text"><div class="mw-parser-output">'
+            '<p>Tulul is a word.</p></div></div>')
+    fake_client = FakeClient(pages={'https://en.wikipedia.org/w/index.php': page})
+
+    post_updates(fake_client, [fake_update_dict])
+
+    assert fake_client.sent_texts() == ['Tulul is a word.']
+
+
+def test_leli_connection_error(fake_update_dict):
+    fake_update_dict['message']['text'] = '/leli tulul'
+    fake_client = FakeClient(error=asyncio.TimeoutError())
+
+    post_updates(fake_client, [fake_update_dict])
+
+    assert fake_client.sent_texts() == ["Koneksi lagi bapuk nih :'("]
+
+
+def test_reply_to_prompt(fake_update_dict):
+    fake_update_dict['message']['text'] = 'Budi'
+    fake_update_dict['message']['reply_to_message'] = {
+        'message_id': 1,
+        'date': 1445207090,
+        'chat': fake_update_dict['message']['chat'],
+        'from': {'id': 1, 'first_name': 'TululBot'},
+        'text': 'Siapa yang ultah?'
+    }
+    fake_client = FakeClient()
+
+    post_updates(fake_client, [fake_update_dict])
+
+    assert fake_client.sent_texts()[0].startswith('hoi Budi')
+
+
+def test_too_many_tasks(mocker, fake_update_dict):
+    release = asyncio.Event()
+
+    async def block(self, message):
+        await release.wait()
+
+    updates = []
+    for update_id in (1, 2):
+        update = dict(fake_update_dict, update_id=update_id)
+        update['message'] = dict(fake_update_dict['message'], text='/who')
+        updates.append(update)
+
+    mocker.patch.object(AsyncTululBot, 'who', block)
+
+    async def post():
+        web_app = create_app(client=FakeClient(), max_tasks=1)
+        async with TestClient(TestServer(web_app)) as client:
+            url = '/{}'.format(app.config['TELEGRAM_BOT_TOKEN'])
+            statuses = [(await client.post(url, json=update)).status for update in updates]
+            release.set()
+        return statuses
+
+    assert run(post()) == [200, 503]
+
+    # The rejected update is processed when Telegram retries it
+    assert recent_update_ids.add(2)
+
+
+def test_slang_drops_source_late_for_deadline(mocker):
+    async_bot = AsyncTululBot(FakeClient(), None, 10)
+
+    async def slow(word):
+        await asyncio.sleep(5)
+        return 'telat'
+
+    async def fast(word):
+        return 'cepet'
+
+    mocker.patch.object(async_bot, 'lookup_urbandictionary', slow)
+    mocker.patch.object(async_bot, 'lookup_kamusslang', fast)
+    mocker.patch('tululbot.utils.slang.deadline', 0.05)
+    mocker.patch('tululbot.utils.slang.source_stats', slang.SourceStats())
+
+    assert run(async_bot.lookup_slang('kimochi')) == 'cepet'
+    assert slang.source_stats.stats()['urbandictionary']['late'] == 1
+
+
+def test_metrics(fake_update_dict):
+    fake_update_dict['message']['text'] = '/who'
+    post_updates(FakeClient(), [fake_update_dict])
+
+    async def scrape():
+        async with TestClient(TestServer(create_app(client=FakeClient()))) as client:
+            response = await client.get(app.config['METRICS_PATH'])
+            return response.status, await response.text()
+
+    status, text = run(scrape())
+
+    assert status == 200
+    assert 'tululbot_handler_duration_seconds_count{handler="who"}' in text
+
+
+def test_call_store_runs_sqlite_on_a_thread(tmpdir):
+    sqlite_cache = SQLiteTTLCache(str(tmpdir.join('cache.sqlite3')), 'leli')
+    memory_cache = TTLCache()
+    threads = []
+
+    def record(store):
+        threads.append(threading.current_thread())
+        return store.get('tulul')
+
+    async def call():
+        return (await call_store(sqlite_cache, record, sqlite_cache),
+                await call_store(memory_cache, record, memory_cache))
+
+    run(call())
+
+    assert threads[0] is not threading.main_thread()
+    assert threads[1] is threading.main_thread()
@@ -0,0 +1,104 @@
+from tululbot.utils.cache import MISSING, SQLiteTTLCache, TTLCache
+
+
+def test_get_and_set():
+    cache = TTLCache()
+
+    assert cache.get('foo') is MISSING
+    assert cache.get('foo', None) is None
+    cache.set('foo', None)
+    assert cache.get('foo') is None
+
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+
+def test_expire(mocker):
+    mock_monotonic = mocker.patch('tululbot.utils.cache.time.monotonic', return_value=0)
+    cache = TTLCache(ttl=10)
+    cache.set('foo', 'bar')
+    cache.set('baz', 'quux', ttl=1)
+
+    mock_monotonic.return_value = 5
+
+    assert cache.get('foo') == 'bar'
+    assert cache.get('baz') is MISSING
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['size'] == 1
+
+
+def test_evict_least_recently_used():
+    cache = TTLCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is MISSING
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_sqlite_get_and_set(tmpdir):
+    cache = SQLiteTTLCache(str(tmpdir.join('cache.sqlite3')), 'leli')
+
+    assert cache.get('foo') is MISSING
+    cache.set('foo', None)
+    cache.set('bar', [{'def_text': 'baz'}])
+
+    assert cache.get('foo') is None
+    assert cache.get('bar') == [{'def_text': 'baz'}]
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_sqlite_shared_between_instances_but_not_namespaces(tmpdir):
+    path = str(tmpdir.join('cache.sqlite3'))
+    cache = SQLiteTTLCache(path, 'leli')
+    cache.set('foo', 'bar')
+
+    assert SQLiteTTLCache(path, 'leli').get('foo') == 'bar'
+    assert SQLiteTTLCache(path, 'slang').get('foo') is MISSING
+
+
+def test_sqlite_expire(mocker, tmpdir):
+    mock_time = mocker.patch('tululbot.utils.cache.time.time', return_value=1000.0)
+    cache = SQLiteTTLCache(str(tmpdir.join('cache.sqlite3')), 'leli', ttl=10)
+    cache.set('foo', 'bar')
+    cache.set('baz', 'quux', ttl=1)
+
+    mock_time.return_value = 1005.0
+
+    assert cache.get('foo') == 'bar'
+    assert cache.get('baz') is MISSING
+    cache.sweep()
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['size'] == 1
+
+
+def test_sqlite_sweep_evicts_entries_expiring_first(tmpdir):
+    cache = SQLiteTTLCache(str(tmpdir.join('cache.sqlite3')), 'leli', max_size=2,
+                           sweep_interval=3)
+    cache.set('a', 1, ttl=30)
+    cache.set('b', 2, ttl=10)
+    assert cache.stats()['size'] == 2
+
+    cache.set('c', 3, ttl=20)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is MISSING
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_sqlite_reconnect_after_fork(mocker, tmpdir):
+    cache = SQLiteTTLCache(str(tmpdir.join('cache.sqlite3')), 'leli')
+    cache.set('foo', 'bar')
+    conn = cache.connection
+
+    mocker.patch('tululbot.utils.sqlite.os.getpid', return_value=-1)
+
+    assert cache.connection is not conn
+    assert cache.get('foo') == 'bar'
@@ -1,7 +1,8 @@
-from requests.exceptions import HTTPError, ConnectionError
+from requests.exceptions import HTTPError, ConnectionError, ReadTimeout
 
 from tululbot.commands import leli, quote, who, slang, hotline, hbd, kbbi, eid, xmas, kawin, \
     tampol
+from tululbot.utils.quote import QuotesNotLoaded
 
 
 class TestLeliCommand:
@@ -70,6 +71,16 @@ class TestLeliCommand:
 
         mock_reply_to.assert_called_once_with(fake_message, "Koneksi lagi bapuk nih :'(")
 
+    def test_timeout(self, mocker, fake_message):
+        fake_message.text = '/leli asdf asdf'
+        mocker.patch('tululbot.commands.search_on_wikipedia', side_effect=ReadTimeout,
+                     autospec=True)
+        mock_reply_to = mocker.patch('tululbot.commands.bot.reply_to', autospec=True)
+
+        leli(fake_message)
+
+        mock_reply_to.assert_called_once_with(fake_message, "Koneksi lagi bapuk nih :'(")
+
 
 class TestQuoteCommand:
 
@@ -103,6 +114,37 @@ class TestQuoteCommand:
 
         mock_reply_to.assert_called_once_with(fake_message, "Koneksi lagi bapuk nih :'(")
 
+    def test_quote_not_loaded_yet(self, fake_message, mocker):
+        fake_message.text = '/quote'
+        mocker.patch('tululbot.commands.quote_engine.retrieve_random',
+                     side_effect=QuotesNotLoaded, autospec=True)
+        mock_reply_to = mocker.patch('tululbot.commands.bot.reply_to', autospec=True)
+
+        quote(fake_message)
+
+        mock_reply_to.assert_called_once_with(fake_message, "Koneksi lagi bapuk nih :'(")
+
+    def test_search(self, fake_message, mocker):
+        fake_message.text = '/quote @budi'
+        mock_engine = mocker.patch('tululbot.commands.quote_engine', autospec=True)
+        mock_reply_to = mocker.patch('tululbot.commands.bot.reply_to', autospec=True)
+        mock_engine.search.return_value = 'some quote of budi'
+
+        quote(fake_message)
+
+        mock_engine.search.assert_called_once_with('@budi')
+        mock_reply_to.assert_called_once_with(fake_message, 'some quote of budi')
+
+    def test_search_not_found(self, fake_message, mocker):
+        fake_message.text = '/quote gabut'
+        mock_engine = mocker.patch('tululbot.commands.quote_engine', autospec=True)
+        mock_reply_to = mocker.patch('tululbot.commands.bot.reply_to', autospec=True)
+        mock_engine.search.return_value = None
+
+        quote(fake_message)
+
+        mock_reply_to.assert_called_once_with(fake_message, 'Gak ada quote kayak gitu bray')
+
 
 def test_who(fake_message, mocker):
     fake_message.text = '/who'
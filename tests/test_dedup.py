@@ -0,0 +1,72 @@
+import pytest
+
+from tululbot.utils.dedup import RecentUpdateIds, SQLiteRecentUpdateIds
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_update_ids(request, tmpdir):
+    def make(**kwargs):
+        if request.param == 'sqlite':
+            return SQLiteRecentUpdateIds(str(tmpdir.join('updates.sqlite3')),
+                                         purge_interval=1, **kwargs)
+        return RecentUpdateIds(**kwargs)
+
+    return make
+
+
+def test_add(make_update_ids):
+    update_ids = make_update_ids()
+
+    assert update_ids.add(1)
+    assert update_ids.add(2)
+    assert not update_ids.add(1)
+    assert update_ids.stats()['suppressed'] == 1
+
+
+def test_discard(make_update_ids):
+    update_ids = make_update_ids()
+    update_ids.add(1)
+
+    update_ids.discard(1)
+
+    assert update_ids.add(1)
+
+
+def test_expired(make_update_ids, mocker):
+    update_ids = make_update_ids(ttl=10)
+    mock_time = mocker.patch('tululbot.utils.dedup.time.time', return_value=1000.0)
+    update_ids.add(1)
+
+    mock_time.return_value = 1011.0
+
+    assert update_ids.add(1)
+
+
+def test_max_size(make_update_ids):
+    update_ids = make_update_ids(max_size=2)
+    for update_id in range(3):
+        update_ids.add(update_id)
+
+    assert update_ids.stats()['size'] == 2
+    assert update_ids.add(0)
+
+
+def test_sqlite_shared_between_instances(tmpdir):
+    path = str(tmpdir.join('updates.sqlite3'))
+    update_ids = SQLiteRecentUpdateIds(path)
+    other_update_ids = SQLiteRecentUpdateIds(path)
+
+    assert update_ids.add(1)
+    assert not other_update_ids.add(1)
+    assert update_ids.stats()['suppressed_all_workers'] == 1
+
+
+def test_sqlite_reconnect_after_fork(mocker, tmpdir):
+    update_ids = SQLiteRecentUpdateIds(str(tmpdir.join('updates.sqlite3')))
+    assert update_ids.add(1)
+    conn = update_ids.connection
+
+    mocker.patch('tululbot.utils.sqlite.os.getpid', return_value=-1)
+
+    assert update_ids.connection is not conn
+    assert not update_ids.add(1)
@@ -0,0 +1,31 @@
+from tululbot.utils.dictionary import build_dictionary
+from tululbot.utils.index import SortedIndex
+from tululbot.utils.kbbi import format_defs, to_defs, unpack_defs
+
+
+DUMP = '''phrase,lex_class_ref,def_text,sample
+makan,verba,"memasukkan makanan pokok ke dalam mulut","makan nasi"
+tulul,,bodoh,
+Makan,verba,"dimakan, dikenai",
+rusak,adjektiva,,
+'''
+
+
+def test_build_dictionary(tmpdir):
+    dump = tmpdir.join('kbbi.csv')
+    dump.write_text(DUMP, encoding='utf-8')
+    path = str(tmpdir.join('kbbi.idx'))
+
+    count = build_dictionary(str(dump), path)
+
+    dictionary = SortedIndex(path)
+    assert count == len(dictionary) == 2
+    assert dictionary.get('rusak') is None
+    kateglo_response = {'kateglo': {'definition': [
+        {'lex_class_ref': 'verba', 'def_text': 'memasukkan makanan pokok ke dalam mulut',
+         'sample': 'makan nasi'},
+        {'lex_class_ref': 'verba', 'def_text': 'dimakan, dikenai', 'sample': None},
+    ]}}
+    assert (format_defs(unpack_defs(dictionary.get('makan'))) ==
+            format_defs(to_defs(kateglo_response)))
+    assert format_defs(unpack_defs(dictionary.get('tulul'))) == '1. bodoh\n'
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from tululbot.utils.dispatch import QueueFull, UpdateDispatcher
+
+
+class TestUpdateDispatcher:
+
+    def test_process_submitted_items(self):
+        processed = []
+        dispatcher = UpdateDispatcher(processed.append, num_workers=2, queue_size=10)
+
+        for i in range(5):
+            dispatcher.submit(i)
+        dispatcher.shutdown()
+
+        assert sorted(processed) == list(range(5))
+        stats = dispatcher.stats()
+        assert stats['submitted'] == 5
+        assert stats['processed'] == 5
+        assert stats['queue_depth'] == 0
+
+    def test_queue_full(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def process(item):
+            started.set()
+            release.wait()
+
+        dispatcher = UpdateDispatcher(process, num_workers=1, queue_size=1)
+        dispatcher.submit('first')
+        started.wait()
+        dispatcher.submit('second')
+
+        with pytest.raises(QueueFull):
+            dispatcher.submit('third')
+
+        release.set()
+        dispatcher.shutdown()
+        stats = dispatcher.stats()
+        assert stats['rejected'] == 1
+        assert stats['processed'] == 2
+        assert stats['max_queue_depth'] == 1
+
+    def test_shutdown_timeout_with_full_queue(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def process(item):
+            started.set()
+            release.wait()
+
+        dispatcher = UpdateDispatcher(process, num_workers=1, queue_size=1)
+        dispatcher.submit('first')
+        started.wait()
+        dispatcher.submit('second')
+
+        start = time.monotonic()
+        dispatcher.shutdown(timeout=0.2)
+
+        assert time.monotonic() - start < 1
+        release.set()
+
+    def test_submit_after_shutdown(self):
+        dispatcher = UpdateDispatcher(lambda item: None)
+        dispatcher.shutdown()
+
+        with pytest.raises(QueueFull):
+            dispatcher.submit('foo')
+
+    def test_failing_item(self, mocker):
+        on_error = mocker.Mock()
+
+        def process(item):
+            raise ValueError(item)
+
+        dispatcher = UpdateDispatcher(process, num_workers=1, on_error=on_error)
+        dispatcher.submit('foo')
+        dispatcher.submit('bar')
+        dispatcher.shutdown()
+
+        stats = dispatcher.stats()
+        assert stats['failed'] == 2
+        assert stats['processed'] == 2
+        assert on_error.call_count == 2
@@ -0,0 +1,52 @@
+from requests.exceptions import ConnectionError
+import pytest
+
+from tululbot.utils.http import HTTPClient
+
+
+def test_default_timeout(mocker):
+    client = HTTPClient(timeout=(1, 2))
+    mock_request = mocker.patch.object(client.session, 'request', autospec=True)
+
+    client.get('http://kateglo.com/api.php', params={'phrase': 'foo'})
+    client.get('http://kateglo.com/api.php', timeout=5)
+
+    mock_request.assert_any_call('GET', 'http://kateglo.com/api.php', params={'phrase': 'foo'},
+                                 timeout=(1, 2))
+    mock_request.assert_any_call('GET', 'http://kateglo.com/api.php', timeout=5)
+
+
+def test_stats(mocker):
+    client = HTTPClient()
+    mocker.patch.object(client.session, 'request', autospec=True,
+                        side_effect=[mocker.Mock(), ConnectionError])
+
+    client.get('https://en.wikipedia.org/w/index.php')
+    with pytest.raises(ConnectionError):
+        client.get('https://en.wikipedia.org/w/index.php')
+
+    stats = client.stats()['en.wikipedia.org']
+    assert stats['requests'] == 1
+    assert stats['errors'] == 1
+
+
+def test_session_is_reused(mocker):
+    client = HTTPClient()
+    session = client.session
+
+    assert client.session is session
+
+    mocker.patch('tululbot.utils.http.os.getpid', return_value=-1)
+
+    assert client.session is not session
+
+
+def test_session_keeps_connections_per_host():
+    client = HTTPClient(pool_connections=20, pool_maxsize=5)
+
+    adapter = client.session.get_adapter('https://api.telegram.org')
+
+    assert adapter is client.session.get_adapter('http://kamusslang.com')
+    assert adapter._pool_connections == 20
+    assert adapter._pool_maxsize == 5
+    assert 'gzip' in client.session.headers['Accept-Encoding']
@@ -0,0 +1,50 @@
+import pytest
+
+from tululbot.utils.index import SortedIndex, write_index
+
+
+def test_write_and_read(tmpdir):
+    path = str(tmpdir.join('index'))
+    items = [('tulul', 'Tulul is cool.'), ('bot', 'Bot is a program.'),
+             ('tulul', 'Duplicate.'), ('kopi', 'Kopi itu enak ☕')]
+
+    count = write_index(path, items, aliases=[('tululbot', 'bot'), ('missing', 'nothing')])
+
+    index = SortedIndex(path)
+    assert count == len(index) == 4
+    assert index.get('tulul') == 'Tulul is cool.'
+    assert index.get('kopi') == 'Kopi itu enak ☕'
+    assert index.get('tululbot') == 'Bot is a program.'
+    assert index.get('missing') is None
+    assert index.get('a') is None
+    assert index.get('zzz', 'default') == 'default'
+    assert 'bot' in index
+    index.close()
+
+
+def test_empty_index(tmpdir):
+    path = str(tmpdir.join('index'))
+    write_index(path, [])
+
+    assert SortedIndex(path).get('tulul') is None
+
+
+def test_not_an_index(tmpdir):
+    path = tmpdir.join('index')
+    path.write('not an index file')
+
+    with pytest.raises(ValueError):
+        SortedIndex(str(path))
+
+
+def test_similar(tmpdir):
+    path = str(tmpdir.join('index'))
+    words = ['gabut', 'gabud', 'gaboet', 'galau', 'baper', 'gab', 'gabutt', 'kepo']
+    write_index(path, ((word, word.upper()) for word in words))
+    index = SortedIndex(path)
+
+    assert index.similar('gabut', 0) == [(0, 'gabut')]
+    assert index.similar('gabut', 1) == [(0, 'gabut'), (1, 'gabud'), (1, 'gabutt')]
+    assert index.similar('gabut', 2) == [(0, 'gabut'), (1, 'gabud'), (1, 'gabutt'),
+                                         (2, 'gab'), (2, 'gaboet')]
+    assert index.similar('xyz', 1) == []
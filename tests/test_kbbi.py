@@ -1,4 +1,13 @@
-from tululbot.utils.kbbi import lookup_kbbi_definition
+import pytest
+
+from tululbot.utils import kbbi
+from tululbot.utils.index import SortedIndex, write_index
+from tululbot.utils.kbbi import lookup_kbbi_definition, pack_defs
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    kbbi.cache.clear()
 
 
 def test_lookup_kbbi(mocker):
@@ -25,7 +34,7 @@ def test_lookup_kbbi(mocker):
             pass
 
     fake_term = 'asdf asdf'
-    mock_get = mocker.patch('tululbot.utils.kbbi.requests.get', return_value=FakeResponse(),
+    mock_get = mocker.patch('tululbot.utils.kbbi.http.get', return_value=FakeResponse(),
                             autospec=True)
 
     rv = lookup_kbbi_definition(fake_term)
@@ -53,9 +62,64 @@ def test_lookup_kbbi_term_not_found(mocker):
         def raise_for_status(self):
             pass
 
-    mocker.patch('tululbot.utils.kbbi.requests.get', return_value=FakeResponse(),
+    mocker.patch('tululbot.utils.kbbi.http.get', return_value=FakeResponse(),
                  autospec=True)
 
     rv = lookup_kbbi_definition('asdf asdf')
 
     assert rv == []
+
+
+def test_lookup_kbbi_cached(mocker):
+    class FakeResponse:
+        def json(self):
+            raise ValueError
+
+        def raise_for_status(self):
+            pass
+
+    mock_get = mocker.patch('tululbot.utils.kbbi.http.get', return_value=FakeResponse(),
+                            autospec=True)
+
+    lookup_kbbi_definition('Asdf')
+    rv = lookup_kbbi_definition('asdf')
+
+    assert rv == []
+    assert mock_get.call_count == 1
+
+
+def test_lookup_kbbi_from_dictionary(mocker, tmpdir):
+    path = str(tmpdir.join('kbbi.idx'))
+    defs = [{'class': 'nomina', 'def_text': 'foo bar', 'sample': ''}]
+    write_index(path, [('asdf', pack_defs(defs))])
+    mocker.patch('tululbot.utils.kbbi.dictionary', SortedIndex(path))
+    mock_get = mocker.patch('tululbot.utils.kbbi.http.get', autospec=True)
+
+    assert lookup_kbbi_definition('ASDF') == defs
+    assert lookup_kbbi_definition('qwerty') == []
+    assert not mock_get.called
+
+
+def test_lookup_kbbi_lemma(mocker):
+    class FakeResponse:
+        def __init__(self, definitions):
+            self.definitions = definitions
+
+        def json(self):
+            if not self.definitions:
+                raise ValueError
+            return {'kateglo': {'definition': self.definitions}}
+
+        def raise_for_status(self):
+            pass
+
+    definition = {'lex_class_ref': 'verba', 'def_text': 'memasukkan makanan', 'sample': ''}
+    mock_get = mocker.patch('tululbot.utils.kbbi.http.get', autospec=True,
+                            side_effect=lambda url, params: FakeResponse(
+                                [definition] if params['phrase'] == 'makan' else []))
+
+    rv = lookup_kbbi_definition('dimakan')
+
+    assert rv == [{'class': 'verba', 'def_text': 'memasukkan makanan', 'sample': ''}]
+    phrases = [call[1]['params']['phrase'] for call in mock_get.call_args_list]
+    assert phrases == ['dimakan', 'makan']
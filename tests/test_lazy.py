@@ -0,0 +1,21 @@
+import sys
+
+from tululbot.utils.lazy import lazy_import
+
+
+def test_import_on_first_use(mocker):
+    mocker.patch.dict(sys.modules)
+    sys.modules.pop('colorsys', None)
+    colorsys = lazy_import('colorsys')
+
+    assert 'colorsys' not in sys.modules
+    assert colorsys.rgb_to_hsv(0, 0, 0) == (0, 0, 0)
+    assert 'colorsys' in sys.modules
+
+
+def test_patch_attribute(mocker):
+    colorsys = lazy_import('colorsys')
+    mocker.patch.object(colorsys, 'rgb_to_hsv', return_value='patched')
+
+    assert colorsys.rgb_to_hsv(0, 0, 0) == 'patched'
+    assert sys.modules['colorsys'].rgb_to_hsv(0, 0, 0) == (0, 0, 0)
@@ -1,10 +1,19 @@
-from tululbot.utils.leli import search_on_wikipedia, search_on_google
+import pytest
+
+from tululbot.utils import leli
+from tululbot.utils.leli import (ContentParser, parse_page, parse_search_page,
+                                 search_on_wikipedia, search_on_google)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    leli.cache.clear()
 
 
 def test_search_on_wikipedia_and_found(mocker):
-    mock_requests = mocker.patch('tululbot.utils.leli.requests', autospec=True)
+    mock_http = mocker.patch('tululbot.utils.leli.http', autospec=True)
 
-    mock_requests.get.return_value.text = (
+    mock_http.get.return_value.text = (
         '<html>'
         '    <div id="mw-content-text">'
         '        <p>Tulul is the synonym of cool.</p>'
@@ -18,7 +27,7 @@ def test_search_on_wikipedia_and_found(mocker):
 
 
 def test_ambiguous_term_on_wikipedia(mocker):
-    mock_requests = mocker.patch('tululbot.utils.leli.requests', autospec=True)
+    mock_http = mocker.patch('tululbot.utils.leli.http', autospec=True)
 
     class FakeResponse:
         def __init__(self, text):
@@ -49,13 +58,62 @@ def test_ambiguous_term_on_wikipedia(mocker):
     )
     response2 = FakeResponse(response2_text)
 
-    mock_requests.get.side_effect = [response1, response2]
+    mock_http.get.side_effect = [response1, response2]
 
     rv = search_on_wikipedia('snowden')
 
     assert rv == 'Snowden is former CIA employee.'
 
 
+def test_search_on_wikipedia_is_cached(mocker):
+    mock_http = mocker.patch('tululbot.utils.leli.http', autospec=True)
+    mock_http.get.return_value.text = (
+        '<div id="mw-content-text"><p>Tulul is the synonym of cool.</p></div>'
+    )
+
+    search_on_wikipedia('tulul')
+    rv = search_on_wikipedia(' Tulul ')
+
+    assert rv == 'Tulul is the synonym of cool.'
+    assert mock_http.get.call_count == 1
+
+
+def test_not_found_is_cached_shorter(mocker):
+    mock_http = mocker.patch('tululbot.utils.leli.http', autospec=True)
+    mock_http.get.return_value.text = '<div id="mw-content-text"></div>'
+    mock_set = mocker.patch.object(leli.cache, 'set', autospec=True)
+
+    assert search_on_wikipedia('wazaundtechnik') is None
+
+    mock_set.assert_called_once_with('wazaundtechnik', None, ttl=leli.not_found_ttl)
+
+
+def test_disambiguated_page_is_cached_by_url(mocker):
+    mock_http = mocker.patch('tululbot.utils.leli.http', autospec=True)
+    ambiguous_page = (
+        '<div id="mw-content-text"><p>Snowden may refer to:</p>'
+        '<a href="/wiki/Edward_Snowden">Edward Snowden</a></div>'
+    )
+    mock_http.get.return_value.text = ambiguous_page
+    leli.cache.set('https://en.wikipedia.org/wiki/Edward_Snowden', 'Cached.')
+
+    rv = search_on_wikipedia('snowden')
+
+    assert rv == 'Cached.'
+    assert mock_http.get.call_count == 1
+    assert leli.cache.get('snowden') == 'Cached.'
+
+
+def test_search_on_wikipedia_from_index(mocker):
+    mock_http = mocker.patch('tululbot.utils.leli.http', autospec=True)
+    mocker.patch.object(leli, 'abstracts', {'tulul bot': 'TululBot is a bot.'})
+
+    rv = search_on_wikipedia('Tulul Bot')
+
+    assert rv == 'TululBot is a bot.'
+    assert not mock_http.get.called
+
+
 def test_search_on_google():
     rv = search_on_google('wazaundtechnik')
 
@@ -64,3 +122,40 @@ def test_search_on_google():
         'https://google.com/search?q=wazaundtechnik'
     )
     assert rv == expected_text
+
+
+def test_parse_page_stops_after_first_paragraph(mocker):
+    page = (
+        '<html>'
+        '    <div id="siteNotice"><p>Donate!</p><a href="/wiki/Donate">Donate</a></div>'
+        '    <div id="mw-content-text">'
+        '        <div class="hatnote">For other uses, see '
+        '<a href="/wiki/Foo_(disambiguation)">Foo (disambiguation)</a>.</div>'
+        '        <p><b>Foo</b> &amp; <a href="/wiki/Bar">bar</a> are placeholders.'
+        '<sup>[1]</sup></p>'
+        '        <p>Second paragraph.</p>'
+        '    </div>'
+        '</html>'
+    )
+    mock_handle_data = mocker.spy(ContentParser, 'handle_data')
+
+    rv = parse_page(page)
+
+    assert rv.first_paragraph == 'Foo & bar are placeholders.[1]'
+    assert rv.first_wiki_path == '/wiki/Foo_(disambiguation)'
+    assert 'Second paragraph.' not in [call[0][1] for call in mock_handle_data.call_args_list]
+
+
+def test_parse_page_without_paragraph():
+    page = '<html><div id="mw-content-text"><ul><li>Foo</li></ul></div><p>Footer</p></html>'
+
+    rv = parse_page(page)
+
+    assert rv.first_paragraph is None
+    assert rv.first_wiki_path is None
+
+
+def test_ambiguous_term_without_link():
+    page = '<html><div id="mw-content-text"><p>Foo may refer to:</p></div></html>'
+
+    assert parse_search_page(page) == (None, None)
@@ -0,0 +1,25 @@
+from tululbot.utils.cache import SQLiteTTLCache
+from tululbot.utils.index import SortedIndex
+from tululbot.utils.lexicon import build_lexicon
+
+
+def test_build_lexicon(tmpdir):
+    definitions = tmpdir.join('slang.tsv')
+    definitions.write_text('# word<TAB>definition\n'
+                           'Gabut\tGaji buta\\nBosan\n'
+                           'kepo\tIngin tahu\n'
+                           'rusak\n', encoding='utf-8')
+    cache = SQLiteTTLCache(str(tmpdir.join('cache.sqlite3')), 'slang')
+    cache.set('gabut', 'Cached gabut')
+    cache.set('baper', 'Bawa perasaan')
+    cache.set('kimcil', None)
+    path = str(tmpdir.join('slang.idx'))
+
+    count = build_lexicon(path, [str(definitions)], cache=cache)
+
+    lexicon = SortedIndex(path)
+    assert count == len(lexicon) == 3
+    assert lexicon.get('gabut') == 'Gaji buta\nBosan'
+    assert lexicon.get('kepo') == 'Ingin tahu'
+    assert lexicon.get('baper') == 'Bawa perasaan'
+    assert lexicon.get('kimcil') is None
@@ -0,0 +1,57 @@
+import threading
+
+from tululbot.utils.metrics import Registry
+
+
+def test_counter_per_thread():
+    registry = Registry()
+    errors = registry.counter('errors_total', 'Errors.', labels=('upstream',))
+
+    def record():
+        for _ in range(1000):
+            errors.inc('kateglo')
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    errors.inc('wikipedia', amount=2)
+
+    assert registry.render() == ('# HELP errors_total Errors.\n'
+                                 '# TYPE errors_total counter\n'
+                                 'errors_total{upstream="kateglo"} 4000\n'
+                                 'errors_total{upstream="wikipedia"} 2\n')
+    # Shards of the dead threads are merged once
+    assert 'errors_total{upstream="kateglo"} 4000\n' in registry.render()
+
+
+def test_histogram():
+    registry = Registry()
+    duration = registry.histogram('duration_seconds', 'Duration.', labels=('handler',),
+                                  buckets=(0.1, 1))
+
+    duration.observe(0.05, 'leli')
+    duration.observe(0.5, 'leli')
+    duration.observe(5, 'leli')
+    with duration.time('quote'):
+        pass
+
+    lines = registry.render().splitlines()
+    assert lines[:7] == ['# HELP duration_seconds Duration.',
+                         '# TYPE duration_seconds histogram',
+                         'duration_seconds_bucket{handler="leli",le="0.1"} 1',
+                         'duration_seconds_bucket{handler="leli",le="1"} 2',
+                         'duration_seconds_bucket{handler="leli",le="+Inf"} 3',
+                         'duration_seconds_sum{handler="leli"} 5.55',
+                         'duration_seconds_count{handler="leli"} 3']
+    assert 'duration_seconds_count{handler="quote"} 1' in lines
+
+
+def test_collector():
+    registry = Registry()
+    registry.add_collector(lambda: [('hit_ratio', 'gauge', 'Hit ratio.',
+                                     [([('cache', 'say "hi"')], 0.5)])])
+
+    assert registry.render() == ('# HELP hit_ratio Hit ratio.\n'
+                                 '# TYPE hit_ratio gauge\n'
+                                 'hit_ratio{cache="say \\"hi\\""} 0.5\n')
@@ -0,0 +1,139 @@
+import threading
+
+from requests.exceptions import ConnectionError, ReadTimeout
+from telebot.apihelper import ApiException
+
+from tululbot.utils.outbox import (Outbox, PRIORITY_NOTIFICATION, PRIORITY_REPLY, TokenBucket,
+                                   get_retry_after)
+
+
+class FakeResponse:
+    def __init__(self, status_code, json_data):
+        self.status_code = status_code
+        self.json_data = json_data
+
+    def json(self):
+        return self.json_data
+
+
+class TestTokenBucket:
+
+    def test_take(self):
+        bucket = TokenBucket(rate=1, capacity=2, now=0)
+
+        assert bucket.take(0) == 0
+        assert bucket.take(0) == 0
+        assert bucket.take(0) == 1
+        assert bucket.take(0.5) == 0.5
+        assert bucket.take(1) == 0
+
+    def test_block(self):
+        bucket = TokenBucket(rate=1, capacity=2, now=0)
+
+        bucket.block(10)
+
+        assert bucket.take(4) == 6
+        assert bucket.take(10) == 0
+
+
+class TestOutbox:
+
+    def test_send_in_priority_order(self):
+        sent = []
+        release = threading.Event()
+
+        def block(text):
+            release.wait()
+
+        outbox = Outbox(chat_rate=100, chat_burst=100)
+        outbox.put(1, block, ('block',))
+        outbox.put(1, sent.append, ('notification',), priority=PRIORITY_NOTIFICATION)
+        outbox.put(1, sent.append, ('reply',), priority=PRIORITY_REPLY)
+        release.set()
+        outbox.shutdown()
+
+        assert sent == ['reply', 'notification']
+        assert outbox.stats()['sent'] == 3
+
+    def test_rate_limited_chat_does_not_block_others(self):
+        sent = []
+        outbox = Outbox(chat_rate=0.01, chat_burst=1)
+        outbox.put(1, sent.append, ('first',))
+        outbox.put(1, sent.append, ('second',))
+        outbox.put(2, sent.append, ('other chat',))
+
+        outbox.shutdown(timeout=0.5)
+
+        assert sent == ['first', 'other chat']
+        assert outbox.stats()['queue_depth'] == 1
+
+    def test_retry_after(self, mocker):
+        response = FakeResponse(429, {'ok': False, 'parameters': {'retry_after': 0.01}})
+        send = mocker.Mock(side_effect=[ApiException('Too many requests', 'sendMessage',
+                                                     response), None])
+        outbox = Outbox()
+
+        outbox.put(1, send, ('foo',), {'parse_mode': 'Markdown'})
+        outbox.shutdown()
+
+        assert send.call_count == 2
+        send.assert_called_with('foo', parse_mode='Markdown')
+        assert outbox.stats()['rate_limited'] == 1
+        assert outbox.stats()['sent'] == 1
+
+    def test_give_up_when_always_rate_limited(self, mocker):
+        response = FakeResponse(429, {'ok': False, 'parameters': {'retry_after': 0.001}})
+        send = mocker.Mock(side_effect=ApiException('Too many requests', 'sendMessage',
+                                                    response))
+        outbox = Outbox(max_retries=2)
+
+        outbox.put(1, send, ('foo',))
+        outbox.shutdown(timeout=5)
+
+        assert send.call_count == 3
+        assert outbox.stats()['rate_limited'] == 2
+        assert outbox.stats()['failed'] == 1
+
+    def test_give_up_after_max_retries(self, mocker):
+        send = mocker.Mock(side_effect=ConnectionError)
+        outbox = Outbox(max_retries=2, retry_interval=0.001)
+
+        outbox.put(1, send, ('foo',))
+        outbox.shutdown()
+
+        assert send.call_count == 3
+        assert outbox.stats()['retried'] == 2
+        assert outbox.stats()['failed'] == 1
+
+    def test_retry_server_error(self, mocker):
+        response = FakeResponse(502, {'ok': False})
+        send = mocker.Mock(side_effect=[ApiException('Bad gateway', 'sendMessage', response),
+                                        None])
+        outbox = Outbox(retry_interval=0.001)
+
+        outbox.put(1, send, ('foo',))
+        outbox.shutdown()
+
+        assert send.call_count == 2
+        assert outbox.stats()['retried'] == 1
+        assert outbox.stats()['sent'] == 1
+
+    def test_no_retry_after_read_timeout(self, mocker):
+        # The message may have been sent already
+        send = mocker.Mock(side_effect=ReadTimeout)
+        outbox = Outbox(retry_interval=0.001)
+
+        outbox.put(1, send, ('foo',))
+        outbox.shutdown()
+
+        assert send.call_count == 1
+        assert outbox.stats()['retried'] == 0
+        assert outbox.stats()['failed'] == 1
+
+
+def test_get_retry_after():
+    response = FakeResponse(429, {'ok': False, 'parameters': {'retry_after': 5}})
+    assert get_retry_after(ApiException('', 'sendMessage', response)) == 5
+
+    response = FakeResponse(400, {'ok': False})
+    assert get_retry_after(ApiException('', 'sendMessage', response)) is None
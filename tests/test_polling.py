@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.types import Update
+import pytest
+
+from tululbot.utils.polling import OffsetFile, UpdatePoller
+
+
+@pytest.fixture
+def offset_file(tmpdir):
+    return OffsetFile(str(tmpdir.join('offset')))
+
+
+@pytest.fixture
+def executor(request):
+    executor = ThreadPoolExecutor(max_workers=2)
+    request.addfinalizer(executor.shutdown)
+    return executor
+
+
+def make_updates(fake_update_dict, update_ids):
+    return [Update.de_json(dict(fake_update_dict, update_id=update_id))
+            for update_id in update_ids]
+
+
+def test_offset_file(offset_file):
+    assert offset_file.load() == 0
+
+    offset_file.save(42)
+
+    assert offset_file.load() == 42
+
+
+def test_poll_once(mocker, offset_file, executor, fake_update_dict):
+    offset_file.save(10)
+    bot = mocker.Mock()
+    bot.get_updates.return_value = make_updates(fake_update_dict, [10, 11, 12])
+    processed = []
+    poller = UpdatePoller(bot, processed.append, offset_file, batch_size=50, timeout=20)
+
+    rv = poller.poll_once(executor)
+
+    assert rv == 3
+    assert sorted(update.update_id for update in processed) == [10, 11, 12]
+    assert offset_file.load() == 13
+    bot.get_updates.assert_called_once_with(offset=10, limit=50, timeout=20,
+                                            allowed_updates='["message"]')
+
+
+def test_poll_once_no_updates(mocker, offset_file, executor):
+    bot = mocker.Mock()
+    bot.get_updates.return_value = []
+    poller = UpdatePoller(bot, mocker.Mock(), offset_file)
+
+    rv = poller.poll_once(executor)
+
+    assert rv == 0
+    assert offset_file.load() == 0
+
+
+def test_poll_once_failing_update(mocker, offset_file, executor, fake_update_dict):
+    bot = mocker.Mock()
+    bot.get_updates.return_value = make_updates(fake_update_dict, [1, 2])
+    on_error = mocker.Mock()
+
+    def process_update(update):
+        if update.update_id == 1:
+            raise ValueError
+
+    poller = UpdatePoller(bot, process_update, offset_file, on_error=on_error)
+
+    poller.poll_once(executor)
+
+    assert offset_file.load() == 3
+    assert on_error.call_count == 1
@@ -0,0 +1,149 @@
+import threading
+
+import pytest
+from requests import ConnectionError
+
+from tululbot.utils.quote import QuoteEngine, QuoteIndex, QuotesNotLoaded, ShuffleBag
+
+
+QUOTES = '''quotes:
+  - quote: Tulul itu keren
+    author: Budi
+    author_bio: Anak tulul
+'''
+
+SEARCHED_QUOTES = [
+    {'quote': 'Tulul itu keren', 'author': 'Budi', 'author_bio': 'Anak tulul'},
+    {'quote': 'Gabut itu keren', 'author': 'Ani', 'author_bio': 'Teman Budi'},
+    {'quote': 'Gabut lagi', 'author': 'Budi Santoso', 'author_bio': 'Anak gabut'},
+]
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, text=QUOTES, etag='"v1"'):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {'ETag': etag} if etag is not None else {}
+
+    def raise_for_status(self):
+        pass
+
+
+def test_refresh_with_etag(mocker):
+    mock_get = mocker.patch('tululbot.utils.quote.http.get', autospec=True,
+                            side_effect=[FakeResponse(), FakeResponse(status_code=304)])
+    quote_engine = QuoteEngine()
+
+    assert quote_engine.refresh_cache()
+    assert not quote_engine.refresh_cache()
+
+    assert mock_get.call_args_list[0][1]['headers'] is None
+    assert mock_get.call_args_list[1][1]['headers'] == {'If-None-Match': '"v1"'}
+    assert quote_engine.retrieve_random() == 'Tulul itu keren - Budi, Anak tulul'
+    assert quote_engine.stats()['not_modified'] == 1
+
+
+def test_failed_refresh_keeps_quotes(mocker):
+    responses = [FakeResponse(), FakeResponse(text='quotes: []'), ConnectionError]
+    mocker.patch('tululbot.utils.quote.http.get', autospec=True, side_effect=responses)
+    quote_engine = QuoteEngine()
+    quote_engine.refresh_cache()
+
+    with pytest.raises(ValueError):
+        quote_engine.refresh_cache()
+    with pytest.raises(ConnectionError):
+        quote_engine.refresh_cache()
+
+    assert quote_engine.retrieve_random() == 'Tulul itu keren - Budi, Anak tulul'
+    assert quote_engine.etag == '"v1"'
+
+
+def test_refresh_with_incomplete_quotes(mocker):
+    text = '''quotes:
+  - quote: Tulul itu keren
+    author: Budi
+  - author: Ani
+    author_bio: Teman Budi
+'''
+    mocker.patch('tululbot.utils.quote.http.get', autospec=True,
+                 return_value=FakeResponse(text=text))
+    quote_engine = QuoteEngine()
+
+    assert quote_engine.refresh_cache()
+
+    assert quote_engine.cache == ['Tulul itu keren - Budi']
+
+
+def test_refresher(mocker):
+    release = threading.Event()
+
+    def get(url, headers):
+        release.wait(5)
+        return FakeResponse()
+
+    mock_get = mocker.patch('tululbot.utils.quote.http.get', autospec=True, side_effect=get)
+    quote_engine = QuoteEngine()
+    quote_engine.start_refresher(3600)
+    quote_engine.start_refresher(3600)
+
+    with pytest.raises(QuotesNotLoaded):
+        quote_engine.retrieve_random()
+    release.set()
+    for _ in range(100):
+        if quote_engine.cache:
+            break
+        threading.Event().wait(0.01)
+
+    assert quote_engine.retrieve_random() == 'Tulul itu keren - Budi, Anak tulul'
+    assert mock_get.call_count == 1
+
+
+def test_shuffle_bag_does_not_repeat():
+    bag = ShuffleBag(range(10))
+
+    first = [bag.pick() for _ in range(10)]
+    second = [bag.pick() for _ in range(10)]
+
+    assert sorted(first) == list(range(10))
+    assert sorted(second) == list(range(10))
+
+
+def test_snapshot(mocker, tmpdir):
+    mocker.patch('tululbot.utils.quote.http.get', autospec=True, return_value=FakeResponse())
+    path = str(tmpdir.join('quotes.json'))
+    QuoteEngine(snapshot_path=path).refresh_cache()
+    quote_engine = QuoteEngine(snapshot_path=path)
+
+    assert quote_engine.load_snapshot()
+    assert quote_engine.etag == '"v1"'
+    assert quote_engine.retrieve_random() == 'Tulul itu keren - Budi, Anak tulul'
+
+
+def test_missing_snapshot(tmpdir):
+    quote_engine = QuoteEngine(snapshot_path=str(tmpdir.join('quotes.json')))
+
+    assert not quote_engine.load_snapshot()
+    assert quote_engine.cache == []
+
+
+def test_index_search():
+    index = QuoteIndex.build(SEARCHED_QUOTES, lambda q: q['quote'])
+
+    assert index.search('keren') == ['Tulul itu keren', 'Gabut itu keren']
+    assert index.search('GABUT keren') == ['Gabut itu keren']
+    assert index.search('budi') == ['Tulul itu keren', 'Gabut itu keren', 'Gabut lagi']
+    assert index.search('@budi') == ['Tulul itu keren', 'Gabut lagi']
+    assert index.search('@budi santoso') == ['Gabut lagi']
+    assert index.search('kerja') == []
+    assert index.search('@') == []
+
+
+def test_search(mocker, tmpdir):
+    mocker.patch('tululbot.utils.quote.http.get', autospec=True, return_value=FakeResponse())
+    path = str(tmpdir.join('quotes.json'))
+    QuoteEngine(snapshot_path=path).refresh_cache()
+    quote_engine = QuoteEngine(snapshot_path=path)
+    quote_engine.load_snapshot()
+
+    assert quote_engine.search('@budi') == 'Tulul itu keren - Budi, Anak tulul'
+    assert quote_engine.search('@anak') is None
@@ -0,0 +1,126 @@
+from telebot import types
+import pytest
+
+from tululbot.utils.router import CommandRouter, extract_command_name
+
+
+def handler_a(message):
+    pass
+
+
+def handler_b(message):
+    pass
+
+
+def make_message(fake_message_dict, text, replied_text=None):
+    message = types.Message.de_json(dict(fake_message_dict, text=text))
+    if replied_text is not None:
+        replied_message = types.Message.de_json(fake_message_dict)
+        replied_message.text = replied_text
+        message.reply_to_message = replied_message
+    return message
+
+
+@pytest.mark.parametrize('text,expected', [
+    ('/leli', 'leli'),
+    ('/leli foo bar', 'leli'),
+    ('/leli@TululBot foo', 'leli'),
+    ('/leli\nfoo', 'leli'),
+    ('leli', None),
+    ('/', None),
+    ('/@TululBot', None),
+])
+def test_extract_command_name(text, expected):
+    assert extract_command_name(text) == expected
+
+
+class TestCommandRouter:
+
+    def test_route_command(self, fake_message_dict):
+        router = CommandRouter()
+        router.add_command('a', handler_a, regexp=r'^/a(@TululBot)?( .+)*$')
+        router.add_command('b', handler_b)
+
+        def route(text):
+            return router.route(make_message(fake_message_dict, text), lambda msg: True)
+
+        assert route('/a') is handler_a
+        assert route('/a@TululBot foo') is handler_a
+        assert route('/a@OtherBot foo') is None
+        assert route('/ab') is None
+        assert route('/b whatever') is handler_b
+        assert route('a') is None
+
+    def test_route_reply(self, fake_message_dict):
+        router = CommandRouter()
+        router.add_reply('Apa?', handler_a)
+
+        message = make_message(fake_message_dict, 'foo', replied_text='Apa?')
+        assert router.route(message, lambda msg: True) is handler_a
+        assert router.route(message, lambda msg: False) is None
+
+        message = make_message(fake_message_dict, 'foo', replied_text='Bukan')
+        assert router.route(message, lambda msg: True) is None
+
+    def test_route_reply_checks_bot_only_for_known_texts(self, fake_message_dict, mocker):
+        router = CommandRouter()
+        router.add_reply('Apa?', handler_a)
+        is_reply_to_bot = mocker.Mock(return_value=True)
+
+        router.route(make_message(fake_message_dict, 'foo', replied_text='Bukan'),
+                     is_reply_to_bot)
+
+        assert not is_reply_to_bot.called
+
+    def test_first_registered_wins(self, fake_message_dict):
+        router = CommandRouter()
+        router.add_reply('Apa?', handler_a)
+        router.add_command('b', handler_b)
+
+        message = make_message(fake_message_dict, '/b', replied_text='Apa?')
+        assert router.route(message, lambda msg: True) is handler_a
+
+        router = CommandRouter()
+        router.add_command('b', handler_b)
+        router.add_reply('Apa?', handler_a)
+
+        assert router.route(message, lambda msg: True) is handler_b
+
+    def test_non_text_message(self, fake_message_dict):
+        router = CommandRouter()
+        router.add_command('a', handler_a)
+        message = make_message(fake_message_dict, '/a')
+        message.content_type = 'sticker'
+
+        assert router.route(message, lambda msg: True) is None
+
+    def test_duplicate_registration(self):
+        router = CommandRouter()
+        router.add_command('a', handler_a)
+        router.add_reply('Apa?', handler_a)
+
+        with pytest.raises(ValueError):
+            router.add_command('a', handler_b)
+        with pytest.raises(ValueError):
+            router.add_reply('Apa?', handler_b)
+
+    def test_accepts(self, fake_message_dict):
+        router = CommandRouter()
+        router.add_command('a', handler_a, regexp=r'^/a$')
+        router.add_reply('Apa?', handler_b)
+
+        def accepts(text, replied_text=None, replied_user_id=1):
+            message_json = dict(fake_message_dict, text=text)
+            if replied_text is not None:
+                message_json['reply_to_message'] = dict(fake_message_dict, text=replied_text,
+                                                        **{'from': {'id': replied_user_id}})
+            return router.accepts(message_json, 1)
+
+        assert accepts('/a')
+        assert accepts('/a@TululBot foo')
+        assert not accepts('/b')
+        assert not accepts('a')
+        assert accepts('foo', replied_text='Apa?')
+        assert not accepts('foo', replied_text='Apa?', replied_user_id=2)
+        assert not accepts('foo', replied_text='Siapa?')
+        assert not router.accepts(fake_message_dict, 1)
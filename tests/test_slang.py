@@ -1,42 +1,45 @@
-from tululbot.utils.slang import lookup_kamusslang, lookup_urbandictionary, lookup_slang
+import json
+import threading
 
+import pytest
+from requests import ConnectionError, Timeout
+
+from tululbot.utils import slang
+from tululbot.utils.index import SortedIndex, write_index
+from tululbot.utils.slang import (first_urbandictionary_definition, lookup_kamusslang,
+                                  lookup_urbandictionary, lookup_slang, query_sources,
+                                  SourceStats)
 
-def test_lookup_kamusslang(mocker):
-    class FakeParagraph:
-        def __init__(self, strings):
-            self.strings = strings
 
-    strings = ['asdf', 'alsjdf', 'kfdg']
+@pytest.fixture(autouse=True)
+def clear_cache():
+    slang.cache.clear()
 
-    side_effect_pair = {
-        'close-word-suggestion-text': None,
-        'term-def': FakeParagraph(strings)
-    }
 
-    class FakeSoup:
-        def find(self, class_):
-            return side_effect_pair[class_]
+def test_lookup_kamusslang(mocker):
+    class FakeResponse:
+        text = ('<html><body><div class="term"><h1>jdflafj</h1>'
+                '<div class="term-def lead">asdf <b>alsjdf</b><div>kfdg</div></div>'
+                '<div class="term-def">lain</div></div></body></html>')
+
+        def raise_for_status(self):
+            pass
 
-    mocker.patch('tululbot.utils.slang.requests.get', autospec=True)
-    mocker.patch('tululbot.utils.slang.BeautifulSoup', return_value=FakeSoup(), autospec=True)
+    mocker.patch('tululbot.utils.slang.http.get', return_value=FakeResponse(), autospec=True)
 
     rv = lookup_kamusslang('jdflafj')
 
-    assert rv == ''.join(strings)
+    assert rv == 'asdf alsjdfkfdg'
 
 
 def test_lookup_kamusslang_no_definition_found(mocker):
-    side_effect_pair = {
-        'close-word-suggestion-text': None,
-        'term-def': None
-    }
+    class FakeResponse:
+        text = '<html><body><div class="term"><h1>jdflafj</h1></div></body></html>'
 
-    class FakeSoup:
-        def find(self, class_):
-            return side_effect_pair[class_]
+        def raise_for_status(self):
+            pass
 
-    mocker.patch('tululbot.utils.slang.requests.get', autospec=True)
-    mocker.patch('tululbot.utils.slang.BeautifulSoup', return_value=FakeSoup(), autospec=True)
+    mocker.patch('tululbot.utils.slang.http.get', return_value=FakeResponse(), autospec=True)
 
     rv = lookup_kamusslang('jdflafj')
 
@@ -44,22 +47,14 @@ def test_lookup_kamusslang_no_definition_found(mocker):
 
 
 def test_lookup_kamusslang_close_word_suggestion(mocker):
-    class FakeParagraph:
-        def __init__(self, strings):
-            self.strings = strings
+    class FakeResponse:
+        text = ('<html><body><div class="term-def">asdf</div>'
+                '<p class="close-word-suggestion-text">Apalah</p></body></html>')
 
-    strings = ['asdf', 'alsjdf', 'kfdg']
-    side_effect_pair = {
-        'close-word-suggestion-text': 'Apalah',
-        'term-def': FakeParagraph(strings)
-    }
+        def raise_for_status(self):
+            pass
 
-    class FakeSoup:
-        def find(self, class_):
-            return side_effect_pair[class_]
-
-    mocker.patch('tululbot.utils.slang.requests.get', autospec=True)
-    mocker.patch('tululbot.utils.slang.BeautifulSoup', return_value=FakeSoup(), autospec=True)
+    mocker.patch('tululbot.utils.slang.http.get', return_value=FakeResponse(), autospec=True)
 
     rv = lookup_kamusslang('jdflafj')
 
@@ -67,41 +62,51 @@ def test_lookup_kamusslang_close_word_suggestion(mocker):
 
 
 def test_lookup_urbandictionary(mocker):
-    fake_definition = [
-        {
-            'def': 'mmeeeeooowww',
-            'example': 'guk guk guk',
-            'word': 'kaing kaing'
-        },
-        {
-            'def': 'grrrrrrrr',
-            'example': 'tokkeeeeekk tokkeeeekk',
-            'word': 'aaauuuuuuuu'
-        }
-    ]
-    mocker.patch('tululbot.utils.slang.ud.define', return_value=fake_definition, autospec=True)
+    class FakeResponse:
+        text = json.dumps({'list': [
+            {'definition': '[mmeeeeooowww]\r\nguk', 'word': 'kaing kaing'},
+            {'definition': 'grrrrrrrr', 'word': 'aaauuuuuuuu'},
+        ]})
+
+        def raise_for_status(self):
+            pass
+
+    mock_get = mocker.patch('tululbot.utils.slang.http.get', return_value=FakeResponse(),
+                            autospec=True)
 
     rv = lookup_urbandictionary('eemmbeekk')
 
-    assert rv == fake_definition[0]['def']
+    assert rv == 'mmeeeeooowww\nguk'
+    mock_get.assert_called_once_with('https://api.urbandictionary.com/v0/define',
+                                     params={'term': 'eemmbeekk'})
 
 
 def test_lookup_urbandictionary_no_definition_found(mocker):
-    fake_no_definition = [
-        {
-            'def': "\nThere aren't any definitions for kimcil yet.\nCan you define it?\n",
-            'example': '',
-            'word': '¯\\_(ツ)_/¯\n'
-            }
-    ]
-    mocker.patch('tululbot.utils.slang.ud.define', return_value=fake_no_definition,
-                 autospec=True)
+    class FakeResponse:
+        text = '{"list": []}'
+
+        def raise_for_status(self):
+            pass
+
+    mocker.patch('tululbot.utils.slang.http.get', return_value=FakeResponse(), autospec=True)
 
     rv = lookup_urbandictionary('eemmbeekk')
 
     assert rv is None
 
 
+def test_first_urbandictionary_definition_of_reordered_response():
+    response_text = json.dumps({'result_type': 'exact', 'list': [{'definition': 'santai'}]})
+
+    assert first_urbandictionary_definition(response_text) == 'santai'
+
+
+def test_first_urbandictionary_definition_of_html_response():
+    response_text = '{"list": [<html>Captcha</html>'
+
+    assert first_urbandictionary_definition(response_text) is None
+
+
 def test_lookup_slang_when_only_urbandictionary_has_definition(mocker):
     fake_definition = 'soba ni itai yo'
     mocker.patch('tululbot.utils.slang.lookup_urbandictionary', return_value=fake_definition,
@@ -152,3 +157,111 @@ def test_lookup_slang_when_both_urbandictionary_and_kamusslang_have_definition(m
     ).format(fake_urbandict_def, fake_kamusslang_def)
 
     assert rv == fake_definition
+
+
+def test_lookup_slang_drops_source_late_for_deadline(mocker):
+    release = threading.Event()
+
+    def slow_lookup(word):
+        release.wait(5)
+        return 'telat'
+
+    mocker.patch('tululbot.utils.slang.lookup_urbandictionary', side_effect=slow_lookup,
+                 autospec=True)
+    mocker.patch('tululbot.utils.slang.lookup_kamusslang', return_value='cepet', autospec=True)
+    mocker.patch('tululbot.utils.slang.deadline', 0.05)
+    mocker.patch('tululbot.utils.slang.source_stats', SourceStats())
+
+    try:
+        rv = lookup_slang('kimochi')
+    finally:
+        release.set()
+
+    assert rv == 'cepet'
+    stats = slang.source_stats.stats()
+    assert stats['urbandictionary']['late'] == 1
+    assert stats['kamusslang']['lookups'] == 1
+
+
+def test_lookup_slang_ignores_failed_source(mocker):
+    mocker.patch('tululbot.utils.slang.lookup_urbandictionary', side_effect=ConnectionError,
+                 autospec=True)
+    mocker.patch('tululbot.utils.slang.lookup_kamusslang', return_value='cepet', autospec=True)
+    mocker.patch('tululbot.utils.slang.source_stats', SourceStats())
+
+    assert lookup_slang('kimochi') == 'cepet'
+    assert slang.source_stats.stats()['urbandictionary']['errors'] == 1
+
+
+def test_query_sources_raises_when_all_sources_fail():
+    def fail(word):
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        query_sources([('a', fail), ('b', fail)], 'kimochi', 1)
+
+
+def test_query_sources_raises_timeout_when_no_source_answers():
+    release = threading.Event()
+
+    def slow(word):
+        release.wait(5)
+
+    try:
+        with pytest.raises(Timeout):
+            query_sources([('a', slow)], 'kimochi', 0.01)
+    finally:
+        release.set()
+
+
+def test_lookup_slang_cached(mocker):
+    mock_urbandictionary = mocker.patch('tululbot.utils.slang.lookup_urbandictionary',
+                                        return_value='santai', autospec=True)
+    mocker.patch('tululbot.utils.slang.lookup_kamusslang', return_value=None, autospec=True)
+
+    lookup_slang('Selow')
+    rv = lookup_slang('selow')
+
+    assert rv == 'santai'
+    assert mock_urbandictionary.call_count == 1
+
+
+def test_lookup_slang_not_cached_when_source_failed(mocker):
+    mocker.patch('tululbot.utils.slang.lookup_urbandictionary', side_effect=ConnectionError,
+                 autospec=True)
+    mock_kamusslang = mocker.patch('tululbot.utils.slang.lookup_kamusslang',
+                                   return_value='santai', autospec=True)
+
+    lookup_slang('selow')
+    lookup_slang('selow')
+
+    assert mock_kamusslang.call_count == 2
+
+
+@pytest.fixture
+def lexicon(request, tmpdir, mocker):
+    path = str(tmpdir.join('slang.idx'))
+    write_index(path, [('gabut', 'Gaji buta'), ('galau', 'Gelisah'),
+                       ('baper', 'Bawa perasaan')])
+    lexicon = SortedIndex(path)
+    mocker.patch('tululbot.utils.slang.lexicon', lexicon)
+    request.addfinalizer(lexicon.close)
+    return lexicon
+
+
+def test_lookup_slang_from_lexicon(mocker, lexicon):
+    mock_urbandictionary = mocker.patch('tululbot.utils.slang.lookup_urbandictionary',
+                                        autospec=True)
+
+    assert lookup_slang(' Gabut ') == 'Gaji buta'
+    assert not mock_urbandictionary.called
+
+
+def test_lookup_slang_suggests_words_alike(mocker, lexicon):
+    mocker.patch('tululbot.utils.slang.lookup_urbandictionary', return_value=None,
+                 autospec=True)
+    mocker.patch('tululbot.utils.slang.lookup_kamusslang', return_value=None, autospec=True)
+
+    assert lookup_slang('gabud') == 'Gak nemu cuy. Maksud lu gabut?'
+    assert lookup_slang('bapermu') == 'Gak nemu cuy. Maksud lu baper?'
+    assert lookup_slang('xyz') == 'Gak nemu cuy'
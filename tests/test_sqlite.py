@@ -0,0 +1,26 @@
+import threading
+
+from tululbot.utils.sqlite import LocalConnection
+
+
+def test_connection_per_thread(tmpdir):
+    connection = LocalConnection(str(tmpdir.join('db.sqlite3')),
+                                 schema=('CREATE TABLE IF NOT EXISTS foo (bar TEXT)',))
+    conn = connection.get()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connection.get()))
+    thread.start()
+    thread.join()
+
+    assert connection.get() is conn
+    assert other[0] is not conn
+    assert conn.execute('SELECT COUNT(*) FROM foo').fetchone() == (0,)
+
+
+def test_reconnect_after_fork(mocker, tmpdir):
+    connection = LocalConnection(str(tmpdir.join('db.sqlite3')))
+    conn = connection.get()
+
+    mocker.patch('tululbot.utils.sqlite.os.getpid', return_value=-1)
+
+    assert connection.get() is not conn
@@ -0,0 +1,26 @@
+import pytest
+
+from tululbot.utils.stemmer import lemma_candidates
+
+
+@pytest.mark.parametrize('word,lemma', [
+    ('memakan', 'makan'),
+    ('dimakan', 'makan'),
+    ('makanan', 'makan'),
+    ('makanannya', 'makan'),
+    ('menyapu', 'sapu'),
+    ('mengirim', 'kirim'),
+    ('mengambil', 'ambil'),
+    ('memukul', 'pukul'),
+    ('berambut', 'rambut'),
+    ('memperbaiki', 'baik'),
+    ('keberhasilan', 'hasil'),
+    ('bacalah', 'baca'),
+    ('Bukumu', 'buku'),
+])
+def test_lemma_candidates(word, lemma):
+    assert lemma in lemma_candidates(word)
+
+
+def test_lemma_candidates_of_lemma():
+    assert lemma_candidates('buku') == ()
@@ -1,4 +1,8 @@
 import json
+import subprocess
+import sys
+
+import pytest
 
 
 def do_post(client, payload, content_type='application/json'):
@@ -8,6 +12,13 @@ def do_post(client, payload, content_type='application/json'):
                        content_type=content_type)
 
 
+@pytest.fixture
+def fake_update_dict(fake_update_dict):
+    """Return a fake Telegram update with a command message as dict."""
+    fake_update_dict['message']['text'] = '/who'
+    return fake_update_dict
+
+
 def test_not_json_content(client):
     payload = {
         'name': 'Foo',
@@ -35,3 +46,91 @@ def test_no_message_update(client, mocker, fake_update_dict):
     do_post(client, fake_update_dict)
 
     assert not mock_handle_new_message.called
+
+
+def test_update_without_command_is_skipped(client, mocker, fake_update_dict):
+    fake_update_dict['message']['text'] = 'wkwkwk'
+    mock_handle_new_message = mocker.patch('tululbot.bot.process_new_messages', autospec=True)
+    mock_de_json = mocker.patch('tululbot.types.Update.de_json', autospec=True)
+
+    rv = do_post(client, fake_update_dict)
+
+    assert rv.status_code == 200
+    assert not mock_de_json.called
+    assert not mock_handle_new_message.called
+
+
+def test_valid_update_pool_mode(client, mocker, fake_update_dict):
+    mocker.patch.dict(client.application.config, {'DISPATCH_MODE': 'pool'})
+    mock_submit = mocker.patch('tululbot.dispatcher.submit', autospec=True)
+
+    rv = do_post(client, fake_update_dict)
+
+    assert rv.status_code == 200
+    assert rv.get_data(as_text=True) == 'OK'
+    assert mock_submit.called
+
+
+def test_dispatch_queue_full(client, mocker, fake_update_dict):
+    from tululbot.utils.dispatch import QueueFull
+    mocker.patch.dict(client.application.config, {'DISPATCH_MODE': 'pool'})
+    mocker.patch('tululbot.dispatcher.submit', side_effect=QueueFull, autospec=True)
+
+    rv = do_post(client, fake_update_dict)
+
+    assert rv.status_code == 503
+
+
+def test_stats(client):
+    base_path = '/{}'.format(client.application.config['TELEGRAM_BOT_TOKEN'])
+
+    rv = client.get('{}/stats'.format(base_path.rstrip('/')))
+
+    assert rv.status_code == 200
+    assert 'queue_depth' in json.loads(rv.get_data(as_text=True))['dispatcher']
+
+
+def test_metrics(client, mocker, fake_message):
+    from tululbot import bot
+    fake_message.content_type = 'text'
+    fake_message.text = '/who'
+    mocker.patch('tululbot.commands.bot.reply_to', autospec=True)
+    mocker.patch.object(bot, 'threaded', False)
+    bot.process_new_messages([fake_message])
+
+    rv = client.get('/metrics')
+
+    assert rv.status_code == 200
+    assert rv.content_type.startswith('text/plain; version=0.0.4')
+    text = rv.get_data(as_text=True)
+    assert 'tululbot_handler_duration_seconds_count{handler="who"}' in text
+    assert 'tululbot_cache_hit_ratio{cache="leli"}' in text
+
+
+def test_duplicate_update(client, mocker, fake_update_dict):
+    mock_handle_new_message = mocker.patch('tululbot.bot.process_new_messages', autospec=True)
+
+    do_post(client, fake_update_dict)
+    rv = do_post(client, fake_update_dict)
+
+    assert rv.status_code == 200
+    assert mock_handle_new_message.call_count == 1
+
+
+def test_update_retried_after_queue_full(client, mocker, fake_update_dict):
+    from tululbot.utils.dispatch import QueueFull
+    mocker.patch.dict(client.application.config, {'DISPATCH_MODE': 'pool'})
+    mock_submit = mocker.patch('tululbot.dispatcher.submit', side_effect=[QueueFull, None],
+                               autospec=True)
+
+    assert do_post(client, fake_update_dict).status_code == 503
+    assert do_post(client, fake_update_dict).status_code == 200
+    assert mock_submit.call_count == 2
+
+
+def test_heavy_modules_are_not_imported_with_the_app():
+    code = ('import sys, tululbot; '
+            'print(sorted({"bs4", "yaml"} & set(sys.modules)))')
+    output = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+
+    assert output.strip() == '[]'
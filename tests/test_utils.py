@@ -1,6 +1,7 @@
 from telebot import types
 
 from tululbot.utils import TululBot
+from tululbot.utils.outbox import PRIORITY_NOTIFICATION, PRIORITY_REPLY
 
 
 class TestTululBot:
@@ -15,6 +16,44 @@ class TestTululBot:
         assert rv == fake_user
         mock_get_me.assert_called_once_with()
 
+    def test_user_id_from_token(self, mocker, fake_message_dict, fake_user_dict):
+        bot = TululBot('12345:TOKEN')
+        mock_get_me = mocker.patch.object(bot, 'get_me', autospec=True)
+        fake_message = types.Message.de_json(fake_message_dict)
+        fake_message.reply_to_message = types.Message.de_json(fake_message_dict)
+        fake_message.reply_to_message.from_user = types.User.de_json(fake_user_dict)
+
+        assert bot.user_id == 12345
+        assert bot.is_reply_to_bot_user(fake_message)
+        assert not mock_get_me.called
+
+    def test_user_id_from_config(self):
+        bot = TululBot('12345:TOKEN', user_id=67890)
+
+        assert bot.user_id == 67890
+
+    def test_user_id_from_get_me(self, mocker, fake_message_dict, fake_user):
+        bot = TululBot('TOKEN')
+        mock_get_me = mocker.patch.object(bot, 'get_me', autospec=True,
+                                          return_value=fake_user)
+        fake_message = types.Message.de_json(fake_message_dict)
+        fake_message.reply_to_message = types.Message.de_json(fake_message_dict)
+        fake_message.reply_to_message.from_user = fake_user
+
+        assert bot.is_reply_to_bot_user(fake_message)
+        assert bot.is_reply_to_bot_user(fake_message)
+        mock_get_me.assert_called_once_with()
+
+    def test_ensure_webhook(self, mocker):
+        bot = TululBot('TOKEN')
+        webhook_info = mocker.Mock(url='https://example.com/TOKEN')
+        mocker.patch.object(bot, 'get_webhook_info', autospec=True, return_value=webhook_info)
+        mock_set_webhook = mocker.patch.object(bot, 'set_webhook', autospec=True)
+
+        assert not bot.ensure_webhook('https://example.com/TOKEN')
+        assert bot.ensure_webhook('https://example.com/OTHER')
+        mock_set_webhook.assert_called_once_with('https://example.com/OTHER')
+
     def test_create_is_reply_to_filter(self, mocker, fake_message_dict, fake_user_dict):
         fake_replied_message_dict = fake_message_dict.copy()
 
@@ -32,3 +71,75 @@ class TestTululBot:
 
         assert bot.create_is_reply_to_filter(bot_message)(fake_message)
         assert not bot.create_is_reply_to_filter('foo bar')(fake_message)
+
+    def test_process_new_messages_routes_commands(self, mocker, fake_message):
+        bot = TululBot('TOKEN', threaded=False)
+        handler = mocker.Mock()
+        bot.command_handler('foo', regexp=r'^/foo$')(handler)
+        fake_message.content_type = 'text'
+        fake_message.text = '/foo'
+
+        bot.process_new_messages([fake_message])
+
+        handler.assert_called_once_with(fake_message)
+
+    def test_process_new_messages_routes_replies(self, mocker, fake_message_dict,
+                                                 fake_user_dict):
+        bot = TululBot('TOKEN', threaded=False)
+        bot.user = types.User.de_json(fake_user_dict)
+        handler = mocker.Mock()
+        bot.reply_handler('Apa?')(handler)
+        fake_message = types.Message.de_json(fake_message_dict)
+        fake_replied_message = types.Message.de_json(fake_message_dict)
+        fake_replied_message.text = 'Apa?'
+        fake_replied_message.from_user = bot.user
+        fake_message.content_type = 'text'
+        fake_message.text = 'foo'
+        fake_message.reply_to_message = fake_replied_message
+
+        bot.process_new_messages([fake_message])
+
+        handler.assert_called_once_with(fake_message)
+
+    def test_process_new_messages_falls_back_to_message_handlers(self, mocker, fake_message):
+        bot = TululBot('TOKEN', threaded=False)
+        handler = mocker.Mock()
+        bot.message_handler(func=lambda message: True)(handler)
+        fake_message.content_type = 'text'
+        fake_message.text = 'foo'
+
+        bot.process_new_messages([fake_message])
+
+        handler.assert_called_once_with(fake_message)
+
+    def test_send_message_with_outbox(self, mocker):
+        outbox = mocker.Mock()
+        bot = TululBot('TOKEN', outbox=outbox)
+
+        rv = bot.send_message(123, 'foo', reply_to_message_id=456)
+
+        assert rv is None
+        chat_id, send, args, kwargs = outbox.put.call_args[0]
+        assert chat_id == 123
+        assert args == (123, 'foo')
+        assert kwargs['reply_to_message_id'] == 456
+        assert outbox.put.call_args[1] == {'priority': PRIORITY_REPLY}
+
+    def test_notification_with_outbox(self, mocker):
+        outbox = mocker.Mock()
+        bot = TululBot('TOKEN', outbox=outbox)
+
+        bot.send_message(123, 'foo')
+
+        assert outbox.put.call_args[1] == {'priority': PRIORITY_NOTIFICATION}
+
+    def test_send_message_without_outbox(self, mocker):
+        mock_send_message = mocker.patch('tululbot.utils.TeleBot.send_message', autospec=True)
+        bot = TululBot('TOKEN')
+
+        bot.send_message(123, 'foo', parse_mode='Markdown')
+
+        mock_send_message.assert_called_once_with(bot, 123, 'foo',
+                                                  disable_web_page_preview=None,
+                                                  reply_to_message_id=None,
+                                                  parse_mode='Markdown')
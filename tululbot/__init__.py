@@ -1,13 +1,66 @@
+import atexit
+import threading
 import traceback
 
-from flask import Flask, abort, request
+from flask import Flask, Response, abort, jsonify, request
 app = Flask(__name__)
 app.config.from_object('{}.config'.format(__name__))
 
 from telebot import types  # noqa: E402
 
-from tululbot.utils import TululBot  # noqa: E402
-bot = TululBot(app.config['TELEGRAM_BOT_TOKEN'])  # Must be before importing commands
+from tululbot.utils import TululBot, http, kbbi, leli, slang  # noqa: E402
+from tululbot.utils.cache import SQLiteTTLCache, TTLCache  # noqa: E402
+from tululbot.utils.dedup import RecentUpdateIds, SQLiteRecentUpdateIds  # noqa: E402
+from tululbot.utils.dispatch import QueueFull, UpdateDispatcher  # noqa: E402
+from tululbot.utils.index import SortedIndex  # noqa: E402
+from tululbot.utils.metrics import CONTENT_TYPE, registry  # noqa: E402
+from tululbot.utils.outbox import Outbox  # noqa: E402
+
+
+def make_cache(namespace, max_size, ttl):
+    if app.config['CACHE_BACKEND'] == 'sqlite':
+        return SQLiteTTLCache(app.config['CACHE_SQLITE_PATH'], namespace, max_size=max_size,
+                              ttl=ttl)
+    return TTLCache(max_size=max_size, ttl=ttl)
+
+
+def open_index(path, command):
+    try:
+        return SortedIndex(path)
+    except (OSError, ValueError) as e:
+        app.logger.warning('Cannot open the index of /%s: %s', command, e)
+        return None
+
+
+http.client.timeout = (app.config['HTTP_CONNECT_TIMEOUT'], app.config['HTTP_READ_TIMEOUT'])
+leli.cache = make_cache('leli', app.config['LELI_CACHE_SIZE'], app.config['LELI_CACHE_TTL'])
+leli.not_found_ttl = app.config['LELI_CACHE_NOT_FOUND_TTL']
+slang.cache = make_cache('slang', app.config['SLANG_CACHE_SIZE'],
+                         app.config['SLANG_CACHE_TTL'])
+slang.deadline = app.config['SLANG_DEADLINE']
+kbbi.cache = make_cache('kbbi', app.config['KBBI_CACHE_SIZE'], app.config['KBBI_CACHE_TTL'])
+if app.config['LELI_INDEX_PATH']:
+    leli.abstracts = open_index(app.config['LELI_INDEX_PATH'], 'leli')
+if app.config['SLANG_LEXICON_PATH']:
+    slang.lexicon = open_index(app.config['SLANG_LEXICON_PATH'], 'slang')
+if app.config['KBBI_INDEX_PATH']:
+    kbbi.dictionary = open_index(app.config['KBBI_INDEX_PATH'], 'kbbi')
+
+if app.config['OUTBOX_ENABLED']:
+    outbox = Outbox(global_rate=app.config['OUTBOX_GLOBAL_RATE'],
+                    chat_rate=app.config['OUTBOX_CHAT_RATE'],
+                    chat_burst=app.config['OUTBOX_CHAT_BURST'])
+    # Exit functions run last in, first out, so this one runs after the dispatcher has drained
+    atexit.register(outbox.shutdown, timeout=app.config['DISPATCH_SHUTDOWN_TIMEOUT'])
+else:
+    outbox = None
+
+# When dispatching on our own bounded pool, handlers must run on that pool too instead of
+# being handed off again to the unbounded pool of TeleBot
+use_telebot_pool = app.config['DISPATCH_MODE'] != 'pool'
+bot = TululBot(app.config['TELEGRAM_BOT_TOKEN'], threaded=use_telebot_pool,
+               outbox=outbox,
+               user_id=app.config['TELEGRAM_BOT_ID'])  # Must be before importing commands
 
 from tululbot import commands  # noqa
 
@@ -19,30 +72,135 @@ webhook_url_base = app.config['WEBHOOK_HOST']
 app.logger.setLevel(app.config['LOG_LEVEL'])
 
 
+def process_message(message):
+    bot.process_new_messages([message])
+
+
+def process_update(update):
+    if update.message is not None:
+        process_message(update.message)
+
+
+def notify_devel_chat():
+    if app.config['TULULBOT_DEVEL_CHAT_ID']:
+        chat_id = app.config['TULULBOT_DEVEL_CHAT_ID']
+        bot.send_message(chat_id, traceback.format_exc())
+
+
+dispatcher = UpdateDispatcher(process_message,
+                              num_workers=app.config['DISPATCH_WORKERS'],
+                              queue_size=app.config['DISPATCH_QUEUE_SIZE'],
+                              on_error=notify_devel_chat)
+atexit.register(dispatcher.shutdown, timeout=app.config['DISPATCH_SHUTDOWN_TIMEOUT'])
+
+if app.config['DEDUP_BACKEND'] == 'sqlite':
+    recent_update_ids = SQLiteRecentUpdateIds(app.config['DEDUP_SQLITE_PATH'],
+                                              ttl=app.config['DEDUP_TTL'],
+                                              max_size=app.config['DEDUP_MAX_SIZE'])
+else:
+    recent_update_ids = RecentUpdateIds(ttl=app.config['DEDUP_TTL'],
+                                        max_size=app.config['DEDUP_MAX_SIZE'])
+
+
+def dispatch(message):
+    if app.config['DISPATCH_MODE'] != 'pool':
+        process_message(message)
+    else:
+        dispatcher.submit(message)
+
+
 @app.route(webhook_url_path, methods=['POST'])
 def main():
     json_data = request.get_json(silent=True)
     if json_data is not None:
+        message_json = json_data.get('message')
+        if message_json is None or not bot.accepts_message_json(message_json):
+            return 'OK'
+
+        update_id = json_data.get('update_id')
+        if update_id is not None and not recent_update_ids.add(update_id):
+            app.logger.debug('Skip duplicate update with id %s', update_id)
+            return 'OK'
+
         update = types.Update.de_json(json_data)
         app.logger.debug('Get an update with id %s', update.update_id)
         if update.message is not None:
             app.logger.debug('Get message with id: %s, content: %s',
                              update.message.message_id,
                              update.message.text)
-            bot.process_new_messages([update.message])
+            try:
+                dispatch(update.message)
+            except QueueFull as e:
+                # Forget the update so that the retry from Telegram is processed
+                app.logger.warning('Cannot dispatch update %s: %s', update.update_id, e)
+                recent_update_ids.discard(update.update_id)
+                abort(503)
         return 'OK'
     else:
         abort(403)
 
 
+@app.route('{}/stats'.format(webhook_url_path.rstrip('/')), methods=['GET'])
+def stats():
+    return jsonify(dispatcher=dispatcher.stats(), dedup=recent_update_ids.stats(),
+                   outbox=outbox.stats() if outbox is not None else None,
+                   http=http.stats(), leli_cache=leli.cache.stats(),
+                   slang=slang.source_stats.stats(), slang_cache=slang.cache.stats(),
+                   kbbi_cache=kbbi.cache.stats(),
+                   kbbi_stemmer=kbbi.stemmer_stats(), quote=commands.quote_engine.stats())
+
+
+def collect_cache_metrics():
+    stats = [(name, cache.stats()) for name, cache in (('leli', leli.cache),
+                                                       ('slang', slang.cache),
+                                                       ('kbbi', kbbi.cache))]
+    yield ('tululbot_cache_hits_total', 'counter', 'Lookups answered from the cache.',
+           [([('cache', name)], cache_stats['hits']) for name, cache_stats in stats])
+    yield ('tululbot_cache_misses_total', 'counter', 'Lookups not answered from the cache.',
+           [([('cache', name)], cache_stats['misses']) for name, cache_stats in stats])
+    yield ('tululbot_cache_hit_ratio', 'gauge', 'Share of lookups answered from the cache.',
+           [([('cache', name)], hit_ratio(cache_stats)) for name, cache_stats in stats])
+
+
+def hit_ratio(cache_stats):
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    return cache_stats['hits'] / lookups if lookups else 0.0
+
+
+registry.add_collector(collect_cache_metrics)
+
+
+@app.route(app.config['METRICS_PATH'], methods=['GET'])
+def metrics():
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
 @app.errorhandler(500)
 def handle_uncaught_exception(error):  # pragma: no cover
-    if app.config['TULULBOT_DEVEL_CHAT_ID']:
-        chat_id = app.config['TULULBOT_DEVEL_CHAT_ID']
-        bot.send_message(chat_id, traceback.format_exc())
+    notify_devel_chat()
 
     return 'OK'
 
 
-if app.config['APP_ENV'] != 'development':  # pragma: no cover
-    bot.set_webhook('{}{}'.format(webhook_url_base, webhook_url_path))
+def register_webhook():
+    url = '{}{}'.format(webhook_url_base, webhook_url_path)
+    try:
+        if bot.ensure_webhook(url):
+            app.logger.info('Set webhook to %s', url)
+    except Exception:
+        app.logger.exception('Cannot set webhook to %s', url)
+
+
+# Talking to Telegram must not hold up the import of the app by the workers
+if (app.config['APP_ENV'] != 'development' and
+        app.config['WEBHOOK_SETUP'] == 'background'):  # pragma: no cover
+    threading.Thread(target=register_webhook, name='RegisterWebhook', daemon=True).start()
+
+# So that /quote answers right away, and the first refresh is likely a 304
+commands.quote_engine.snapshot_path = app.config['QUOTE_SNAPSHOT_PATH']
+if commands.quote_engine.snapshot_path:
+    commands.quote_engine.load_snapshot()
+# Nor must /quote wait on GitHub
+if (app.config['APP_ENV'] != 'development' and
+        app.config['QUOTE_REFRESH_INTERVAL']):  # pragma: no cover
+    commands.quote_engine.start_refresher(app.config['QUOTE_REFRESH_INTERVAL'])
@@ -0,0 +1,511 @@
+"""Serve the webhook with asyncio instead of Flask.
+
+Command handlers run as coroutines and every upstream lookup and Telegram
+request goes through one non-blocking aiohttp session, so a slow Wikipedia or
+kamusslang holds a task instead of a whole worker and one process can keep
+hundreds of lookups in flight. Commands without a coroutine handler here run
+their sync handler from `tululbot.commands` on a thread.
+
+Needs the packages in requirements-aio.txt, which require a newer Python than
+the Flask app. Run with ``manage.py runaio``.
+"""
+import asyncio
+import json
+import logging
+import time
+import traceback
+
+import aiohttp
+from aiohttp import web
+from telebot import apihelper, types
+from telebot.apihelper import ApiException
+
+from tululbot import app, bot, recent_update_ids, webhook_url_path
+from tululbot import commands
+from tululbot.utils import handler_duration, handler_errors, http, kbbi, leli, slang
+from tululbot.utils.cache import MISSING
+from tululbot.utils.metrics import CONTENT_TYPE, registry
+from tululbot.utils.quote import QuotesNotLoaded
+
+
+logger = logging.getLogger(__name__)
+
+# Errors of an upstream answering with an error status, and of an upstream that cannot be
+# reached or does not answer in time; the same as HTTPError and (ConnectionError, Timeout)
+# in the sync handlers
+UPSTREAM_HTTP_ERRORS = (aiohttp.ClientResponseError,)
+UPSTREAM_CONNECTION_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+class AsyncHTTPClient:
+    """Non-blocking counterpart of `tululbot.utils.http.HTTPClient`.
+
+    The session is created by `start`, from inside the event loop.
+    """
+
+    def __init__(self, timeout=None, connections_per_host=100):
+        connect_timeout, read_timeout = timeout or http_timeout()
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self.connections_per_host = connections_per_host
+        self.session = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.connections_per_host)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def request(self, method, url, **kwargs):
+        """Return the status code and the body of the response."""
+        upstream = http.upstream_name(url)
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, url, **kwargs) as response:
+                return response.status, await response.text()
+        except UPSTREAM_CONNECTION_ERRORS:
+            http.upstream_errors.inc(upstream)
+            raise
+        finally:
+            http.upstream_duration.observe(time.perf_counter() - start, upstream)
+
+    async def get_text(self, url, params=None):
+        """Return the body of the response, raising ClientResponseError on an error status."""
+        status, text = await self.request('GET', url, params=params)
+        if status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=status, message=text)
+        return text
+
+
+async def call_store(store, function, *args):
+    """Call `function` of a cache or of the dedup store, on a thread if `store` is blocking.
+
+    Stores in SQLite are blocking, and must not hold up the event loop.
+    """
+    if not getattr(store, 'blocking', False):
+        return function(*args)
+    return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+
+def http_timeout():
+    return app.config['HTTP_CONNECT_TIMEOUT'], app.config['HTTP_READ_TIMEOUT']
+
+
+class AsyncTelegram:
+    """The few Telegram methods the handlers need, on top of an `AsyncHTTPClient`."""
+
+    def __init__(self, token, client):
+        self.token = token
+        self.client = client
+
+    async def call(self, method_name, params=None):
+        url = apihelper.API_URL.format(self.token, method_name)
+        data = {key: str(value) for key, value in (params or {}).items() if value}
+        status, text = await self.client.request('POST', url, data=data)
+        try:
+            result = json.loads(text)
+        except ValueError:
+            raise ApiException('The server returned HTTP {} with an invalid JSON '
+                               'response'.format(status), method_name, text)
+        if status != 200 or not result['ok']:
+            raise ApiException('Error code: {} Description: {}'.format(
+                result.get('error_code'), result.get('description')), method_name, text)
+        return result['result']
+
+    async def get_me(self):
+        return types.User.de_json(await self.call('getMe'))
+
+    async def send_message(self, chat_id, text, disable_web_page_preview=None,
+                           reply_to_message_id=None, reply_markup=None, parse_mode=None):
+        return await self.call('sendMessage', {
+            'chat_id': chat_id,
+            'text': text,
+            'disable_web_page_preview': disable_web_page_preview,
+            'reply_to_message_id': reply_to_message_id,
+            'reply_markup': reply_markup.to_json() if reply_markup is not None else None,
+            'parse_mode': parse_mode,
+        })
+
+    async def reply_to(self, message, text, force_reply=False, **kwargs):
+        if force_reply:
+            kwargs['reply_markup'] = types.ForceReply(selective=True)
+        return await self.send_message(message.chat.id, text,
+                                       reply_to_message_id=message.message_id, **kwargs)
+
+    async def forward_message(self, chat_id, from_chat_id, message_id):
+        return await self.call('forwardMessage', {
+            'chat_id': chat_id,
+            'from_chat_id': from_chat_id,
+            'message_id': message_id,
+        })
+
+
+class AsyncTululBot:
+    """Run the commands of `bot` as tasks, at most `max_tasks` at a time."""
+
+    def __init__(self, client, telegram, max_tasks=500):
+        self.client = client
+        self.telegram = telegram
+        self.max_tasks = max_tasks
+        self.tasks = set()
+        # Handlers are routed by `bot.router`, then replaced by these by name
+        self.handlers = {
+            commands.leli.__name__: self.leli,
+            commands.quote.__name__: self.quote,
+            commands.who.__name__: self.who,
+            commands.slang.__name__: self.slang,
+            commands.hotline.__name__: self.hotline,
+            commands.hbd.__name__: self.hbd,
+            commands.kbbi.__name__: self.kbbi,
+            commands.eid.__name__: self.eid,
+            commands.xmas.__name__: self.xmas,
+            commands.kawin.__name__: self.kawin,
+            commands.tampol.__name__: self.tampol,
+        }
+
+        self._handled = 0
+        self._failed = 0
+        self._rejected = 0
+        self._max_tasks_in_flight = 0
+
+    async def handle_webhook(self, request):
+        try:
+            json_data = await request.json()
+        except ValueError:
+            raise web.HTTPForbidden()
+
+        message_json = json_data.get('message')
+        if message_json is None or not bot.accepts_message_json(message_json):
+            return web.Response(text='OK')
+
+        update_id = json_data.get('update_id')
+        if (update_id is not None and
+                not await call_store(recent_update_ids, recent_update_ids.add, update_id)):
+            logger.debug('Skip duplicate update with id %s', update_id)
+            return web.Response(text='OK')
+
+        update = types.Update.de_json(json_data)
+        if update.message is not None and not self.dispatch(update.message):
+            # Forget the update so that the retry from Telegram is processed
+            logger.warning('Cannot dispatch update %s: too many tasks', update.update_id)
+            await call_store(recent_update_ids, recent_update_ids.discard, update.update_id)
+            raise web.HTTPServiceUnavailable()
+        return web.Response(text='OK')
+
+    async def handle_stats(self, request):
+        # Stores in SQLite are queried for their size
+        stats = await asyncio.get_event_loop().run_in_executor(None, lambda: {
+            'aio': self.stats(), 'dedup': recent_update_ids.stats(),
+            'leli_cache': leli.cache.stats(),
+            'slang': slang.source_stats.stats(),
+            'slang_cache': slang.cache.stats(),
+            'kbbi_cache': kbbi.cache.stats(),
+            'kbbi_stemmer': kbbi.stemmer_stats(),
+            'quote': commands.quote_engine.stats()})
+        return web.json_response(stats)
+
+    async def handle_metrics(self, request):
+        text = await asyncio.get_event_loop().run_in_executor(None, registry.render)
+        return web.Response(body=text.encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    async def on_startup(self, web_app):
+        await self.client.start()
+        # Do not block the event loop on `bot.get_me` when routing the first reply
+        if bot.user_id is None:
+            bot.user = await self.telegram.get_me()
+
+    async def on_cleanup(self, web_app):
+        await self.wait_tasks(timeout=app.config['DISPATCH_SHUTDOWN_TIMEOUT'])
+        await self.client.close()
+
+    def dispatch(self, message):
+        """Start handling `message` in a task and return whether it was accepted."""
+        if len(self.tasks) >= self.max_tasks:
+            self._rejected += 1
+            return False
+
+        task = asyncio.ensure_future(self.handle(message))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        self._max_tasks_in_flight = max(self._max_tasks_in_flight, len(self.tasks))
+        return True
+
+    async def handle(self, message):
+        handler = bot.router.route(message, bot.is_reply_to_bot_user)
+        if handler is None:
+            return
+
+        start = time.perf_counter()
+        try:
+            coroutine_handler = self.handlers.get(handler.__name__)
+            if coroutine_handler is not None:
+                await coroutine_handler(message)
+            else:
+                await asyncio.get_event_loop().run_in_executor(None, handler, message)
+        except Exception:
+            self._failed += 1
+            handler_errors.inc(handler.__name__)
+            logger.exception('Cannot handle message %s', message.message_id)
+            await self.notify_devel_chat(traceback.format_exc())
+        else:
+            self._handled += 1
+        finally:
+            handler_duration.observe(time.perf_counter() - start, handler.__name__)
+
+    async def notify_devel_chat(self, text):
+        if app.config['TULULBOT_DEVEL_CHAT_ID']:
+            try:
+                await self.telegram.send_message(app.config['TULULBOT_DEVEL_CHAT_ID'], text)
+            except Exception:
+                logger.exception('Cannot notify the devel chat')
+
+    async def wait_tasks(self, timeout=None):
+        if self.tasks:
+            await asyncio.wait(list(self.tasks), timeout=timeout)
+        if self.tasks:
+            logger.warning('%s tasks are still running after shutdown timeout',
+                           len(self.tasks))
+
+    def stats(self):
+        return {
+            'max_tasks': self.max_tasks,
+            'tasks_in_flight': len(self.tasks),
+            'max_tasks_in_flight': self._max_tasks_in_flight,
+            'handled': self._handled,
+            'failed': self._failed,
+            'rejected': self._rejected,
+        }
+
+    async def search_on_wikipedia(self, term):
+        key = leli.normalize_term(term)
+        result = leli.lookup_abstract(key)
+        if result is not None:
+            return result
+
+        result = await call_store(leli.cache, leli.cache.get, key)
+        if result is not MISSING:
+            return result
+
+        search_url = '{}/w/index.php'.format(leli.WIKIPEDIA_URL)
+        page = await self.client.get_text(search_url, params=dict(search=term))
+        result, disambiguation_url = leli.parse_search_page(page)
+        if disambiguation_url is not None:
+            result = await call_store(leli.cache, leli.cache.get, disambiguation_url)
+            if result is MISSING:
+                page = await self.client.get_text(disambiguation_url)
+                result = leli.parse_disambiguated_page(page)
+                await call_store(leli.cache, leli.cache_result, disambiguation_url, result)
+
+        await call_store(leli.cache, leli.cache_result, key, result)
+        return result
+
+    async def lookup_slang(self, word):
+        """Like `tululbot.utils.slang.lookup_slang`, but late sources are cancelled."""
+        key = slang.normalize_word(word)
+        definition = slang.lookup_lexicon(key)
+        if definition is not None:
+            return definition
+
+        definition = await call_store(slang.cache, slang.cache.get, key)
+        if definition is not MISSING:
+            return definition or slang.not_found_text(word)
+
+        tasks = [(name, asyncio.ensure_future(self.timed_lookup(name, lookup(word))))
+                 for name, lookup in (('urbandictionary', self.lookup_urbandictionary),
+                                      ('kamusslang', self.lookup_kamusslang))]
+        await asyncio.wait([task for _, task in tasks], timeout=slang.deadline)
+
+        definitions = {}
+        errors = []
+        for name, task in tasks:
+            if not task.done():
+                slang.source_stats.record_late(name)
+                task.cancel()
+            elif task.exception() is not None:
+                errors.append(task.exception())
+            else:
+                definitions[name] = task.result()
+
+        if not definitions:
+            if errors:
+                raise errors[0]
+            raise asyncio.TimeoutError()
+        definition = await call_store(slang.cache, slang.cache_definitions, key, definitions)
+        return definition or slang.not_found_text(word)
+
+    async def timed_lookup(self, source, lookup):
+        start = time.monotonic()
+        try:
+            result = await lookup
+        except Exception:
+            slang.source_stats.record(source, time.monotonic() - start, error=True)
+            raise
+        slang.source_stats.record(source, time.monotonic() - start)
+        return result
+
+    async def lookup_urbandictionary(self, word):
+        text = await self.client.get_text(slang.URBANDICT_API_URL, params=dict(term=word))
+        return slang.first_urbandictionary_definition(text)
+
+    async def lookup_kamusslang(self, word):
+        try:
+            page = await self.client.get_text(slang.kamusslang_url(word))
+        except UPSTREAM_HTTP_ERRORS:
+            return None
+        return slang.parse_kamusslang(page)
+
+    async def lookup_kbbi_definition(self, term):
+        key = term.casefold()
+        defs = await self.lookup_kbbi_term(key)
+        if not defs:
+            for lemma in kbbi.lemma_lookups(key):
+                defs = await self.lookup_kbbi_term(lemma)
+                if defs:
+                    break
+        return defs
+
+    async def lookup_kbbi_term(self, key):
+        if kbbi.dictionary is not None:
+            return kbbi.lookup_dictionary(key)
+
+        defs = await call_store(kbbi.cache, kbbi.cache.get, key)
+        if defs is not MISSING:
+            return defs
+
+        text = await self.client.get_text(kbbi.KATEGLO_API_URL,
+                                          params=kbbi.kateglo_params(key))
+        try:
+            json_response = json.loads(text)
+        except ValueError:
+            defs = []
+        else:
+            defs = kbbi.to_defs(json_response)
+        await call_store(kbbi.cache, kbbi.cache.set, key, defs)
+        return defs
+
+    async def retrieve_quote(self, query):
+        quote_engine = commands.quote_engine
+        if not quote_engine.cache and quote_engine.refresh_interval is None:
+            quote_engine.load(await self.client.get_text(quote_engine.quote_url))
+
+        return commands.retrieve_quote(query)
+
+    async def leli(self, message):
+        term = commands.extract_argument(message.text, '/leli')
+        if term is None:
+            await self.telegram.reply_to(message, commands.LELI_PROMPT, force_reply=True)
+            return
+
+        try:
+            result = await self.search_on_wikipedia(term)
+        except UPSTREAM_HTTP_ERRORS:
+            await self.telegram.reply_to(message, commands.HTTP_ERROR_TEXT)
+        except UPSTREAM_CONNECTION_ERRORS:
+            await self.telegram.reply_to(message, commands.CONNECTION_ERROR_TEXT)
+        else:
+            if result is None:
+                result = leli.search_on_google(term)
+            await self.telegram.reply_to(message, result, disable_web_page_preview=True)
+
+    async def quote(self, message):
+        try:
+            random_quote = await self.retrieve_quote(
+                commands.extract_argument(message.text, '/quote'))
+        except UPSTREAM_HTTP_ERRORS:
+            await self.telegram.reply_to(message, commands.HTTP_ERROR_TEXT)
+        except UPSTREAM_CONNECTION_ERRORS + (QuotesNotLoaded,):
+            await self.telegram.reply_to(message, commands.CONNECTION_ERROR_TEXT)
+        else:
+            await self.telegram.reply_to(message, random_quote)
+
+    async def who(self, message):
+        await self.telegram.reply_to(message, commands.ABOUT_TEXT,
+                                     disable_web_page_preview=True)
+
+    async def slang(self, message):
+        term = commands.extract_argument(message.text, '/slang')
+        if term is None:
+            await self.telegram.reply_to(message, commands.SLANG_PROMPT, force_reply=True)
+            return
+
+        try:
+            definition = await self.lookup_slang(term)
+        except UPSTREAM_HTTP_ERRORS:
+            await self.telegram.reply_to(message, commands.HTTP_ERROR_TEXT)
+        except UPSTREAM_CONNECTION_ERRORS:
+            await self.telegram.reply_to(message, commands.CONNECTION_ERROR_TEXT)
+        else:
+            await self.telegram.reply_to(message, definition, parse_mode='Markdown')
+
+    async def hotline(self, message):
+        if commands.HOTLINE_MESSAGE_ID is not None:
+            await self.telegram.forward_message(message.chat.id, message.chat.id,
+                                                commands.HOTLINE_MESSAGE_ID)
+
+    async def hbd(self, message):
+        name = commands.extract_argument(message.text, '/hbd')
+        if name is None:
+            await self.telegram.reply_to(message, commands.HBD_PROMPT, force_reply=True)
+        else:
+            await self.telegram.send_message(message.chat.id, commands.hbd_greeting(name))
+
+    async def kbbi(self, message):
+        term = commands.extract_argument(message.text, '/kbbi')
+        if term is None:
+            await self.telegram.reply_to(message, commands.KBBI_PROMPT, force_reply=True)
+            return
+
+        try:
+            defs = await self.lookup_kbbi_definition(term)
+        except UPSTREAM_HTTP_ERRORS:
+            await self.telegram.reply_to(message, commands.HTTP_ERROR_TEXT)
+        except UPSTREAM_CONNECTION_ERRORS:
+            await self.telegram.reply_to(message, commands.CONNECTION_ERROR_TEXT)
+        else:
+            if defs:
+                await self.telegram.reply_to(message, kbbi.format_defs(defs),
+                                             parse_mode='Markdown')
+            else:
+                await self.telegram.reply_to(message, commands.KBBI_NOT_FOUND_TEXT)
+
+    async def eid(self, message):
+        await self.telegram.send_message(message.chat.id,
+                                         commands.eid_greeting(message.from_user.first_name))
+
+    async def xmas(self, message):
+        await self.telegram.send_message(message.chat.id,
+                                         commands.xmas_greeting(message.from_user.first_name))
+
+    async def kawin(self, message):
+        couple = commands.extract_argument(message.text, '/kawin')
+        if couple is None:
+            await self.telegram.reply_to(message, commands.KAWIN_PROMPT, force_reply=True)
+        else:
+            await self.telegram.send_message(
+                message.chat.id, commands.kawin_greeting(couple, message.from_user.first_name))
+
+    async def tampol(self, message):
+        if commands.TAMPOL_MESSAGE_ID is not None:
+            await self.telegram.forward_message(message.chat.id, message.chat.id,
+                                                commands.TAMPOL_MESSAGE_ID)
+
+
+def create_app(client=None, max_tasks=None):
+    """Return the aiohttp application serving the webhook of `bot`."""
+    if client is None:
+        client = AsyncHTTPClient(connections_per_host=app.config['AIO_CONNECTIONS_PER_HOST'])
+    telegram = AsyncTelegram(app.config['TELEGRAM_BOT_TOKEN'], client)
+
+    tululbot = AsyncTululBot(client, telegram,
+                             max_tasks=max_tasks or app.config['AIO_MAX_TASKS'])
+
+    web_app = web.Application()
+    web_app.router.add_post(webhook_url_path, tululbot.handle_webhook)
+    web_app.router.add_get('{}/stats'.format(webhook_url_path.rstrip('/')),
+                           tululbot.handle_stats)
+    web_app.router.add_get(app.config['METRICS_PATH'], tululbot.handle_metrics)
+    web_app.on_startup.append(tululbot.on_startup)
+    web_app.on_cleanup.append(tululbot.on_cleanup)
+    return web_app
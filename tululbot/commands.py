@@ -1,8 +1,8 @@
-from requests.exceptions import ConnectionError, HTTPError
+from requests.exceptions import ConnectionError, HTTPError, Timeout
 
 from tululbot import app, bot
-from tululbot.utils.kbbi import format_def, lookup_kbbi_definition
-from tululbot.utils.quote import QuoteEngine
+from tululbot.utils.kbbi import format_defs, lookup_kbbi_definition
+from tululbot.utils.quote import QuoteEngine, QuotesNotLoaded
 from tululbot.utils.slang import lookup_slang
 from tululbot.utils.leli import search_on_google, search_on_wikipedia
 
@@ -12,177 +12,208 @@ HOTLINE_MESSAGE_ID = app.config['HOTLINE_MESSAGE_ID']
 BOT_USERNAME = app.config['TELEGRAM_BOT_USERNAME']
 TAMPOL_MESSAGE_ID = app.config['TAMPOL_MESSAGE_ID']
 
+# Texts shared with the handlers of the asyncio app in tululbot.aio
+HTTP_ERROR_TEXT = 'Aduh ada error nich'
+CONNECTION_ERROR_TEXT = "Koneksi lagi bapuk nih :'("
+LELI_PROMPT = 'Apa yang mau dileli?'
+SLANG_PROMPT = 'Apa yang mau dicari jir?'
+HBD_PROMPT = 'Siapa yang ultah?'
+KBBI_PROMPT = 'Cari apa lu?'
+KAWIN_PROMPT = 'Siapa yang mau kawin jir?'
+KBBI_NOT_FOUND_TEXT = 'Gak ada bray'
+QUOTE_NOT_FOUND_TEXT = 'Gak ada quote kayak gitu bray'
+ABOUT_TEXT = (
+    'TululBot v1.12.0\n\n'
+    'Enhancing your tulul experience since 2015\n\n'
+    'Contribute on https://github.com/tulul/tululbot\n\n'
+    "We're hiring! Contact @iqbalmineraltown for details"
+)
+
+
+def extract_argument(text, command):
+    """Return the argument of `command` in `text`, or None if there is none.
+
+    Replies to the prompt of a command are the argument as a whole.
+
+    >>> extract_argument('/leli foo bar', '/leli')
+    'foo bar'
+    >>> extract_argument('foo bar', '/leli')
+    'foo bar'
+    >>> extract_argument('/leli', '/leli') is None
+    True
+    """
+    if not text.startswith(command):
+        return text
+    try:
+        _, argument = text.split(' ', maxsplit=1)
+    except ValueError:
+        return None
+    return argument
+
+
+def hbd_greeting(name):
+    return ('hoi {}'
+            ' met ultah ya moga sehat dan sukses selalu '
+            '\U0001F389 \U0001F38A').format(name)
+
+
+def eid_greeting(sender_name):
+    return ('Taqabbalallahu minna wa minkum, shiyaamana wa shiyaamakum. '
+            'Mohon maaf lahir dan batin ya guys. '
+            'Dari {} dan keluarga.'.format(sender_name))
+
 
-@bot.message_handler(func=bot.create_is_reply_to_filter('Apa yang mau dileli?'))
-@bot.message_handler(regexp=r'^/leli(@{})?( .+)*$'.format(BOT_USERNAME))
+def xmas_greeting(sender_name):
+    return ('Selamat natal semua! '
+            'Dari {} dan keluarga.'.format(sender_name))
+
+
+def kawin_greeting(couple, sender_name):
+    return ('Hoi {} selamat nikah & kawin ya! '
+            'Semoga jadi keluarga yang bahagia. '
+            'Semoga lancar semuanya sampai enna-enna. '
+            'Dari {} dan keluarga.'.format(couple, sender_name))
+
+
+@bot.reply_handler(LELI_PROMPT)
+@bot.command_handler('leli', regexp=r'^/leli(@{})?( .+)*$'.format(BOT_USERNAME))
 def leli(message):
     app.logger.debug('Detected leli command {!r}'.format(message.text))
-    try:
-        if message.text.startswith('/leli'):
-            _, term = message.text.split(' ', maxsplit=1)
-        else:
-            term = message.text
-    except ValueError:
+    term = extract_argument(message.text, '/leli')
+    if term is None:
         app.logger.debug('Cannot split text {!r}'.format(message.text))
-        bot.reply_to(message, 'Apa yang mau dileli?', force_reply=True)
+        bot.reply_to(message, LELI_PROMPT, force_reply=True)
     else:
         app.logger.debug('Extracted leli term {!r}'.format(term))
         try:
             result = search_on_wikipedia(term)
         except HTTPError:
-            bot.reply_to(message, 'Aduh ada error nich')
-        except ConnectionError:
-            bot.reply_to(message, "Koneksi lagi bapuk nih :'(")
+            bot.reply_to(message, HTTP_ERROR_TEXT)
+        except (ConnectionError, Timeout):
+            bot.reply_to(message, CONNECTION_ERROR_TEXT)
         else:
             if result is None:
                 result = search_on_google(term)
             bot.reply_to(message, result, disable_web_page_preview=True)
 
 
-@bot.message_handler(regexp=r'^/quote(@{})?$'.format(BOT_USERNAME))
+def retrieve_quote(query):
+    """Return a random quote, or one matching `query` if it is not None."""
+    if query is None:
+        return quote_engine.retrieve_random()
+    return quote_engine.search(query) or QUOTE_NOT_FOUND_TEXT
+
+
+@bot.command_handler('quote', regexp=r'^/quote(@{})?( .+)*$'.format(BOT_USERNAME))
 def quote(message):
     app.logger.debug('Detected quote command {!r}'.format(message.text))
+    query = extract_argument(message.text, '/quote')
     try:
-        random_quote = quote_engine.retrieve_random()
+        random_quote = retrieve_quote(query)
     except HTTPError:
-        bot.reply_to(message, 'Aduh ada error nich')
-    except ConnectionError:
-        bot.reply_to(message, "Koneksi lagi bapuk nih :'(")
+        bot.reply_to(message, HTTP_ERROR_TEXT)
+    except (ConnectionError, Timeout, QuotesNotLoaded):
+        bot.reply_to(message, CONNECTION_ERROR_TEXT)
     else:
         bot.reply_to(message, random_quote)
 
 
-@bot.message_handler(regexp=r'^/who(@{})?$'.format(BOT_USERNAME))
+@bot.command_handler('who', regexp=r'^/who(@{})?$'.format(BOT_USERNAME))
 def who(message):
     app.logger.debug('Detected who command {!r}'.format(message.text))
-    about_text = (
-        'TululBot v1.12.0\n\n'
-        'Enhancing your tulul experience since 2015\n\n'
-        'Contribute on https://github.com/tulul/tululbot\n\n'
-        "We're hiring! Contact @iqbalmineraltown for details"
-    )
-    return bot.reply_to(message, about_text, disable_web_page_preview=True)
+    return bot.reply_to(message, ABOUT_TEXT, disable_web_page_preview=True)
 
 
-@bot.message_handler(func=bot.create_is_reply_to_filter('Apa yang mau dicari jir?'))
-@bot.message_handler(regexp=r'^/slang(@{})?( .+)*$'.format(BOT_USERNAME))
+@bot.reply_handler(SLANG_PROMPT)
+@bot.command_handler('slang', regexp=r'^/slang(@{})?( .+)*$'.format(BOT_USERNAME))
 def slang(message):
     app.logger.debug('Detected slang command {!r}'.format(message.text))
-    try:
-        if message.text.startswith('/slang'):
-            _, term = message.text.split(' ', maxsplit=1)
-        else:
-            term = message.text
-    except ValueError:
+    term = extract_argument(message.text, '/slang')
+    if term is None:
         app.logger.debug('Cannot split text {!r}'.format(message.text))
-        bot.reply_to(message, 'Apa yang mau dicari jir?', force_reply=True)
+        bot.reply_to(message, SLANG_PROMPT, force_reply=True)
     else:
         try:
             definition = lookup_slang(term)
         except HTTPError:
-            bot.reply_to(message, 'Aduh ada error nich')
-        except ConnectionError:
-            bot.reply_to(message, "Koneksi lagi bapuk nih :'(")
+            bot.reply_to(message, HTTP_ERROR_TEXT)
+        except (ConnectionError, Timeout):
+            bot.reply_to(message, CONNECTION_ERROR_TEXT)
         else:
             app.logger.debug('Extracted slang term {!r}'.format(term))
             bot.reply_to(message, definition, parse_mode='Markdown')
 
 
-@bot.message_handler(regexp=r'^/hotline(@{})?$'.format(BOT_USERNAME))
+@bot.command_handler('hotline', regexp=r'^/hotline(@{})?$'.format(BOT_USERNAME))
 def hotline(message):
     app.logger.debug('Detected hotline command {!r}'.format(message.text))
     if HOTLINE_MESSAGE_ID is not None:
         bot.forward_message(message.chat.id, message.chat.id, HOTLINE_MESSAGE_ID)
 
 
-@bot.message_handler(func=bot.create_is_reply_to_filter('Siapa yang ultah?'))
-@bot.message_handler(regexp=r'^/hbd(@{})?( @?\w+)*$'.format(BOT_USERNAME))
+@bot.reply_handler(HBD_PROMPT)
+@bot.command_handler('hbd', regexp=r'^/hbd(@{})?( @?\w+)*$'.format(BOT_USERNAME))
 def hbd(message):
     app.logger.debug('Detected hbd command {!r}'.format(message.text))
-    try:
-        if message.text.startswith('/hbd'):
-            _, name = message.text.split(' ', maxsplit=1)
-        else:
-            name = message.text
-    except ValueError:
+    name = extract_argument(message.text, '/hbd')
+    if name is None:
         app.logger.debug('Cannot split text {!r}'.format(message.text))
-        bot.reply_to(message, 'Siapa yang ultah?', force_reply=True)
+        bot.reply_to(message, HBD_PROMPT, force_reply=True)
     else:
         app.logger.debug('Extracted hbd name {!r}'.format(name))
-        greetings_format = ('hoi {}'
-                            ' met ultah ya moga sehat dan sukses selalu '
-                            '\U0001F389 \U0001F38A')
-        greetings = greetings_format.format(name)
-        bot.send_message(message.chat.id, greetings)
+        bot.send_message(message.chat.id, hbd_greeting(name))
 
 
-@bot.message_handler(func=bot.create_is_reply_to_filter('Cari apa lu?'))
-@bot.message_handler(regexp=r'^/kbbi(@{})?( \w+)*$'.format(BOT_USERNAME))
+@bot.reply_handler(KBBI_PROMPT)
+@bot.command_handler('kbbi', regexp=r'^/kbbi(@{})?( \w+)*$'.format(BOT_USERNAME))
 def kbbi(message):
     app.logger.debug('Detected kbbi command {!r}'.format(message.text))
-    try:
-        if message.text.startswith('/kbbi'):
-            _, term = message.text.split(' ', maxsplit=1)
-        else:
-            term = message.text
-    except ValueError:
+    term = extract_argument(message.text, '/kbbi')
+    if term is None:
         app.logger.debug('Cannot split text {!r}'.format(message.text))
-        bot.reply_to(message, 'Cari apa lu?', force_reply=True)
+        bot.reply_to(message, KBBI_PROMPT, force_reply=True)
     else:
         app.logger.debug('Extracted kbbi term {!r}'.format(term))
         try:
             defs = lookup_kbbi_definition(term)
         except HTTPError:
-            bot.reply_to(message, 'Aduh ada error nich')
-        except ConnectionError:
-            bot.reply_to(message, "Koneksi lagi bapuk nih :'(")
+            bot.reply_to(message, HTTP_ERROR_TEXT)
+        except (ConnectionError, Timeout):
+            bot.reply_to(message, CONNECTION_ERROR_TEXT)
         else:
             if defs:
-                response = '\n'.join(format_def(i, d) for i, d in enumerate(defs, start=1))
-                bot.reply_to(message, response, parse_mode='Markdown')
+                bot.reply_to(message, format_defs(defs), parse_mode='Markdown')
             else:
-                bot.reply_to(message, 'Gak ada bray')
+                bot.reply_to(message, KBBI_NOT_FOUND_TEXT)
 
 
-@bot.message_handler(regexp=r'^/eid(@{})?$'.format(BOT_USERNAME))
+@bot.command_handler('eid', regexp=r'^/eid(@{})?$'.format(BOT_USERNAME))
 def eid(message):
     app.logger.debug('Detected eid command {!r}'.format(message.text))
-    eid_greeting = ('Taqabbalallahu minna wa minkum, shiyaamana wa shiyaamakum. '
-                    'Mohon maaf lahir dan batin ya guys. '
-                    'Dari {} dan keluarga.'.format(message.from_user.first_name))
-    bot.send_message(message.chat.id, eid_greeting)
+    bot.send_message(message.chat.id, eid_greeting(message.from_user.first_name))
 
 
-@bot.message_handler(regexp=r'^/xmas(@{})?$'.format(BOT_USERNAME))
+@bot.command_handler('xmas', regexp=r'^/xmas(@{})?$'.format(BOT_USERNAME))
 def xmas(message):
     app.logger.debug('Detected xmas command {!r}'.format(message.text))
-    xmas_greeting = ('Selamat natal semua! '
-                     'Dari {} dan keluarga.'.format(message.from_user.first_name))
-    bot.send_message(message.chat.id, xmas_greeting)
+    bot.send_message(message.chat.id, xmas_greeting(message.from_user.first_name))
 
 
-@bot.message_handler(func=bot.create_is_reply_to_filter('Siapa yang mau kawin jir?'))
-@bot.message_handler(regexp=r'^/kawin(@{})?( .+)*$'.format(BOT_USERNAME))
+@bot.reply_handler(KAWIN_PROMPT)
+@bot.command_handler('kawin', regexp=r'^/kawin(@{})?( .+)*$'.format(BOT_USERNAME))
 def kawin(message):
     app.logger.debug('Detected kawin command {!r}'.format(message.text))
-    try:
-        if message.text.startswith('/kawin'):
-            _, couple = message.text.split(' ', maxsplit=1)
-        else:
-            couple = message.text
-    except ValueError:
+    couple = extract_argument(message.text, '/kawin')
+    if couple is None:
         app.logger.debug('Cannot split text {!r}'.format(message.text))
-        bot.reply_to(message, 'Siapa yang mau kawin jir?', force_reply=True)
+        bot.reply_to(message, KAWIN_PROMPT, force_reply=True)
     else:
         app.logger.debug('Extracted kawin couple {!r}'.format(couple))
-        kawin_greeting = ('Hoi {} selamat nikah & kawin ya! '
-                          'Semoga jadi keluarga yang bahagia. '
-                          'Semoga lancar semuanya sampai enna-enna. '
-                          'Dari {} dan keluarga.'.format(couple, message.from_user.first_name))
-        bot.send_message(message.chat.id, kawin_greeting)
+        bot.send_message(message.chat.id,
+                         kawin_greeting(couple, message.from_user.first_name))
 
 
-@bot.message_handler(regexp=r'^/tampol(@{})?$'.format(BOT_USERNAME))
+@bot.command_handler('tampol', regexp=r'^/tampol(@{})?$'.format(BOT_USERNAME))
 def tampol(message):
     app.logger.debug('Detected hotline command {!r}'.format(message.text))
     if TAMPOL_MESSAGE_ID is not None:
@@ -7,9 +7,69 @@ DEBUG = environ.get('DEBUG', 'true') == 'true'
 TELEGRAM_BOT_TOKEN = environ.get('TELEGRAM_BOT_TOKEN', '')
 LOG_LEVEL = environ.get('LOG_LEVEL', 'DEBUG')
 WEBHOOK_HOST = environ.get('WEBHOOK_HOST', '127.0.0.1')
+# 'background' sets the webhook from a thread when the app starts, 'manual' leaves it to
+# `manage.py set-webhook`, e.g. in a release phase
+WEBHOOK_SETUP = environ.get('WEBHOOK_SETUP', 'background')
 HOTLINE_MESSAGE_ID = environ.get('HOTLINE_MESSAGE_ID')
 TAMPOL_MESSAGE_ID = environ.get('TAMPOL_MESSAGE_ID')
 TELEGRAM_BOT_USERNAME = environ.get('TELEGRAM_BOT_USERNAME', '')
+# Defaults to the id at the start of TELEGRAM_BOT_TOKEN
+TELEGRAM_BOT_ID = int(environ['TELEGRAM_BOT_ID']) if environ.get('TELEGRAM_BOT_ID') else None
+# 'inline' processes updates inside the webhook request, 'pool' acknowledges
+# the webhook right away and processes updates on a bounded worker pool
+DISPATCH_MODE = environ.get('DISPATCH_MODE', 'inline')
+DISPATCH_WORKERS = int(environ.get('DISPATCH_WORKERS', '4'))
+DISPATCH_QUEUE_SIZE = int(environ.get('DISPATCH_QUEUE_SIZE', '100'))
+DISPATCH_SHUTDOWN_TIMEOUT = float(environ.get('DISPATCH_SHUTDOWN_TIMEOUT', '25'))
+# Telegram retries an update when the webhook is slow; 'memory' remembers recent update ids
+# per process, 'sqlite' shares them between all workers through DEDUP_SQLITE_PATH
+DEDUP_BACKEND = environ.get('DEDUP_BACKEND', 'memory')
+DEDUP_SQLITE_PATH = environ.get('DEDUP_SQLITE_PATH', 'tululbot-updates.sqlite3')
+DEDUP_TTL = float(environ.get('DEDUP_TTL', '600'))
+DEDUP_MAX_SIZE = int(environ.get('DEDUP_MAX_SIZE', '10000'))
+HTTP_CONNECT_TIMEOUT = float(environ.get('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(environ.get('HTTP_READ_TIMEOUT', '10'))
+# Send messages from a background queue, rate limited per chat and globally
+OUTBOX_ENABLED = environ.get('OUTBOX_ENABLED', 'false') == 'true'
+OUTBOX_GLOBAL_RATE = float(environ.get('OUTBOX_GLOBAL_RATE', '30'))
+OUTBOX_CHAT_RATE = float(environ.get('OUTBOX_CHAT_RATE', '1'))
+OUTBOX_CHAT_BURST = int(environ.get('OUTBOX_CHAT_BURST', '3'))
+# 'memory' caches the answers of /leli, /slang and /kbbi per process, 'sqlite' shares them
+# between all workers and keeps them across restarts through CACHE_SQLITE_PATH
+CACHE_BACKEND = environ.get('CACHE_BACKEND', 'memory')
+CACHE_SQLITE_PATH = environ.get('CACHE_SQLITE_PATH', 'tululbot-cache.sqlite3')
+LELI_CACHE_SIZE = int(environ.get('LELI_CACHE_SIZE', '1000'))
+LELI_CACHE_TTL = float(environ.get('LELI_CACHE_TTL', '86400'))
+LELI_CACHE_NOT_FOUND_TTL = float(environ.get('LELI_CACHE_NOT_FOUND_TTL', '3600'))
+SLANG_CACHE_SIZE = int(environ.get('SLANG_CACHE_SIZE', '1000'))
+SLANG_CACHE_TTL = float(environ.get('SLANG_CACHE_TTL', '86400'))
+KBBI_CACHE_SIZE = int(environ.get('KBBI_CACHE_SIZE', '1000'))
+KBBI_CACHE_TTL = float(environ.get('KBBI_CACHE_TTL', '604800'))
+# Seconds /slang waits for its sources, the ones which are later are left out
+SLANG_DEADLINE = float(environ.get('SLANG_DEADLINE', '5'))
+# Seconds between refreshes of the quotes of /quote in the background, 0 to download them
+# on the first /quote instead
+QUOTE_REFRESH_INTERVAL = float(environ.get('QUOTE_REFRESH_INTERVAL', '3600'))
+# Route of the metrics in the Prometheus text format; unlike the stats, it does not contain
+# the bot token, so keep it private in the reverse proxy
+METRICS_PATH = environ.get('METRICS_PATH', '/metrics')
+# Quotes of the last refresh, loaded when the app starts
+QUOTE_SNAPSHOT_PATH = environ.get('QUOTE_SNAPSHOT_PATH', '.tululbot-quotes.json')
+# Built by `manage.py build-slang-lexicon`, /slang answers the words in it without lookups
+# and suggests them for the words not found
+SLANG_LEXICON_PATH = environ.get('SLANG_LEXICON_PATH', '')
+# Built by `manage.py import-kbbi`, /kbbi answers from it alone when it is set
+KBBI_INDEX_PATH = environ.get('KBBI_INDEX_PATH', '')
+# Built by `manage.py build-leli-index`, /leli only asks Wikipedia for titles not in it
+LELI_INDEX_PATH = environ.get('LELI_INDEX_PATH', '')
+# Used by `manage.py poll`
+POLL_OFFSET_PATH = environ.get('POLL_OFFSET_PATH', '.tululbot-offset')
+POLL_BATCH_SIZE = int(environ.get('POLL_BATCH_SIZE', '100'))
+POLL_TIMEOUT = int(environ.get('POLL_TIMEOUT', '30'))
+POLL_WORKERS = int(environ.get('POLL_WORKERS', '4'))
+# Used by `manage.py runaio`
+AIO_MAX_TASKS = int(environ.get('AIO_MAX_TASKS', '500'))
+AIO_CONNECTIONS_PER_HOST = int(environ.get('AIO_CONNECTIONS_PER_HOST', '100'))
 
 try:
     TULULBOT_DEVEL_CHAT_ID = environ['TULULBOT_DEVEL_CHAT_ID']
@@ -1,11 +1,34 @@
-from telebot import TeleBot, types
+import time
+
+from telebot import TeleBot, apihelper, types
+
+from tululbot.utils import http
+from tululbot.utils.metrics import registry
+from tululbot.utils.outbox import PRIORITY_NOTIFICATION, PRIORITY_REPLY
+from tululbot.utils.router import CommandRouter
+
+# TeleBot calls `requests.request` and `requests.get` of its API helper module directly, make
+# them go through our pooled client so that Telegram connections are kept alive too
+apihelper.requests = http
+
+handler_duration = registry.histogram(
+    'tululbot_handler_duration_seconds', 'Time taken by command handlers.',
+    labels=('handler',))
+handler_errors = registry.counter(
+    'tululbot_handler_errors_total', 'Command handlers which raised an exception.',
+    labels=('handler',))
 
 
 class TululBot(TeleBot):
 
-    def __init__(self, token):
-        super(TululBot, self).__init__(token)
+    def __init__(self, token, threaded=True, outbox=None, user_id=None):
+        super(TululBot, self).__init__(token, threaded=threaded)
         self._user = None
+        # Known without asking Telegram, so that filtering replies never waits for `get_me`
+        self.user_id = user_id if user_id is not None else parse_bot_id(token)
+        self.router = CommandRouter()
+        # When set, messages are queued in the outbox and sent in the background
+        self.outbox = outbox
 
     @property
     def user(self):
@@ -18,6 +41,8 @@ class TululBot(TeleBot):
     @user.setter
     def user(self, value):
         self._user = value
+        if value is not None:
+            self.user_id = value.id
 
     def reply_to(self, *args, **kwargs):
         try:
@@ -29,6 +54,72 @@ class TululBot(TeleBot):
                 kwargs['reply_markup'] = types.ForceReply(selective=True)
             return super(TululBot, self).reply_to(*args, **kwargs)
 
+    def send_message(self, chat_id, text, disable_web_page_preview=None,
+                     reply_to_message_id=None, **kwargs):
+        send = super(TululBot, self).send_message
+        if self.outbox is None:
+            return send(chat_id, text, disable_web_page_preview=disable_web_page_preview,
+                        reply_to_message_id=reply_to_message_id, **kwargs)
+
+        kwargs.update(disable_web_page_preview=disable_web_page_preview,
+                      reply_to_message_id=reply_to_message_id)
+        priority = PRIORITY_REPLY if reply_to_message_id is not None else PRIORITY_NOTIFICATION
+        self.outbox.put(chat_id, send, (chat_id, text), kwargs, priority=priority)
+
+    def forward_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        forward = super(TululBot, self).forward_message
+        if self.outbox is None:
+            return forward(chat_id, from_chat_id, message_id, **kwargs)
+
+        # Forwarded messages are answers to commands, so they go along with replies
+        self.outbox.put(chat_id, forward, (chat_id, from_chat_id, message_id), kwargs,
+                        priority=PRIORITY_REPLY)
+
+    def ensure_webhook(self, url):
+        """Set the webhook to `url` unless it already is, and return whether it was set."""
+        if self.get_webhook_info().url == url:
+            return False
+        self.set_webhook(url)
+        return True
+
+    def command_handler(self, name, regexp=None):
+        """Register the decorated function as the handler of `/name`.
+
+        The message must also match `regexp`, if given.
+        """
+        def decorator(handler):
+            self.router.add_command(name, handler, regexp=regexp)
+            return handler
+
+        return decorator
+
+    def reply_handler(self, text):
+        """Register the decorated function as the handler of replies to bot's `text`."""
+        def decorator(handler):
+            self.router.add_reply(text, handler)
+            return handler
+
+        return decorator
+
+    def _notify_command_handlers(self, handlers, new_messages):
+        if handlers is not self.message_handlers:
+            return super(TululBot, self)._notify_command_handlers(handlers, new_messages)
+
+        unrouted_messages = []
+        for message in new_messages:
+            handler = self.router.route(message, self.is_reply_to_bot_user)
+            if handler is not None:
+                self._exec_task(run_handler, handler, message)
+            else:
+                unrouted_messages.append(message)
+
+        super(TululBot, self)._notify_command_handlers(handlers, unrouted_messages)
+
+    def accepts_message_json(self, message_json):
+        """Return whether a message, still as decoded JSON, may have a handler."""
+        # Handlers registered with `message_handler` can match anything
+        return bool(self.message_handlers) or self.router.accepts(message_json, self.user_id)
+
     def create_is_reply_to_filter(self, text):
         def is_reply_to_bot(message):
             return (self.is_reply_to_bot_user(message) and
@@ -38,6 +129,33 @@ class TululBot(TeleBot):
 
     def is_reply_to_bot_user(self, message):
         replied_message = message.reply_to_message
-        return (replied_message is not None and
-                replied_message.from_user is not None and
-                replied_message.from_user.id == self.user.id)
+        if replied_message is None or replied_message.from_user is None:
+            return False
+        if self.user_id is None:
+            self.user_id = self.user.id
+        return replied_message.from_user.id == self.user_id
+
+
+def run_handler(handler, message):
+    """Call `handler` with `message`, recording how long it takes and whether it fails."""
+    name = getattr(handler, '__name__', type(handler).__name__)
+    start = time.perf_counter()
+    try:
+        handler(message)
+    except Exception:
+        handler_errors.inc(name)
+        raise
+    finally:
+        handler_duration.observe(time.perf_counter() - start, name)
+
+
+def parse_bot_id(token):
+    """Return the id of the bot, which is the part of its token before the colon.
+
+    >>> parse_bot_id('123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11')
+    123456
+    >>> parse_bot_id('TOKEN') is None
+    True
+    """
+    bot_id, colon, _ = token.partition(':')
+    return int(bot_id) if colon and bot_id.isdigit() else None
@@ -0,0 +1,70 @@
+"""Build the offline index of `/leli` from a Wikipedia abstracts dump.
+
+Dumps are the ``enwiki-latest-abstract*.xml.gz`` files of
+https://dumps.wikimedia.org/enwiki/latest/, which hold the title, URL and
+first paragraph of every article.
+"""
+import bz2
+import gzip
+from xml.etree import ElementTree
+
+from tululbot.utils.index import write_index
+from tululbot.utils.leli import has_disambiguations, normalize_term
+
+
+TITLE_PREFIX = 'Wikipedia: '
+
+
+def open_dump(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_abstracts(f):
+    """Yield the (title, abstract) pairs of an abstracts dump, streaming.
+
+    Disambiguation pages are skipped, since their abstract is only the
+    "may refer to:" line, and so are abstracts left as wiki markup.
+    """
+    root = None
+    for event, elem in ElementTree.iterparse(f, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event != 'end' or elem.tag != 'doc':
+            continue
+
+        title = elem.findtext('title') or ''
+        abstract = (elem.findtext('abstract') or '').strip()
+        # Do not keep every parsed doc around
+        root.clear()
+
+        if title.startswith(TITLE_PREFIX):
+            title = title[len(TITLE_PREFIX):]
+        if (not title or not abstract or abstract[0] in '|{' or
+                has_disambiguations(abstract)):
+            continue
+        yield title, abstract
+
+
+def iter_redirects(f):
+    """Yield the (title, target title) pairs of a file with one tab separated pair a line."""
+    for line in f:
+        title, _, target = line.rstrip('\n').partition('\t')
+        if title and target:
+            yield title, target
+
+
+def build_index(dump_path, index_path, redirects_path=None):
+    """Write the index of `dump_path` to `index_path` and return the number of titles."""
+    with open_dump(dump_path) as f:
+        items = ((normalize_term(title), abstract) for title, abstract in iter_abstracts(f))
+        if redirects_path is None:
+            return write_index(index_path, items)
+
+        with open(redirects_path, encoding='utf-8') as redirects:
+            aliases = ((normalize_term(title), normalize_term(target))
+                       for title, target in iter_redirects(redirects))
+            return write_index(index_path, items, aliases)
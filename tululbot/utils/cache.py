@@ -0,0 +1,170 @@
+from collections import OrderedDict
+import json
+import threading
+import time
+
+from tululbot.utils.sqlite import LocalConnection
+
+
+# Returned by `TTLCache.get` on a miss, since None may be a cached value
+MISSING = object()
+
+
+class TTLCache:
+    """Cache of at most `max_size` entries that expire after `ttl` seconds.
+
+    When full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size=1000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            try:
+                expires_at, value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Cache `value` for `ttl` seconds, or the default TTL of the cache."""
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class SQLiteTTLCache:
+    """Like TTLCache, but stored in an SQLite database.
+
+    Every gunicorn worker pointing to the same database file shares the
+    entries, and they survive restarts. Values must be serializable to JSON.
+    Caches of different commands can share the file under another `namespace`.
+
+    To keep lookups read-only, expired entries and the ones above `max_size`
+    are only deleted every `sweep_interval` writes, and eviction removes the
+    entries expiring first rather than the least recently used.
+    """
+
+    # Queries block, see tululbot.aio.call_store
+    blocking = True
+
+    def __init__(self, path, namespace, max_size=1000, ttl=3600, sweep_interval=100):
+        self.path = path
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = LocalConnection(path, schema=(
+            'CREATE TABLE IF NOT EXISTS cache_entries '
+            '(namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))',
+            'CREATE INDEX IF NOT EXISTS cache_entries_expires_at '
+            'ON cache_entries (namespace, expires_at)',
+        ))
+
+    @property
+    def connection(self):
+        return self._connection.get()
+
+    def get(self, key, default=MISSING):
+        row = self.connection.execute('SELECT value FROM cache_entries '
+                                      'WHERE namespace = ? AND key = ? AND expires_at > ?',
+                                      (self.namespace, key, time.time())).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """Cache `value` for `ttl` seconds, or the default TTL of the cache."""
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        with self.connection as conn:
+            conn.execute('INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?)',
+                         (self.namespace, key, json.dumps(value), expires_at))
+
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % self.sweep_interval == 0
+        if sweep:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired entries, then the ones expiring first above `max_size`."""
+        with self.connection as conn:
+            expired = conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND '
+                                   'expires_at <= ?', (self.namespace, time.time())).rowcount
+            evicted = conn.execute('DELETE FROM cache_entries WHERE rowid IN '
+                                   '(SELECT rowid FROM cache_entries WHERE namespace = ? '
+                                   'ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                                   (self.namespace, self.max_size)).rowcount
+        with self._lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def items(self):
+        """Yield the (key, value) pairs of the entries that have not expired."""
+        rows = self.connection.execute('SELECT key, value FROM cache_entries '
+                                       'WHERE namespace = ? AND expires_at > ?',
+                                       (self.namespace, time.time()))
+        for key, value in rows:
+            yield key, json.loads(value)
+
+    def clear(self):
+        with self.connection as conn:
+            conn.execute('DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+
+    def stats(self):
+        size, = self.connection.execute('SELECT COUNT(*) FROM cache_entries '
+                                        'WHERE namespace = ?', (self.namespace,)).fetchone()
+        with self._lock:
+            return {
+                'size': size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
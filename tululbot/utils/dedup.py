@@ -0,0 +1,147 @@
+from collections import OrderedDict
+import threading
+import time
+
+from tululbot.utils.sqlite import LocalConnection
+
+
+class RecentUpdateIds:
+    """Bounded set of recently seen update ids whose entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl=600, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.suppressed = 0
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, update_id):
+        """Remember `update_id`.
+
+        Returns False if it has been seen within the last `ttl` seconds.
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if update_id in self._seen:
+                self.suppressed += 1
+                return False
+
+            self._seen[update_id] = now
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return True
+
+    def discard(self, update_id):
+        with self._lock:
+            self._seen.pop(update_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._seen.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._seen), 'suppressed': self.suppressed}
+
+    def _expire(self, now):
+        # Entries are kept in insertion order, so the oldest ones are in front
+        while self._seen:
+            update_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.ttl:
+                break
+            del self._seen[update_id]
+
+
+class SQLiteRecentUpdateIds:
+    """Like RecentUpdateIds, but stored in an SQLite database.
+
+    Every gunicorn worker pointing to the same database file shares the same
+    set, so a retried update is suppressed even if it reaches another worker.
+    Expired entries are purged every `purge_interval` additions.
+    """
+
+    # Queries block, see tululbot.aio.call_store
+    blocking = True
+
+    def __init__(self, path, ttl=600, max_size=10000, purge_interval=100):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.purge_interval = purge_interval
+        self.suppressed = 0
+        self._additions = 0
+        self._lock = threading.Lock()
+        self._connection = LocalConnection(path, schema=(
+            'CREATE TABLE IF NOT EXISTS seen_updates '
+            '(update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS seen_updates_seen_at ON seen_updates (seen_at)',
+            'CREATE TABLE IF NOT EXISTS seen_updates_stats '
+            '(name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+        ))
+
+    @property
+    def connection(self):
+        return self._connection.get()
+
+    def add(self, update_id):
+        """Remember `update_id`.
+
+        Returns False if it has been seen within the last `ttl` seconds.
+        """
+        now = time.time()
+        conn = self.connection
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT seen_at FROM seen_updates WHERE update_id = ?',
+                               (update_id,)).fetchone()
+            if row is not None and now - row[0] < self.ttl:
+                conn.execute('INSERT OR IGNORE INTO seen_updates_stats VALUES (?, 0)',
+                             ('suppressed',))
+                conn.execute('UPDATE seen_updates_stats SET value = value + 1 WHERE name = ?',
+                             ('suppressed',))
+                duplicate = True
+            else:
+                conn.execute('INSERT OR REPLACE INTO seen_updates VALUES (?, ?)',
+                             (update_id, now))
+                duplicate = False
+
+        purge = False
+        with self._lock:
+            if duplicate:
+                self.suppressed += 1
+            else:
+                self._additions += 1
+                purge = self._additions % self.purge_interval == 0
+        if purge:
+            self.purge()
+        return not duplicate
+
+    def discard(self, update_id):
+        with self.connection as conn:
+            conn.execute('DELETE FROM seen_updates WHERE update_id = ?', (update_id,))
+
+    def clear(self):
+        with self.connection as conn:
+            conn.execute('DELETE FROM seen_updates')
+
+    def purge(self):
+        """Delete expired entries and the oldest ones above `max_size`."""
+        with self.connection as conn:
+            conn.execute('DELETE FROM seen_updates WHERE seen_at <= ?',
+                         (time.time() - self.ttl,))
+            conn.execute('DELETE FROM seen_updates WHERE update_id IN '
+                         '(SELECT update_id FROM seen_updates '
+                         'ORDER BY seen_at DESC, update_id DESC '
+                         'LIMIT -1 OFFSET ?)', (self.max_size,))
+
+    def stats(self):
+        conn = self.connection
+        size, = conn.execute('SELECT COUNT(*) FROM seen_updates').fetchone()
+        row = conn.execute('SELECT value FROM seen_updates_stats WHERE name = ?',
+                           ('suppressed',)).fetchone()
+        return {
+            'size': size,
+            'suppressed': self.suppressed,
+            'suppressed_all_workers': row[0] if row is not None else 0,
+        }
@@ -0,0 +1,35 @@
+"""Build the offline dictionary of `/kbbi`.
+
+Dumps are CSV files with a header row and a definition a row, in the columns
+of the definitions of the kateglo.com API: ``phrase``, ``lex_class_ref``,
+``def_text`` and ``sample``. Definitions keep the order of the dump.
+"""
+from collections import OrderedDict
+import csv
+
+from tululbot.utils.index import write_index
+from tululbot.utils.kbbi import pack_defs
+
+
+def iter_definitions(f):
+    """Yield the (phrase, definition) pairs of a dump, with definitions like `to_def`'s."""
+    for row in csv.DictReader(f):
+        phrase = (row.get('phrase') or '').strip()
+        def_text = (row.get('def_text') or '').strip()
+        if phrase and def_text:
+            yield phrase, {
+                'class': row.get('lex_class_ref') or '',
+                'def_text': def_text,
+                'sample': row.get('sample') or '',
+            }
+
+
+def build_dictionary(dump_path, index_path):
+    """Write the dictionary of `dump_path` to `index_path` and return the number of terms."""
+    defs_by_term = OrderedDict()
+    with open(dump_path, encoding='utf-8', newline='') as f:
+        for phrase, definition in iter_definitions(f):
+            defs_by_term.setdefault(phrase.casefold(), []).append(definition)
+
+    return write_index(index_path, ((term, pack_defs(defs))
+                                    for term, defs in defs_by_term.items()))
@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UpdateDispatcher:
+    """Process items on a bounded pool of worker threads.
+
+    Items are put into a queue holding at most `queue_size` items and then
+    picked up by `num_workers` threads which call `process` on them. Workers are
+    started lazily on the first submission, so it is safe to create the
+    dispatcher before gunicorn forks its workers.
+    """
+
+    _stop = object()
+
+    def __init__(self, process, num_workers=4, queue_size=100, on_error=None):
+        self.process = process
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.on_error = on_error
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._submitted = 0
+        self._processed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._max_depth = 0
+
+    def submit(self, item):
+        """Queue `item` for processing and return immediately.
+
+        Raises QueueFull if the queue is full or the dispatcher is shut down.
+        """
+        with self._lock:
+            if self._closed:
+                raise QueueFull('Dispatcher is shut down')
+            if not self._workers:
+                self._start_workers()
+            try:
+                self._queue.put_nowait((time.monotonic(), item))
+            except queue.Full:
+                self._rejected += 1
+                raise QueueFull('Dispatch queue is full ({} items)'.format(self.queue_size))
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+
+    def shutdown(self, timeout=None):
+        """Stop accepting items and wait for the queued ones to be processed.
+
+        Returns after at most `timeout` seconds, even if the queue is still full.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in workers:
+            try:
+                self._queue.put((None, self._stop), timeout=remaining_time(deadline))
+            except queue.Full:
+                # Workers are daemon threads, the ones left without a sentinel die on exit
+                break
+
+        for worker in workers:
+            worker.join(remaining_time(deadline))
+
+        alive = sum(1 for worker in workers if worker.is_alive())
+        if alive:
+            logger.warning('%s dispatcher workers still busy after shutdown timeout', alive)
+
+    def stats(self):
+        with self._lock:
+            processed = self._processed
+            return {
+                'workers': len(self._workers),
+                'queue_size': self.queue_size,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_depth,
+                'submitted': self._submitted,
+                'processed': processed,
+                'rejected': self._rejected,
+                'failed': self._failed,
+                'avg_wait_time': self._total_wait / processed if processed else 0.0,
+                'max_wait_time': self._max_wait,
+            }
+
+    def _start_workers(self):
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._work, name='UpdateDispatcher-{}'.format(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            enqueued_at, item = self._queue.get()
+            try:
+                if item is self._stop:
+                    return
+                wait_time = time.monotonic() - enqueued_at
+                try:
+                    self.process(item)
+                except Exception:
+                    logger.exception('Error while processing %r', item)
+                    with self._lock:
+                        self._failed += 1
+                    if self.on_error is not None:
+                        try:
+                            self.on_error()
+                        except Exception:
+                            logger.exception('Error handler failed')
+                with self._lock:
+                    self._processed += 1
+                    self._total_wait += wait_time
+                    self._max_wait = max(self._max_wait, wait_time)
+            finally:
+                self._queue.task_done()
+
+
+def remaining_time(deadline):
+    """Return the seconds left until `deadline`, or None if there is no deadline."""
+    return None if deadline is None else max(0, deadline - time.monotonic())
@@ -0,0 +1,28 @@
+"""Helpers for the scrapers, which parse pages with the stdlib HTMLParser."""
+from html.parser import HTMLParser
+
+
+class StopParsing(Exception):
+    pass
+
+
+class StreamingParser(HTMLParser):
+    """Parser whose handlers raise StopParsing once they found what they look for.
+
+    No tree is built, and the rest of the page is never even tokenized.
+    """
+
+    def __init__(self):
+        super(StreamingParser, self).__init__(convert_charrefs=True)
+
+    def parse(self, page):
+        """Feed the whole `page`, then call `end` unless parsing was stopped."""
+        try:
+            self.feed(page)
+            self.close()
+        except StopParsing:
+            return
+        self.end()
+
+    def end(self):
+        pass
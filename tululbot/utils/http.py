@@ -0,0 +1,149 @@
+from collections import defaultdict
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from tululbot.utils.metrics import registry
+
+
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) in seconds
+# Names of the upstreams in metrics by host, other hosts are named after themselves
+UPSTREAM_NAMES = {
+    'en.wikipedia.org': 'wikipedia',
+    'kamusslang.com': 'kamusslang',
+    'api.urbandictionary.com': 'urbandictionary',
+    'kateglo.com': 'kateglo',
+    'raw.githubusercontent.com': 'quotes',
+    'api.telegram.org': 'telegram',
+}
+
+upstream_duration = registry.histogram(
+    'tululbot_upstream_request_duration_seconds',
+    'Time taken by requests to upstreams, including the failed ones.', labels=('upstream',))
+upstream_errors = registry.counter(
+    'tululbot_upstream_errors_total',
+    'Requests to upstreams which failed without a response.', labels=('upstream',))
+
+
+class HTTPClient:
+    """HTTP client shared by Telegram and every upstream source.
+
+    Requests go through one `requests.Session` which keeps a pool of keep-alive
+    connections for each host, so a lookup does not pay for a new TCP and TLS
+    handshake every time. Requests without a timeout get `timeout`.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool_connections=10, pool_maxsize=10):
+        self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)
+        self._errors = defaultdict(int)
+
+    @property
+    def session(self):
+        # Connections must not be shared with the parent process after a fork
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._create_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        host = urlsplit(url).netloc
+        upstream = upstream_name(url)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except RequestException:
+            upstream_duration.observe(time.perf_counter() - start, upstream)
+            upstream_errors.inc(upstream)
+            with self._lock:
+                self._errors[host] += 1
+            raise
+        upstream_duration.observe(time.perf_counter() - start, upstream)
+        with self._lock:
+            self._requests[host] += 1
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def stats(self):
+        """Return the number of requests, errors and opened connections per host.
+
+        Fewer connections than requests means connections are being reused.
+        """
+        connections = defaultdict(int)
+        if self._session is not None:
+            for adapter in self._session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    host = pool.host if pool.port in (None, 80, 443) else '{}:{}'.format(
+                        pool.host, pool.port)
+                    connections[host] += pool.num_connections
+
+        with self._lock:
+            hosts = set(self._requests) | set(self._errors) | set(connections)
+            return {
+                host: {
+                    'requests': self._requests[host],
+                    'errors': self._errors[host],
+                    'connections': connections[host],
+                } for host in hosts
+            }
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        return session
+
+
+def upstream_name(url):
+    """Return the name of the upstream of `url` in metrics.
+
+    Telegram is named after the method of the Bot API too.
+
+    >>> upstream_name('http://kamusslang.com/arti/gabut')
+    'kamusslang'
+    >>> upstream_name('https://api.telegram.org/bot123:ABC/sendMessage')
+    'telegram.sendMessage'
+    >>> upstream_name('https://example.com/foo')
+    'example.com'
+    """
+    parts = urlsplit(url)
+    name = UPSTREAM_NAMES.get(parts.netloc, parts.netloc)
+    if name == 'telegram':
+        return '{}.{}'.format(name, parts.path.rpartition('/')[2])
+    return name
+
+
+client = HTTPClient()
+
+
+def request(method, url, **kwargs):
+    return client.request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return client.get(url, **kwargs)
+
+
+def stats():
+    return client.stats()
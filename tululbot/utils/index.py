@@ -0,0 +1,170 @@
+import mmap
+import os
+import struct
+import tempfile
+
+
+MAGIC = b'TLIX'
+VERSION = 1
+
+# Magic, version and number of keys
+HEADER = struct.Struct('<4sII')
+# Offset of a key record, one per key in key order
+ENTRY = struct.Struct('<Q')
+# A key record is the length of the key, the key, then the offset of its value record
+KEY_LENGTH = struct.Struct('<H')
+VALUE_OFFSET = struct.Struct('<Q')
+# A value record is the length of the value then the value
+VALUE_LENGTH = struct.Struct('<I')
+
+
+class SortedIndex:
+    """Read-only string to string mapping stored in a file built by `write_index`.
+
+    The file is memory-mapped and a lookup is a binary search over the sorted
+    keys, so opening it is instant and only the pages that are read are loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not an index file of version {}'.format(path, VERSION))
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        key = key.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            middle_key, value_offset = self._read_key(middle)
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return self._read_value(value_offset)
+        return default
+
+    def similar(self, key, max_distance):
+        """Return the (distance, key) pairs of the keys within `max_distance` edits of `key`.
+
+        Pairs are sorted by distance then key. The sorted keys are walked like a
+        trie, skipping the prefixes already too far from `key`, so most keys are
+        never read. Distances count UTF-8 bytes rather than characters.
+        """
+        target = key.encode('utf-8')
+        matches = []
+        self._walk_similar(target, b'', 0, self._count, list(range(len(target) + 1)),
+                           max_distance, matches)
+        matches.sort()
+        return [(distance, match.decode('utf-8')) for distance, match in matches]
+
+    def close(self):
+        self._mmap.close()
+
+    def _walk_similar(self, target, prefix, low, high, row, max_distance, matches):
+        # Keys from `low` to `high` all start with `prefix`, and `row` holds the edit
+        # distances between `prefix` and every prefix of `target`
+        depth = len(prefix)
+        if low < high and self._read_key(low)[0] == prefix:
+            if row[-1] <= max_distance:
+                matches.append((row[-1], prefix))
+            low += 1
+
+        while low < high:
+            byte = self._read_key(low)[0][depth]
+            child = prefix + bytes((byte,))
+            end = self._prefix_end(child, low, high)
+            child_row = [row[0] + 1]
+            for i, target_byte in enumerate(target, start=1):
+                child_row.append(min(child_row[i - 1] + 1, row[i] + 1,
+                                     row[i - 1] + (target_byte != byte)))
+            if min(child_row) <= max_distance:
+                self._walk_similar(target, child, low, end, child_row, max_distance, matches)
+            low = end
+
+    def _prefix_end(self, prefix, low, high):
+        """Return the index of the first key from `low` not starting with `prefix`."""
+        length = len(prefix)
+        while low < high:
+            middle = (low + high) // 2
+            if self._read_key(middle)[0][:length] <= prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _read_key(self, i):
+        offset, = ENTRY.unpack_from(self._mmap, HEADER.size + i * ENTRY.size)
+        length, = KEY_LENGTH.unpack_from(self._mmap, offset)
+        start = offset + KEY_LENGTH.size
+        key = self._mmap[start:start + length]
+        value_offset, = VALUE_OFFSET.unpack_from(self._mmap, start + length)
+        return key, value_offset
+
+    def _read_value(self, offset):
+        length, = VALUE_LENGTH.unpack_from(self._mmap, offset)
+        start = offset + VALUE_LENGTH.size
+        return self._mmap[start:start + length].decode('utf-8')
+
+
+def write_index(path, items, aliases=()):
+    """Write the (key, value) pairs of `items` to an index file at `path`.
+
+    `aliases` are (key, target key) pairs; an alias has the value of its target
+    without storing it twice, and is skipped if the target is not in `items`.
+    The first value of a key wins. Values are spooled to a temporary file, so
+    only the keys are kept in memory.
+    """
+    value_offsets = {}
+    with tempfile.TemporaryFile() as values:
+        for key, value in items:
+            key = key.encode('utf-8')
+            if key in value_offsets or len(key) > 0xFFFF:
+                continue
+            value_offsets[key] = values.tell()
+            value = value.encode('utf-8')
+            values.write(VALUE_LENGTH.pack(len(value)))
+            values.write(value)
+
+        for key, target in aliases:
+            key = key.encode('utf-8')
+            target_offset = value_offsets.get(target.encode('utf-8'))
+            if key not in value_offsets and target_offset is not None and len(key) <= 0xFFFF:
+                value_offsets[key] = target_offset
+
+        keys = sorted(value_offsets)
+        keys_start = HEADER.size + len(keys) * ENTRY.size
+        values_start = keys_start + sum(KEY_LENGTH.size + len(key) + VALUE_OFFSET.size
+                                        for key in keys)
+
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+            offset = keys_start
+            for key in keys:
+                f.write(ENTRY.pack(offset))
+                offset += KEY_LENGTH.size + len(key) + VALUE_OFFSET.size
+            for key in keys:
+                f.write(KEY_LENGTH.pack(len(key)))
+                f.write(key)
+                f.write(VALUE_OFFSET.pack(values_start + value_offsets[key]))
+
+            values.seek(0)
+            while True:
+                chunk = values.read(1 << 20)
+                if not chunk:
+                    break
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+    return len(keys)
@@ -1,19 +1,106 @@
-import requests
+from tululbot.utils import http
+from tululbot.utils.cache import MISSING, TTLCache
+from tululbot.utils.stemmer import lemma_candidates
+
+
+KATEGLO_API_URL = 'http://kateglo.com/api.php'
+
+# Fields of a definition, and definitions of a term, in the packed records of `dictionary`
+FIELD_SEPARATOR = '\x1f'
+RECORD_SEPARATOR = '\x1e'
+
+# Definitions by lowercased term, replaced according to the config when the app starts
+cache = TTLCache(max_size=1000, ttl=7 * 24 * 60 * 60)
+# Packed definitions by lowercased term, a `SortedIndex` built by `manage.py import-kbbi`.
+# Terms not in it are not looked up on kateglo.com
+dictionary = None
+# Lemmas of a term without definitions looked up on kateglo.com, each is one more request
+max_lemma_lookups = 2
 
 
 def lookup_kbbi_definition(term):
-    payload = {
-        'format': 'json',
-        'phrase': term
-    }
-    r = requests.get('http://kateglo.com/api.php', params=payload)
+    """Look up `term`, then its lemmas until one has definitions."""
+    key = term.casefold()
+    defs = lookup_term(key)
+    if not defs:
+        for lemma in lemma_lookups(key):
+            defs = lookup_term(lemma)
+            if defs:
+                break
+    return defs
+
+
+def lemma_lookups(key):
+    """Return the lemmas of the term `key` to look up when it has no definitions."""
+    lemmas = lemma_candidates(key)
+    return lemmas if dictionary is not None else lemmas[:max_lemma_lookups]
+
+
+def stemmer_stats():
+    """Return the hits and misses of the memoized lemmas."""
+    return lemma_candidates.cache_info()._asdict()
+
+
+def lookup_term(key):
+    if dictionary is not None:
+        return lookup_dictionary(key)
+
+    defs = cache.get(key)
+    if defs is not MISSING:
+        return defs
+
+    r = http.get(KATEGLO_API_URL, params=kateglo_params(key))
     r.raise_for_status()
     try:
         json_response = r.json()
     except ValueError:
-        return []
+        defs = []
     else:
-        return [to_def(obj) for obj in json_response['kateglo']['definition']]
+        defs = to_defs(json_response)
+    cache.set(key, defs)
+    return defs
+
+
+def lookup_dictionary(key):
+    """Return the definitions of the term `key` in the offline dictionary."""
+    packed_defs = dictionary.get(key)
+    return unpack_defs(packed_defs) if packed_defs is not None else []
+
+
+def pack_defs(defs):
+    """Pack definitions like the ones of `to_defs` into one string.
+
+    >>> defs = [{'class': 'n', 'def_text': 'foo', 'sample': None},
+    ...         {'class': 'v', 'def_text': 'bar', 'sample': 'baz'}]
+    >>> format_defs(unpack_defs(pack_defs(defs))) == format_defs(defs)
+    True
+    """
+    return RECORD_SEPARATOR.join(
+        FIELD_SEPARATOR.join(pack_field(d[name]) for name in ('class', 'def_text', 'sample'))
+        for d in defs)
+
+
+def pack_field(value):
+    return (value or '').replace(FIELD_SEPARATOR, ' ').replace(RECORD_SEPARATOR, ' ')
+
+
+def unpack_defs(packed_defs):
+    defs = []
+    for record in packed_defs.split(RECORD_SEPARATOR):
+        cls, def_text, sample = record.split(FIELD_SEPARATOR)
+        defs.append({'class': cls, 'def_text': def_text, 'sample': sample})
+    return defs
+
+
+def kateglo_params(term):
+    return {
+        'format': 'json',
+        'phrase': term
+    }
+
+
+def to_defs(json_response):
+    return [to_def(obj) for obj in json_response['kateglo']['definition']]
 
 
 def to_def(obj):
@@ -24,6 +111,10 @@ def to_def(obj):
     }
 
 
+def format_defs(defs):
+    return '\n'.join(format_def(i, d) for i, d in enumerate(defs, start=1))
+
+
 def format_def(i, dic):
     return '{}. {}{}\n{}'.format(i, dic['def_text'], format_class(dic['class']),
                                  format_sample(dic['sample']))
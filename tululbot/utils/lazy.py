@@ -0,0 +1,33 @@
+import importlib
+import threading
+import types
+
+
+_import_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that is only imported when one of its attributes is used.
+
+    On first use the attributes of the real module are copied here, so later
+    lookups are as fast as on the real module. Attributes can be patched in
+    tests like on any module, and the patch only affects the importing module.
+    """
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not copied yet
+        with _import_lock:
+            module = importlib.import_module(self.__name__)
+            for key, value in module.__dict__.items():
+                self.__dict__.setdefault(key, value)
+        return getattr(module, name)
+
+
+def lazy_import(name):
+    """Return a `LazyModule` for the module `name`.
+
+    >>> json = lazy_import('json')
+    >>> json.dumps([1])
+    '[1]'
+    """
+    return LazyModule(name)
@@ -1,55 +1,176 @@
+from collections import namedtuple
 from urllib.parse import urlencode
 
-from bs4 import BeautifulSoup
-import requests
+from tululbot.utils import http
+from tululbot.utils.cache import MISSING, TTLCache
+from tululbot.utils.html import StopParsing, StreamingParser
+
+
+WIKIPEDIA_URL = 'https://en.wikipedia.org'
+
+# Results by normalized term, and by URL for the pages of disambiguated terms. Both are
+# replaced according to the config when the app starts
+cache = TTLCache(max_size=1000, ttl=24 * 60 * 60)
+not_found_ttl = 60 * 60
+# First paragraphs by normalized title, a `SortedIndex` built by `manage.py build-leli-index`
+abstracts = None
 
 
 def search_on_wikipedia(term):
-    search_url = 'https://en.wikipedia.org/w/index.php'
+    key = normalize_term(term)
+    result = lookup_abstract(key)
+    if result is not None:
+        return result
+
+    result = cache.get(key)
+    if result is not MISSING:
+        return result
 
-    response = requests.get(search_url, params=dict(search=term))
+    search_url = '{}/w/index.php'.format(WIKIPEDIA_URL)
+
+    response = http.get(search_url, params=dict(search=term))
     response.raise_for_status()
 
-    page = response.text
-    if not has_result(page):
-        return None
+    result, disambiguation_url = parse_search_page(response.text)
+    if disambiguation_url is not None:
+        result = cache.get(disambiguation_url)
+        if result is MISSING:
+            response = http.get(disambiguation_url)
+            response.raise_for_status()
 
-    first_paragraph = parse_first_paragraph(page)
-    if not has_disambiguations(first_paragraph.get_text()):
-        return first_paragraph.get_text()
+            result = parse_disambiguated_page(response.text)
+            cache_result(disambiguation_url, result)
 
-    disambiguation_url = parse_first_disambiguation_link(page)
+    cache_result(key, result)
+    return result
 
-    response = requests.get(disambiguation_url)
-    response.raise_for_status()
 
-    disambiguated_page = response.text
-    return parse_first_paragraph(disambiguated_page).get_text()
+def lookup_abstract(key):
+    """Return the first paragraph of the article titled `key` in the offline index."""
+    return abstracts.get(key) if abstracts is not None else None
 
 
-def parse_first_disambiguation_link(page):
-    def valid_link(tag):
-        return tag.name == 'a' and tag['href'].startswith('/wiki')
+def normalize_term(term):
+    """Return the key of `term` in the cache.
 
-    path = parse_content_text(page).find(valid_link)['href']
-    return 'https://en.wikipedia.org{}'.format(path)
+    >>> normalize_term('  Tulul   Bot ')
+    'tulul bot'
+    >>> normalize_term('Tulul_Bot')
+    'tulul bot'
+    """
+    return ' '.join(term.replace('_', ' ').split()).casefold()
 
 
-def has_disambiguations(paragraph):
-    return 'may refer to:' in paragraph
+def cache_result(key, result):
+    # Terms that are not found are looked up again sooner, maybe somebody wrote an article
+    cache.set(key, result, ttl=not_found_ttl if result is None else None)
 
 
-def has_result(page):
-    return ('Search results' not in page and
-            parse_first_paragraph(page) is not None)
+def parse_search_page(page):
+    """Parse the page of a search on Wikipedia.
 
+    Returns a tuple of the first paragraph and None, or None and the URL of the
+    first meaning if the term is ambiguous. The paragraph is None if nothing
+    is found.
+    """
+    if 'Search results' in page:
+        return None, None
 
-def parse_first_paragraph(page):
-    return parse_content_text(page).find('p')
+    parsed_page = parse_page(page)
+    if parsed_page.first_paragraph is None:
+        return None, None
+    if not has_disambiguations(parsed_page.first_paragraph):
+        return parsed_page.first_paragraph, None
+    if parsed_page.first_wiki_path is None:
+        return None, None
+
+    return None, '{}{}'.format(WIKIPEDIA_URL, parsed_page.first_wiki_path)
+
+
+def parse_disambiguated_page(page):
+    return parse_page(page).first_paragraph
+
+
+def has_disambiguations(paragraph):
+    return 'may refer to:' in paragraph
 
 
-def parse_content_text(page):
-    return BeautifulSoup(page, 'html.parser').find('div', id='mw-content-text')
+ParsedPage = namedtuple('ParsedPage', ['first_paragraph', 'first_wiki_path'])
+
+
+def parse_page(page):
+    """Return the text of the first paragraph and the first ``/wiki`` link of an article.
+
+    Either is None if the article has none.
+    """
+    parser = ContentParser()
+    parser.parse(page)
+    return ParsedPage(parser.first_paragraph, parser.first_wiki_path)
+
+
+class ContentParser(StreamingParser):
+    """Look for the first paragraph and ``/wiki`` link in ``div#mw-content-text``.
+
+    No tree is built, and parsing stops once the paragraph is found and it is
+    not a disambiguation, or once both are found, so the rest of a long article
+    is never even tokenized.
+    """
+
+    def __init__(self):
+        super(ContentParser, self).__init__()
+        self.first_paragraph = None
+        self.first_wiki_path = None
+        self._content_depth = 0  # Number of open divs, counting div#mw-content-text itself
+        self._paragraph_parts = None
+
+    def handle_starttag(self, tag, attrs):
+        if not self._content_depth:
+            if tag == 'div' and ('id', 'mw-content-text') in attrs:
+                self._content_depth = 1
+        elif tag == 'div':
+            self._content_depth += 1
+        elif tag == 'p':
+            if self._paragraph_parts is not None:
+                # Paragraphs do not nest, a new one closes the current one
+                self.end_paragraph()
+                self._stop_if_done()
+            elif self.first_paragraph is None:
+                self._paragraph_parts = []
+        elif tag == 'a' and self.first_wiki_path is None:
+            href = dict(attrs).get('href') or ''
+            if href.startswith('/wiki'):
+                self.first_wiki_path = href
+                self._stop_if_done()
+
+    def handle_endtag(self, tag):
+        if not self._content_depth:
+            return
+        if tag == 'p':
+            self.end_paragraph()
+            self._stop_if_done()
+        elif tag == 'div':
+            self._content_depth -= 1
+            if not self._content_depth:
+                self.end_paragraph()
+                raise StopParsing()
+
+    def handle_data(self, data):
+        if self._paragraph_parts is not None:
+            self._paragraph_parts.append(data)
+
+    def end(self):
+        self.end_paragraph()
+
+    def end_paragraph(self):
+        if self._paragraph_parts is not None:
+            self.first_paragraph = ''.join(self._paragraph_parts)
+            self._paragraph_parts = None
+
+    def _stop_if_done(self):
+        if self.first_paragraph is None:
+            return
+        if self.first_wiki_path is not None or not has_disambiguations(self.first_paragraph):
+            raise StopParsing()
 
 
 def search_on_google(term):
@@ -0,0 +1,46 @@
+"""Build the offline lexicon of `/slang`.
+
+Definitions are read from files with one ``word<TAB>definition`` line each,
+where newlines in the definition are written as ``\\n``, and from the entries
+of the SQLite cache of `/slang`, so the words looked up so far need no more
+lookups once the lexicon is rebuilt.
+"""
+from tululbot.utils.index import write_index
+from tululbot.utils.slang import normalize_word
+
+
+def iter_definitions(f):
+    """Yield the (word, definition) pairs of a file of tab separated lines.
+
+    >>> list(iter_definitions(['gabut\\tGaji buta\\\\nBosan\\n', '# comment\\n']))
+    [('gabut', 'Gaji buta\\nBosan')]
+    """
+    for line in f:
+        if line.startswith('#'):
+            continue
+        word, _, definition = line.rstrip('\n').partition('\t')
+        if word and definition:
+            yield word, definition.replace('\\n', '\n')
+
+
+def iter_cached_definitions(cache):
+    """Yield the (word, definition) pairs of `cache`, an `SQLiteTTLCache` of `/slang`."""
+    for word, definition in cache.items():
+        if definition is not None:
+            yield word, definition
+
+
+def build_lexicon(index_path, paths=(), cache=None):
+    """Write the definitions of the files at `paths`, then of `cache`, to `index_path`.
+
+    The first definition of a word wins. Returns the number of words.
+    """
+    def items():
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                for word, definition in iter_definitions(f):
+                    yield normalize_word(word), definition
+        if cache is not None:
+            yield from iter_cached_definitions(cache)
+
+    return write_index(index_path, items())
@@ -0,0 +1,204 @@
+"""Counters and histograms of this process, rendered in the Prometheus text format.
+
+Every thread records into a shard of its own, so recording takes no lock and
+threads never wait on each other. Shards are only summed when the metrics are
+rendered, e.g. when /metrics is scraped.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from collections import defaultdict
+import threading
+import time
+
+
+# Upper bounds in seconds of the buckets of latency histograms
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Shard:
+    """Samples recorded by one thread, keyed by metric name and label values."""
+
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        # Count of each bucket, then of the +Inf bucket, then the sum of the samples
+        self.histograms = {}
+
+    def merge(self, other):
+        for key, value in list(other.counters.items()):
+            self.counters[key] += value
+        for key, counts in list(other.histograms.items()):
+            merged = self.histograms.get(key)
+            if merged is None:
+                self.histograms[key] = list(counts)
+            else:
+                for i, count in enumerate(counts):
+                    merged[i] += count
+
+
+class Counter:
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def inc(self, *label_values, amount=1):
+        self.registry.shard().counters[self.name, label_values] += amount
+
+
+class Histogram:
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        histograms = self.registry.shard().histograms
+        counts = histograms.get((self.name, label_values))
+        if counts is None:
+            counts = histograms[self.name, label_values] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+
+class Registry:
+    """Metrics declared with `counter` and `histogram`, and samples of collectors.
+
+    A collector is a function called on `render`, returning (name, type, help,
+    samples) tuples where samples are (labels, value) pairs and labels a
+    sequence of (name, value) pairs. It exposes the counts kept elsewhere, e.g.
+    by caches, without recording them twice.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Shards of the live threads, and what the dead ones recorded
+        self._shards = []
+        self._retired = Shard()
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, name, help, labels, buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def shard(self):
+        """Return the shard of the current thread."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def collect(self):
+        """Return a shard of the samples recorded by every thread so far."""
+        total = Shard()
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    # Nothing records into it anymore
+                    self._retired.merge(shard)
+            self._shards = live
+            total.merge(self._retired)
+        # A shard may grow while it is copied, which only misses the samples being recorded
+        for _, shard in live:
+            total.merge(shard)
+        return total
+
+    def render(self):
+        total = self.collect()
+        counters = defaultdict(list)
+        for (name, label_values), value in total.counters.items():
+            counters[name].append((label_values, value))
+        histograms = defaultdict(list)
+        for (name, label_values), counts in total.histograms.items():
+            histograms[name].append((label_values, counts))
+
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            if isinstance(metric, Histogram):
+                lines.append('# TYPE {} histogram'.format(metric.name))
+                for label_values, counts in sorted(histograms[metric.name]):
+                    labels = list(zip(metric.labels, label_values))
+                    lines.extend(histogram_lines(metric.name, labels, metric.buckets, counts))
+            else:
+                lines.append('# TYPE {} counter'.format(metric.name))
+                for label_values, value in sorted(counters[metric.name]):
+                    lines.append(sample_line(metric.name, zip(metric.labels, label_values),
+                                             value))
+
+        for collector in self.collectors:
+            for name, metric_type, help, samples in collector():
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} {}'.format(name, metric_type))
+                lines.extend(sample_line(name, labels, value) for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+def histogram_lines(name, labels, buckets, counts):
+    cumulative = 0
+    for bound, count in zip(buckets + ('+Inf',), counts):
+        cumulative += count
+        yield sample_line('{}_bucket'.format(name), labels + [('le', format_value(bound))],
+                          cumulative)
+    yield sample_line('{}_sum'.format(name), labels, counts[-1])
+    yield sample_line('{}_count'.format(name), labels, cumulative)
+
+
+def sample_line(name, labels, value):
+    """Return the line of a sample in the Prometheus text format.
+
+    >>> sample_line('hits_total', [('cache', 'leli')], 3)
+    'hits_total{cache="leli"} 3'
+    >>> sample_line('up', [], 1.0)
+    'up 1.0'
+    """
+    labels = ','.join('{}="{}"'.format(label, escape_label_value(value))
+                      for label, value in labels)
+    return '{}{} {}'.format(name, '{{{}}}'.format(labels) if labels else '',
+                            format_value(value))
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Metrics of the whole app
+registry = Registry()
@@ -0,0 +1,229 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from requests.exceptions import ConnectionError
+from telebot.apihelper import ApiException
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_REPLY = 0
+PRIORITY_NOTIFICATION = 1
+
+
+class TokenBucket:
+    """Allow `rate` actions per second on average with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic() if now is None else now
+        self.blocked_until = 0
+
+    def take(self, now):
+        """Take a token if there is one and return 0, or return seconds until there is one."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+
+    def is_idle(self, now):
+        return now >= self.blocked_until and (
+            self.tokens + (now - self.updated_at) * self.rate >= self.capacity)
+
+
+class Outbox:
+    """Send Telegram requests from a background thread at a bounded rate.
+
+    Requests are sent in priority order, then in the order they are put. A
+    request is only sent if both the bucket of its chat and the global bucket
+    have a token, so a chat that is being rate limited does not hold back
+    other chats. When Telegram answers with 429, the chat is paused for the
+    `retry_after` seconds it asks for and the request is retried. Requests
+    that failed to connect or got a 5xx are retried with exponential backoff.
+    Retries after a 429 and after those errors all count against `max_retries`.
+    A read timeout is not retried, as Telegram may have sent the message.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, max_retries=3,
+                 retry_interval=1, max_chat_buckets=1000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.max_chat_buckets = max_chat_buckets
+        self.chat_buckets = {}
+
+        self._ready = []
+        self._delayed = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+        self._sent = 0
+        self._failed = 0
+        self._retried = 0
+        self._rate_limited = 0
+
+    def put(self, chat_id, send, args=(), kwargs=None, priority=PRIORITY_NOTIFICATION):
+        """Queue ``send(*args, **kwargs)`` for `chat_id` and return immediately."""
+        request = [priority, next(self._counter), chat_id, send, args, kwargs or {}, 0]
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Outbox is shut down')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='Outbox')
+                self._thread.daemon = True
+                self._thread.start()
+            heapq.heappush(self._ready, request)
+            self._condition.notify()
+
+    def shutdown(self, timeout=None):
+        """Send the queued requests, waiting at most `timeout` seconds."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning('Outbox still has %s requests after shutdown timeout',
+                               self.stats()['queue_depth'])
+
+    def stats(self):
+        with self._condition:
+            return {
+                'queue_depth': len(self._ready) + len(self._delayed),
+                'sent': self._sent,
+                'failed': self._failed,
+                'retried': self._retried,
+                'rate_limited': self._rate_limited,
+            }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                request = self._next_request()
+                if request is None:
+                    return
+            self._send(request)
+
+    def _next_request(self):
+        """Wait for a request that can be sent now; return None when shut down and empty."""
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, request = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, request)
+
+            if self._ready:
+                wait = self.global_bucket.take(now)
+                if wait:
+                    self._condition.wait(wait)
+                    continue
+
+                request = heapq.heappop(self._ready)
+                wait = self._chat_bucket(request[2], now).take(now)
+                if not wait:
+                    return request
+                # Give the global token back, it was not used
+                self.global_bucket.tokens = min(self.global_bucket.capacity,
+                                                self.global_bucket.tokens + 1)
+                heapq.heappush(self._delayed, (now + wait, request))
+                continue
+
+            if self._delayed:
+                self._condition.wait(self._delayed[0][0] - now)
+            elif self._closed:
+                return None
+            else:
+                self._condition.wait()
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.max_chat_buckets:
+                idle_chat_ids = [idle_chat_id for idle_chat_id, idle_bucket
+                                 in self.chat_buckets.items() if idle_bucket.is_idle(now)]
+                for idle_chat_id in idle_chat_ids:
+                    del self.chat_buckets[idle_chat_id]
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst,
+                                                              now=now)
+        return bucket
+
+    def _send(self, request):
+        _, _, chat_id, send, args, kwargs, attempts = request
+        try:
+            send(*args, **kwargs)
+        except ApiException as e:
+            retry_after = get_retry_after(e)
+            if retry_after is None:
+                if is_server_error(e):
+                    self._retry(request)
+                else:
+                    self._fail(request)
+                return
+            if attempts >= self.max_retries:
+                self._fail(request)
+                return
+            with self._condition:
+                self._rate_limited += 1
+                request[-1] = attempts + 1
+                now = time.monotonic()
+                resume_at = now + retry_after
+                self._chat_bucket(chat_id, now).block(resume_at)
+                heapq.heappush(self._delayed, (resume_at, request))
+        except ConnectionError:
+            # Mostly raised before the request is sent. A connection dropped while
+            # waiting for the response is retried too, which may rarely post twice.
+            self._retry(request)
+        except Exception:
+            self._fail(request)
+        else:
+            with self._condition:
+                self._sent += 1
+
+    def _retry(self, request):
+        attempts = request[-1]
+        if attempts >= self.max_retries:
+            self._fail(request)
+            return
+        with self._condition:
+            self._retried += 1
+            request[-1] = attempts + 1
+            retry_at = time.monotonic() + self.retry_interval * 2 ** attempts
+            heapq.heappush(self._delayed, (retry_at, request))
+
+    def _fail(self, request):
+        logger.exception('Cannot send request to chat %s', request[2])
+        with self._condition:
+            self._failed += 1
+
+
+def get_retry_after(api_exception):
+    """Return the seconds Telegram asks us to wait, or None if it is not a 429 error."""
+    result = api_exception.result
+    if getattr(result, 'status_code', None) != 429:
+        return None
+    try:
+        return result.json()['parameters']['retry_after']
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+
+def is_server_error(api_exception):
+    return 500 <= getattr(api_exception.result, 'status_code', 0) < 600
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+
+from requests.exceptions import RequestException
+from telebot.apihelper import ApiException
+
+
+logger = logging.getLogger(__name__)
+
+
+class OffsetFile:
+    """Persist the offset of the next update to fetch in a file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def save(self, offset):
+        # Write then rename so that a crash never leaves a half-written offset behind
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self.path)
+
+
+class UpdatePoller:
+    """Fetch updates with long polling and process each batch concurrently.
+
+    The offset is saved only after a whole batch has been processed, so a
+    restart neither skips nor reprocesses updates (short of a crash in the
+    middle of a batch, whose updates are then processed again).
+    """
+
+    def __init__(self, bot, process_update, offset_file, batch_size=100, timeout=30,
+                 num_workers=4, retry_interval=5, on_error=None):
+        self.bot = bot
+        self.process_update = process_update
+        self.offset_file = offset_file
+        self.offset = None
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.num_workers = num_workers
+        self.retry_interval = retry_interval
+        self.on_error = on_error
+        self.stop_event = threading.Event()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            while not self.stop_event.is_set():
+                try:
+                    self.poll_once(executor)
+                except (ApiException, RequestException):
+                    logger.exception('Cannot fetch updates, retrying in %s seconds',
+                                     self.retry_interval)
+                    self.stop_event.wait(self.retry_interval)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def poll_once(self, executor):
+        """Fetch and process one batch of updates; return the number of updates."""
+        if self.offset is None:
+            self.offset = self.offset_file.load()
+        # pyTelegramBotAPI passes allowed_updates as is, but Telegram wants a JSON array
+        updates = self.bot.get_updates(offset=self.offset or None, limit=self.batch_size,
+                                       timeout=self.timeout,
+                                       allowed_updates=json.dumps(['message']))
+        if not updates:
+            return 0
+
+        futures = [executor.submit(self.process_update, update) for update in updates]
+        for update, future in zip(updates, futures):
+            try:
+                future.result()
+            except Exception:
+                logger.exception('Error while processing update %s', update.update_id)
+                if self.on_error is not None:
+                    try:
+                        self.on_error()
+                    except Exception:
+                        logger.exception('Error handler failed')
+
+        self.offset = max(update.update_id for update in updates) + 1
+        self.offset_file.save(self.offset)
+        logger.debug('Processed %s updates', len(updates))
+        return len(updates)
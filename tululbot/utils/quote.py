@@ -1,32 +1,276 @@
+import json
+import logging
+import os
 import random
+import re
+import threading
+import time
 
-import requests
-import yaml
+from tululbot.utils import http
+from tululbot.utils.lazy import lazy_import
+
+yaml = lazy_import('yaml')
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+# Fields of a quote searched by `QuoteIndex`
+SEARCHED_FIELDS = ('quote', 'author', 'author_bio')
+WORD_RE = re.compile(r'\w+')
+
+
+class QuotesNotLoaded(Exception):
+    """Raised when no quote has been downloaded yet by the background refresher."""
+
+
+class ShuffleBag:
+    """Pick items at random without repeating any until all of them have been picked.
+
+    >>> bag = ShuffleBag(['a', 'b', 'c'])
+    >>> sorted(bag.pick() for _ in range(3))
+    ['a', 'b', 'c']
+    """
+
+    def __init__(self, items):
+        self._items = list(items)
+        self._picked = 0
+        self._lock = threading.Lock()
+
+    def pick(self):
+        # One step of a Fisher-Yates shuffle: the picked items are kept in front
+        with self._lock:
+            if self._picked == len(self._items):
+                self._picked = 0
+            i = random.randrange(self._picked, len(self._items))
+            items = self._items
+            items[self._picked], items[i] = items[i], items[self._picked]
+            self._picked += 1
+            return items[self._picked - 1]
+
+
+def tokenize(text):
+    """Return the words of `text`, case folded.
+
+    >>> tokenize('Tulul itu KEREN, kan?')
+    ['tulul', 'itu', 'keren', 'kan']
+    """
+    return WORD_RE.findall(text.casefold())
+
+
+class QuoteIndex:
+    """Formatted quotes with an inverted index of their words.
+
+    `keywords` maps every word of the searched fields of a quote, and `authors`
+    every word of its author, to the ascending positions of the quotes which
+    have it. A search only reads the positions of the words searched for.
+    """
+
+    def __init__(self, quotes, keywords, authors):
+        self.quotes = quotes
+        self.keywords = keywords
+        self.authors = authors
+
+    @classmethod
+    def build(cls, quotes, format_quote):
+        keywords = {}
+        authors = {}
+        for i, q in enumerate(quotes):
+            words = set()
+            for field in SEARCHED_FIELDS:
+                words.update(tokenize(str(q.get(field) or '')))
+            for word in words:
+                keywords.setdefault(word, []).append(i)
+            for word in set(tokenize(str(q.get('author') or ''))):
+                authors.setdefault(word, []).append(i)
+        return cls([format_quote(q) for q in quotes], keywords, authors)
+
+    def search(self, query):
+        """Return the quotes which have all the words of `query`.
+
+        A query starting with ``@`` only matches the words of the author.
+        """
+        postings = self.keywords
+        if query.startswith('@'):
+            postings = self.authors
+            query = query[1:]
+        words = tokenize(query)
+        if not words:
+            return []
+
+        positions = []
+        for word in words:
+            word_positions = postings.get(word)
+            if word_positions is None:
+                return []
+            positions.append(word_positions)
+        positions.sort(key=len)
+        matches = set(positions[0])
+        for word_positions in positions[1:]:
+            matches.intersection_update(word_positions)
+        return [self.quotes[i] for i in sorted(matches)]
 
 
 class QuoteEngine:
+    """Random quotes of the tulul-quotes repository.
+
+    Once `start_refresher` is called, the quotes are refreshed from a background
+    thread and `retrieve_random` never waits on GitHub. Otherwise they are
+    downloaded on the first `retrieve_random`, like before.
+
+    Quotes are formatted and indexed for `search` once when they are loaded.
+    With a `snapshot_path`, every download is saved there, to be loaded on the
+    next start instead of parsing YAML again.
+    """
 
-    def __init__(self):
+    def __init__(self, snapshot_path=None):
         self.quote_url = 'https://raw.githubusercontent.com/tulul/tulul-quotes/master/quote.yaml'  # noqa
         # Note: rawgit does not have 100% uptime, but at
         # least they're not throttling us.
 
+        self.snapshot_path = snapshot_path
+        # Formatted quotes
         self.cache = []
+        self.bag = None
+        self.index = None
+        self.etag = None
+        # Seconds between background refreshes, None until `start_refresher` is called
+        self.refresh_interval = None
+        self.refreshes = 0
+        self.not_modified = 0
+        self.failures = 0
+        self.last_checked_at = None
+        self._refresher = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
 
     def retrieve_random(self):
-        if not self.cache:
-            self.refresh_cache()
+        self.ensure_loaded()
+        return self.bag.pick()
 
-        return self.format_quote(random.choice(self.cache))
+    def search(self, query):
+        """Return a random quote matching `query`, or None if there is none.
+
+        See `QuoteIndex.search` for the queries.
+        """
+        self.ensure_loaded()
+        matches = self.index.search(query)
+        return random.choice(matches) if matches else None
+
+    def ensure_loaded(self):
+        if self.refresh_interval is None:
+            if not self.cache:
+                self.refresh_cache()
+        else:
+            # The refresher does not survive a fork of the process which started it
+            self.start_refresher(self.refresh_interval)
+            if not self.cache:
+                self._wake.set()
+                raise QuotesNotLoaded()
 
     def format_quote(self, q):
-        return '{q[quote]} - {q[author]}, {q[author_bio]}'.format(q=q)
+        text = '{} - {}'.format(q['quote'], q.get('author') or 'Anonim')
+        if q.get('author_bio'):
+            text = '{}, {}'.format(text, q['author_bio'])
+        return text
 
     def refresh_cache(self):
-        r = requests.get(self.quote_url)
+        """Download the quotes unless they have not changed since the last download.
+
+        Returns whether they changed. On errors the current quotes are kept.
+        """
+        headers = {'If-None-Match': self.etag} if self.etag is not None else None
+        r = http.get(self.quote_url, headers=headers)
+        if r.status_code == 304:
+            with self._lock:
+                self.not_modified += 1
+                self.last_checked_at = time.time()
+            return False
+
         r.raise_for_status()
-        body = r.text
-        # What if previosuly we have the cache, but this time
-        # when we try to get new cache, the network occurs error?
-        # We will think about "don't refresh if error" later.
-        self.cache = yaml.load(body)['quotes']
+        self.load(r.text)
+        with self._lock:
+            self.etag = r.headers.get('ETag')
+            self.refreshes += 1
+            self.last_checked_at = time.time()
+        if self.snapshot_path:
+            self.save_snapshot()
+        return True
+
+    def load(self, body):
+        # The C loader is many times faster, but needs PyYAML built with libyaml
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        quotes = yaml.load(body, Loader=loader)['quotes'] or []
+        valid_quotes = [q for q in quotes if isinstance(q, dict) and q.get('quote')]
+        if len(valid_quotes) < len(quotes):
+            logger.warning('Skipped %s quotes without text in %s',
+                           len(quotes) - len(valid_quotes), self.quote_url)
+        quotes = valid_quotes
+        if not quotes:
+            raise ValueError('No quote in {}'.format(self.quote_url))
+        self.set_index(QuoteIndex.build(quotes, self.format_quote))
+
+    def set_index(self, index):
+        # A non-empty cache means the rest is set too
+        self.bag = ShuffleBag(index.quotes)
+        self.index = index
+        self.cache = index.quotes
+
+    def load_snapshot(self):
+        """Load the quotes and ETag saved at `snapshot_path`, and return whether there were."""
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if snapshot.get('version') != SNAPSHOT_VERSION or not snapshot.get('quotes'):
+            return False
+
+        self.set_index(QuoteIndex(snapshot['quotes'], snapshot['keywords'],
+                                  snapshot['authors']))
+        self.etag = snapshot.get('etag')
+        return True
+
+    def save_snapshot(self):
+        tmp_path = '{}.tmp'.format(self.snapshot_path)
+        index = self.index
+        snapshot = {'version': SNAPSHOT_VERSION, 'etag': self.etag, 'quotes': index.quotes,
+                    'keywords': index.keywords, 'authors': index.authors}
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            logger.warning('Cannot save quotes to %s', self.snapshot_path, exc_info=True)
+
+    def start_refresher(self, interval):
+        """Refresh the quotes now, then every `interval` seconds, from a daemon thread."""
+        with self._lock:
+            self.refresh_interval = interval
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._refresh_forever,
+                                               name='QuoteRefresher', daemon=True)
+            self._refresher.start()
+
+    def _refresh_forever(self):
+        while True:
+            try:
+                self.refresh_cache()
+            except Exception:
+                logger.warning('Cannot refresh quotes from %s', self.quote_url, exc_info=True)
+                with self._lock:
+                    self.failures += 1
+            # A /quote waking us up during the refresh was waiting for this very refresh
+            self._wake.clear()
+            self._wake.wait(self.refresh_interval)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self.cache),
+                'indexed_words': len(self.index.keywords) if self.index is not None else 0,
+                'refreshes': self.refreshes,
+                'not_modified': self.not_modified,
+                'failures': self.failures,
+                'last_checked_at': self.last_checked_at,
+            }
@@ -0,0 +1,99 @@
+from collections import namedtuple
+import re
+
+
+Route = namedtuple('Route', ['priority', 'regexp', 'handler'])
+
+command_name_regexp = re.compile(r'/([^\s@]+)')
+
+
+def extract_command_name(text):
+    """Extract the command name from a text like ``/command@BotUsername args``.
+
+    >>> extract_command_name('/leli@TululBot foo bar')
+    'leli'
+    >>> extract_command_name('foo bar') is None
+    True
+    """
+    match = command_name_regexp.match(text)
+    return match.group(1) if match is not None else None
+
+
+class CommandRouter:
+    """Select the handler of a message in a single pass.
+
+    Commands are looked up by the name in the leading ``/command`` token and
+    force-reply follow-ups by the text of the replied message, so the cost of
+    routing does not grow with the number of commands. When a message matches
+    both a command and a reply, the one registered first wins, just like when
+    handlers are tested one by one in registration order.
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.replies = {}
+        self._count = 0
+
+    def add_command(self, name, handler, regexp=None):
+        if name in self.commands:
+            raise ValueError('Command {!r} is already registered'.format(name))
+        regexp = re.compile(regexp) if regexp is not None else None
+        self.commands[name] = Route(self._next_priority(), regexp, handler)
+
+    def add_reply(self, text, handler):
+        if text in self.replies:
+            raise ValueError('Reply to {!r} is already registered'.format(text))
+        self.replies[text] = Route(self._next_priority(), None, handler)
+
+    def route(self, message, is_reply_to_bot):
+        """Return the handler for `message` or None if there is none.
+
+        `is_reply_to_bot` is only called when the message replies to one of the
+        registered texts.
+        """
+        if message.content_type != 'text' or message.text is None:
+            return None
+
+        selected = None
+
+        name = extract_command_name(message.text)
+        if name is not None:
+            route = self.commands.get(name)
+            if route is not None and (route.regexp is None or
+                                      route.regexp.search(message.text)):
+                selected = route
+
+        replied_message = message.reply_to_message
+        if replied_message is not None:
+            route = self.replies.get(replied_message.text)
+            if (route is not None and
+                    (selected is None or route.priority < selected.priority) and
+                    is_reply_to_bot(message)):
+                selected = route
+
+        return selected.handler if selected is not None else None
+
+    def accepts(self, message_json, bot_user_id):
+        """Return whether a message, still as decoded JSON, may be routed to a handler.
+
+        This is a cheap test to skip building the message of the many updates that
+        mention no command and reply to no prompt. A message accepted here may still
+        not be routed, e.g. when it does not match the regexp of its command. A reply
+        is accepted from anyone if `bot_user_id` is None.
+        """
+        text = message_json.get('text')
+        if not isinstance(text, str):
+            return False
+
+        if text.startswith('/') and extract_command_name(text) in self.commands:
+            return True
+
+        replied_message = message_json.get('reply_to_message')
+        if replied_message is None or replied_message.get('text') not in self.replies:
+            return False
+        replied_user = replied_message.get('from') or {}
+        return bot_user_id is None or replied_user.get('id') == bot_user_id
+
+    def _next_priority(self):
+        self._count += 1
+        return self._count
@@ -1,25 +1,202 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+import json
+import logging
+import re
+import threading
+import time
 from urllib.parse import quote_plus
 
-from requests import HTTPError
+from requests import HTTPError, Timeout
 
-from bs4 import BeautifulSoup
-import requests
-import urbandict as ud
+from tululbot.utils import http
+from tululbot.utils.cache import MISSING, TTLCache
+from tululbot.utils.html import StopParsing, StreamingParser
+
+
+KAMUSSLANG_URL_FORMAT = 'http://kamusslang.com/arti/{}'
+KAMUSSLANG_DEFINITION_CLASS = 'term-def'
+KAMUSSLANG_SUGGESTION_CLASS = 'close-word-suggestion-text'
+URBANDICT_API_URL = 'https://api.urbandictionary.com/v0/define'
+# Start of the response of the define endpoint, up to its first entry
+URBANDICT_LIST_START_RE = re.compile(r'\s*\{\s*"list"\s*:\s*\[\s*')
+URBANDICT_LINK_RE = re.compile(r'\[([^\[\]]*)\]')
+NOT_FOUND_TEXT = 'Gak nemu cuy'
+
+logger = logging.getLogger(__name__)
+json_decoder = json.JSONDecoder()
+
+SOURCES = ('urbandictionary', 'kamusslang')
+
+# Merged definitions by normalized word, replaced according to the config when the app starts
+cache = TTLCache(max_size=1000, ttl=24 * 60 * 60)
+# Seconds to wait for the sources of a lookup, replaced according to the config when the
+# app starts
+deadline = 5
+# Sources that miss the deadline keep a thread until their own HTTP timeout
+executor = ThreadPoolExecutor(max_workers=8)
+# Definitions by normalized word, a `SortedIndex` built by `manage.py build-slang-lexicon`
+lexicon = None
+# Edits from a word not found to the words of the lexicon suggested instead
+suggestion_distance = 2
+suggestion_limit = 3
+
+
+class SourceStats:
+    """Count the lookups of each source and how long they take."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'lookups': 0, 'errors': 0, 'late': 0,
+                                           'total_latency': 0.0, 'max_latency': 0.0})
+
+    def record(self, source, latency, error=False):
+        logger.debug('Looked up %s in %.3fs', source, latency)
+        with self._lock:
+            stats = self._stats[source]
+            stats['lookups'] += 1
+            stats['errors'] += error
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+
+    def record_late(self, source):
+        with self._lock:
+            self._stats[source]['late'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                source: {
+                    'lookups': stats['lookups'],
+                    'errors': stats['errors'],
+                    'late': stats['late'],
+                    'avg_latency': (stats['total_latency'] / stats['lookups']
+                                    if stats['lookups'] else 0.0),
+                    'max_latency': stats['max_latency'],
+                } for source, stats in self._stats.items()
+            }
+
+
+source_stats = SourceStats()
 
 
 def lookup_slang(word):
-    not_found_word = 'Gak nemu cuy'
-    return lookup_slang_sources(word) or not_found_word
+    return lookup_slang_sources(word) or not_found_text(word)
 
 
 def lookup_slang_sources(word):
-    urbandict_def = lookup_urbandictionary(word)
+    """Look up `word` on all sources at once and merge what they answer before the deadline."""
+    key = normalize_word(word)
+    definition = lookup_lexicon(key)
+    if definition is not None:
+        return definition
+
+    definition = cache.get(key)
+    if definition is not MISSING:
+        return definition
+
+    definitions = query_sources([('urbandictionary', lookup_urbandictionary),
+                                 ('kamusslang', lookup_kamusslang_or_none)], word, deadline)
+    return cache_definitions(key, definitions)
+
 
+def normalize_word(word):
+    """Return the key of `word` in the cache.
+
+    >>> normalize_word(' Gabut  Banget ')
+    'gabut banget'
+    """
+    return ' '.join(word.split()).casefold()
+
+
+def lookup_lexicon(key):
+    """Return the definition of the word `key` in the offline lexicon."""
+    return lexicon.get(key) if lexicon is not None else None
+
+
+def not_found_text(word):
+    """Return NOT_FOUND_TEXT, and the words alike in the offline lexicon if any."""
+    suggestions = suggest_words(normalize_word(word))
+    if not suggestions:
+        return NOT_FOUND_TEXT
+    return '{}. Maksud lu {}?'.format(NOT_FOUND_TEXT, ' atau '.join(suggestions))
+
+
+def suggest_words(key):
+    """Return the words of the offline lexicon closest to `key`, closest first."""
+    if lexicon is None:
+        return []
+    # A couple of edits turn most short words into other words
+    max_distance = suggestion_distance if len(key) > 4 else min(suggestion_distance, 1)
+    # Looking further is much slower, so only do it when the closer words are not enough
+    words = []
+    for distance in range(1, max_distance + 1):
+        words = [word for word_distance, word in lexicon.similar(key, distance)
+                 if word_distance]
+        if len(words) >= suggestion_limit:
+            break
+    return words[:suggestion_limit]
+
+
+def cache_definitions(key, definitions):
+    """Merge the definitions by source, and cache them if no source is missing."""
+    definition = merge_definitions(definitions.get('urbandictionary'),
+                                   definitions.get('kamusslang'))
+    # A source that was late or failed may answer the next time
+    if all(source in definitions for source in SOURCES):
+        cache.set(key, definition)
+    return definition
+
+
+def lookup_kamusslang_or_none(word):
     try:
-        kamusslang_def = lookup_kamusslang(word)
+        return lookup_kamusslang(word)
     except HTTPError:
-        kamusslang_def = None
+        return None
+
+
+def query_sources(sources, word, timeout):
+    """Call the (name, lookup) pairs of `sources` with `word` concurrently.
 
+    Returns the results by name of the sources that answered within `timeout`
+    seconds. Sources that fail are left out too, unless none answers: then the
+    first error, or Timeout, is raised.
+    """
+    futures = [(name, executor.submit(timed_lookup, name, lookup, word))
+               for name, lookup in sources]
+    wait([future for _, future in futures], timeout=timeout)
+
+    results = {}
+    errors = []
+    for name, future in futures:
+        if not future.done():
+            source_stats.record_late(name)
+            future.cancel()
+            continue
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors.append(e)
+
+    if not results:
+        if errors:
+            raise errors[0]
+        raise Timeout('No slang source answered in {}s'.format(timeout))
+    return results
+
+
+def timed_lookup(source, lookup, word):
+    start = time.monotonic()
+    try:
+        result = lookup(word)
+    except Exception:
+        source_stats.record(source, time.monotonic() - start, error=True)
+        raise
+    source_stats.record(source, time.monotonic() - start)
+    return result
+
+
+def merge_definitions(urbandict_def, kamusslang_def):
     if urbandict_def is not None and kamusslang_def is not None:
         return (
             '\U000026AB *urbandictionary*:\n{}'
@@ -34,19 +211,76 @@ def lookup_kamusslang(word):
 
     Returns None if no definition found.
     """
-    kamusslang_url_format = 'http://kamusslang.com/arti/{}'
-    url = kamusslang_url_format.format(quote_plus(word))
-    r = requests.get(url)
+    r = http.get(kamusslang_url(word))
     r.raise_for_status()
+    return parse_kamusslang(r.text)
 
-    doc = BeautifulSoup(r.text, 'html.parser')
-    paragraph = doc.find(class_='term-def')
 
-    # Prevent word-alike suggestion
-    if doc.find(class_='close-word-suggestion-text') is not None:
-        return None
+def kamusslang_url(word):
+    return KAMUSSLANG_URL_FORMAT.format(quote_plus(word))
+
+
+def parse_kamusslang(page):
+    """Return the text of the definition on a page of kamusslang.com.
+
+    Returns None if there is none, or if the page suggests words alike instead.
+    """
+    parser = KamusslangParser(may_suggest=KAMUSSLANG_SUGGESTION_CLASS in page)
+    parser.parse(page)
+    return parser.definition if not parser.has_suggestion else None
+
 
-    return ''.join(paragraph.strings) if paragraph is not None else None
+class KamusslangParser(StreamingParser):
+    """Look for the text of the first ``.term-def`` and for a word-alike suggestion.
+
+    No tree is built, and parsing stops at the suggestion, or at the end of the
+    definition if the page cannot have a suggestion.
+    """
+
+    def __init__(self, may_suggest=True):
+        super(KamusslangParser, self).__init__()
+        self.may_suggest = may_suggest
+        self.definition = None
+        self.has_suggestion = False
+        self._definition_tag = None
+        self._definition_depth = 0  # Number of open tags like the one of the definition
+        self._definition_parts = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._definition_parts is not None:
+            if tag == self._definition_tag:
+                self._definition_depth += 1
+            return
+
+        classes = (dict(attrs).get('class') or '').split()
+        if KAMUSSLANG_SUGGESTION_CLASS in classes:
+            self.has_suggestion = True
+            raise StopParsing()
+        if KAMUSSLANG_DEFINITION_CLASS in classes and self.definition is None:
+            self._definition_tag = tag
+            self._definition_depth = 1
+            self._definition_parts = []
+
+    def handle_endtag(self, tag):
+        if self._definition_parts is None or tag != self._definition_tag:
+            return
+        self._definition_depth -= 1
+        if not self._definition_depth:
+            self.end_definition()
+            if not self.may_suggest:
+                raise StopParsing()
+
+    def handle_data(self, data):
+        if self._definition_parts is not None:
+            self._definition_parts.append(data)
+
+    def end(self):
+        self.end_definition()
+
+    def end_definition(self):
+        if self._definition_parts is not None:
+            self.definition = ''.join(self._definition_parts)
+            self._definition_parts = None
 
 
 def lookup_urbandictionary(word):
@@ -54,14 +288,46 @@ def lookup_urbandictionary(word):
 
     Returns None if no definition found.
     """
-    res = ud.define(word)
-    assert res  # res is never empty, even when no definition is found
+    r = http.get(URBANDICT_API_URL, params=dict(term=word))
+    r.raise_for_status()
+    return first_urbandictionary_definition(r.text)
 
-    if urbandictionary_has_definition(res[0]):
-        return res[0]['def']
 
-    return None
+def first_urbandictionary_definition(response_text):
+    """Return the first definition in a response of the define endpoint, or None.
 
+    Only the first entry of the list is decoded, the others are skipped.
 
-def urbandictionary_has_definition(definition):
-    return "There aren't any definition" not in definition['def']
+    >>> first_urbandictionary_definition('{"list": [{"definition": "[Cool]"}, {"defin')
+    'Cool'
+    >>> first_urbandictionary_definition('{"list": []}') is None
+    True
+    >>> first_urbandictionary_definition('<html>Too many requests</html>') is None
+    True
+    """
+    match = URBANDICT_LIST_START_RE.match(response_text)
+    try:
+        if match is not None:
+            if response_text.startswith(']', match.end()):
+                return None
+            entry, _ = json_decoder.raw_decode(response_text, match.end())
+        else:
+            entries = json.loads(response_text).get('list')
+            if not entries:
+                return None
+            entry = entries[0]
+    except ValueError:
+        # E.g. an HTML error page served with 200
+        logger.warning('Cannot decode response of Urban Dictionary: %.100r', response_text)
+        return None
+    return format_urbandictionary_definition(entry.get('definition', '')) or None
+
+
+def format_urbandictionary_definition(definition):
+    """Remove the brackets of links to other words and normalize newlines.
+
+    >>> format_urbandictionary_definition('Like [tulul]\\r\\nbut [cooler]')
+    'Like tulul\\nbut cooler'
+    """
+    definition = URBANDICT_LINK_RE.sub(r'\1', definition)
+    return definition.replace('\r\n', '\n').replace('\r', '\n')
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import threading
+
+
+class LocalConnection:
+    """SQLite connection to `path` of the current thread in the current process.
+
+    SQLite connections cannot be shared between threads, nor used in the child
+    of a fork, e.g. a gunicorn worker forked after the app was preloaded. So
+    every thread of every process opens its own, in WAL mode so that readers
+    do not wait on writers, and runs the `schema` statements on it.
+    """
+
+    def __init__(self, path, schema=()):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def get(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # The connection inherited from the parent is dropped without closing it, which
+            # could release the locks of the parent
+            local.inherited = getattr(local, 'connection', None)
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        for statement in self.schema:
+            conn.execute(statement)
+        return conn
@@ -0,0 +1,122 @@
+"""Guess the lemmas of inflected Indonesian words, like "makan" for "dimakan".
+
+Affixes are stripped by rules in the spirit of the Nazief and Adriani
+stemmer, but without a dictionary at hand every plausible lemma is returned,
+most likely first, for the caller to try in turn.
+"""
+from functools import lru_cache
+
+
+PARTICLES = ('lah', 'kah', 'tah', 'pun')
+POSSESSIVES = ('ku', 'mu', 'nya')
+SUFFIXES = ('kan', 'an', 'i')
+VOWELS = 'aeiou'
+# Shorter lemmas are mostly what is left of overstripped words
+MIN_LEMMA_LENGTH = 3
+
+
+@lru_cache(maxsize=10000)
+def lemma_candidates(word):
+    """Return the plausible lemmas of `word`, most likely first, without `word` itself.
+
+    >>> lemma_candidates('dimakan')[0]
+    'makan'
+    >>> lemma_candidates('makanannya')[:2]
+    ('makanan', 'makan')
+    >>> lemma_candidates('menulis')
+    ('nulis', 'tulis')
+    >>> lemma_candidates('buku')
+    ()
+    """
+    word = word.casefold()
+    bases = strip_inflections(word)
+    stems = [stem for base in bases for stem in strip_suffixes(base)]
+
+    candidates = []
+    # Prefixes are more common than suffixes, and suffixes alone than both
+    for base in bases:
+        candidates.extend(strip_prefixes(base))
+    candidates.extend(bases)
+    candidates.extend(stems)
+    for stem in stems:
+        candidates.extend(strip_prefixes(stem))
+
+    seen = {word}
+    result = []
+    for candidate in candidates:
+        if candidate and candidate not in seen and len(candidate) >= MIN_LEMMA_LENGTH:
+            seen.add(candidate)
+            result.append(candidate)
+    return tuple(result)
+
+
+def strip_inflections(word):
+    """Return `word` without its particle, then without its possessive pronoun too."""
+    bases = [word]
+    for endings in (PARTICLES, POSSESSIVES):
+        stripped = strip_ending(bases[-1], endings)
+        if stripped is not None:
+            bases.append(stripped)
+    return bases[1:] or bases
+
+
+def strip_suffixes(word):
+    """Return the words left after stripping each suffix `word` ends with."""
+    return [word[:-len(suffix)] for suffix in SUFFIXES
+            if word.endswith(suffix) and len(word) - len(suffix) >= MIN_LEMMA_LENGTH]
+
+
+def strip_ending(word, endings):
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_LEMMA_LENGTH:
+            return word[:-len(ending)]
+    return None
+
+
+def strip_prefixes(word):
+    """Return the words left after stripping one, then two derivational prefixes."""
+    once = strip_prefix(word)
+    twice = [stem for stripped in once for stem in strip_prefix(stripped)]
+    return once + twice
+
+
+def strip_prefix(word):
+    """Return the words `word` may be with its first prefix stripped, most likely first."""
+    if word.startswith(('di', 'ke', 'se')):
+        return [word[2:]]
+    if word.startswith(('ter', 'ber', 'per')):
+        if starts_with_vowel(word[3:]):
+            # berambut from rambut, berangkat from angkat
+            return [word[3:], word[2:]]
+        return [word[3:]]
+    if word.startswith(('me', 'pe')):
+        return strip_nasal_prefix(word[2:])
+    if word.startswith(('be', 'te')):
+        return [word[2:]]
+    return []
+
+
+def strip_nasal_prefix(rest):
+    """Undo the assimilation of the initial sound of a lemma after me- or pe-."""
+    if rest.startswith('ny') and starts_with_vowel(rest[2:]):
+        return ['s' + rest[2:]]
+    if rest.startswith('ng'):
+        if starts_with_vowel(rest[2:]):
+            # mengambil from ambil, mengirim from kirim
+            return [rest[2:], 'k' + rest[2:]]
+        return [rest[2:]]
+    if rest.startswith('m'):
+        if starts_with_vowel(rest[1:]):
+            # memakan from makan, memukul from pukul
+            return [rest, 'p' + rest[1:]]
+        return [rest[1:]]
+    if rest.startswith('n'):
+        if starts_with_vowel(rest[1:]):
+            # menanam from tanam, menulis from tulis, menikah from nikah
+            return [rest, 't' + rest[1:]]
+        return [rest[1:]]
+    return [rest]
+
+
+def starts_with_vowel(word):
+    return word != '' and word[0] in VOWELS